@@ -17,13 +17,17 @@ from .lang.pascal import pascal_to_ir
 from .lang.ws import ws_to_ir
 from .lang.python import python_to_ir, ir_to_python
 from .wasm import wasm_to_ir, read_wasm
+from .wasm.intrinsics import supports_intrinsics
 from .irutils import verify_module
 from .utils.reporting import DummyReportGenerator, HtmlReportGenerator
 from .opt.transform import DeleteUnusedInstructionsPass
 from .opt.transform import RemoveAddZeroPass
 from .opt import CommonSubexpressionEliminationPass
+from .opt import GlobalValueNumberingPass
 from .opt import ConstantFolder
 from .opt import LoadAfterStorePass
+from .opt import LoopInvariantCodeMotionPass
+from .opt import StrengthReductionPass
 from .opt import CleanPass
 from .opt.mem2reg import Mem2RegPromotor
 from .opt.cjmp import CJumpPass
@@ -91,9 +95,11 @@ def is_platform_supported():
     return get_current_arch() is not None
 
 
-def construct(buildfile, targets=()):
+def construct(buildfile, targets=(), jobs=1, incremental=False):
     """ Construct the given buildfile.
 
+    Independent targets are built in parallel when jobs is more than one.
+    When incremental is True, outputs which are up to date are not rebuilt.
     Raise task error if something goes wrong.
     """
     # Ensure file:
@@ -111,7 +117,7 @@ def construct(buildfile, targets=()):
     if not project:
         raise TaskError("No project loaded")
 
-    runner = TaskRunner()
+    runner = TaskRunner(jobs=jobs, incremental=incremental)
     runner.run(project, list(targets))
 
 
@@ -212,19 +218,27 @@ def optimize(ir_module, level=0, reporter=None):
     if level == "0":
         return
 
-    # TODO: differentiate between optimization levels!
+    # Number values across blocks and optimize loops at level 2:
+    if level == "2":
+        cse_passes = [
+            GlobalValueNumberingPass(),
+            LoopInvariantCodeMotionPass(),
+            StrengthReductionPass(),
+        ]
+    else:
+        cse_passes = [CommonSubexpressionEliminationPass()]
 
     # Optimization passes (bag of tricks) run them three times:
-    opt_passes = [
-        Mem2RegPromotor(),
-        RemoveAddZeroPass(),
-        ConstantFolder(),
-        CommonSubexpressionEliminationPass(),
-        TailCallOptimization(),
-        LoadAfterStorePass(),
-        DeleteUnusedInstructionsPass(),
-        CleanPass(),
-    ] * 3
+    opt_passes = (
+        [Mem2RegPromotor(), RemoveAddZeroPass(), ConstantFolder()]
+        + cse_passes
+        + [
+            TailCallOptimization(),
+            LoadAfterStorePass(),
+            DeleteUnusedInstructionsPass(),
+            CleanPass(),
+        ]
+    ) * 3
 
     if level == "3":
         opt_passes.append(CJumpPass())
@@ -246,7 +260,13 @@ def optimize(ir_module, level=0, reporter=None):
 
 
 def ir_to_stream(
-    ir_module, march, output_stream, reporter=None, debug=False, opt="speed"
+    ir_module,
+    march,
+    output_stream,
+    reporter=None,
+    debug=False,
+    opt="speed",
+    jobs=1,
 ):
     """ Translate IR module to output stream.
     """
@@ -260,7 +280,7 @@ def ir_to_stream(
 
     # Code generation:
     code_generator.generate(
-        ir_module, output_stream, reporter=reporter, debug=debug
+        ir_module, output_stream, reporter=reporter, debug=debug, jobs=jobs
     )
 
 
@@ -275,7 +295,13 @@ def ir_to_assembly(ir_modules, march, add_binary=False):
 
 
 def ir_to_object(
-    ir_modules, march, reporter=None, debug=False, opt="speed", outstream=None
+    ir_modules,
+    march,
+    reporter=None,
+    debug=False,
+    opt="speed",
+    outstream=None,
+    jobs=1,
 ):
     """ Translate IR-modules into code for the given architecture.
 
@@ -287,6 +313,7 @@ def ir_to_object(
         debug (bool): include debugging information
         opt (str): optimization goal. Can be 'speed', 'size' or 'co2'.
         outstream: instruction stream to write instructions to
+        jobs (int): number of processes generating functions in parallel
 
     Returns:
         ObjectFile: An object file
@@ -321,6 +348,7 @@ def ir_to_object(
             reporter=reporter,
             debug=debug,
             opt=opt,
+            jobs=jobs,
         )
 
     reporter.message("All modules generated!")
@@ -335,6 +363,7 @@ def cc(
     opt_level=0,
     debug=False,
     reporter=None,
+    included_files=None,
 ):
     """ C compiler. compiles a single source file into an object file.
 
@@ -343,6 +372,8 @@ def cc(
         march: The architecture for which to compile
         coptions: options for the C frontend
         debug: Create debug info when set to True
+        included_files: When given, the filenames of the headers which
+            the source includes are appended to this list
 
     Returns:
         an object file
@@ -363,7 +394,13 @@ def cc(
     if not coptions:
         coptions = COptions()
 
-    ir_module = c_to_ir(source, march, coptions=coptions, reporter=reporter)
+    ir_module = c_to_ir(
+        source,
+        march,
+        coptions=coptions,
+        reporter=reporter,
+        included_files=included_files,
+    )
     reporter.message("{} {}".format(ir_module, ir_module.stats()))
     reporter.dump_ir(ir_module)
     optimize(ir_module, level=opt_level, reporter=reporter)
@@ -379,7 +416,10 @@ def wasmcompile(source: io.TextIOBase, march, opt_level=2, reporter=None):
 
     wasm_module = read_wasm(source)
     ir_module = wasm_to_ir(
-        wasm_module, march.info.get_type_info("ptr"), reporter=reporter
+        wasm_module,
+        march.info.get_type_info("ptr"),
+        reporter=reporter,
+        intrinsics=supports_intrinsics(march),
     )
 
     # Optimize:
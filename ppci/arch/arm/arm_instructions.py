@@ -5,7 +5,7 @@
 from .isa import arm_isa, ArmToken, ArmImmToken, Isa
 from ..encoding import Instruction, Constructor, Syntax, Operand, Transform
 from ..generic_instructions import RegisterUseDef, Global
-from ...utils.bitfun import encode_imm32
+from ...utils.bitfun import decode_imm32, encode_imm32
 from ...utils.tree import Tree
 from .registers import ArmRegister, Coreg, Coproc, RegisterSet, R11
 from .registers import R0, R1, R2
@@ -97,6 +97,9 @@ class ArmExpand(Transform):
     def forwards(self, value):
         return encode_imm32(value)
 
+    def backwards(self, value):
+        return decode_imm32(value)
+
 
 class Mov1(ArmInstruction):
     """ Mov Rd, imm16 """
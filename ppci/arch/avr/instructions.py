@@ -351,6 +351,9 @@ class PatchDiv2(Transform):
         assert value in range(0, 32, 2)
         return value >> 1
 
+    def backwards(self, value):
+        return value << 1
+
 
 class Movw(AvrInstruction):
     tokens = [AvrToken]
@@ -505,6 +508,9 @@ class PatchedBy16(Transform):
     def forwards(self, value):
         return value - 16
 
+    def backwards(self, value):
+        return value + 16
+
 
 def make_i(mnemonic, opcode, read=False, write=False):
     tokens = [AvrToken4]
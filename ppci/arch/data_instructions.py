@@ -11,6 +11,7 @@ dd 2 -> 02000000
 from .isa import Isa
 from .encoding import Instruction, Operand, Syntax, Relocation
 from .token import Token, bit_range, u32
+from ..utils.bitfun import wrap_negative
 
 data_isa = Isa()
 
@@ -129,6 +130,30 @@ class Dcd2(DataInstruction):
         return [U32DataRelocation(self.v)]
 
 
+@data_isa.register_relocation
+class Rel32DataRelocation(Relocation):
+    """ Offset from the relocation to the symbol """
+
+    name = "rel32data"
+    token = DwordToken
+    field = "value"
+
+    def calc(self, sym_value, reloc_value):
+        return wrap_negative(sym_value - reloc_value, 32)
+
+
+class Dcdrel(DataInstruction):
+    """ Offset from this word to a label, as used in jump tables """
+
+    v = Operand("v", str)
+    tokens = [DwordToken]
+    syntax = Syntax(["dcd", " ", "=", v, " ", "-", " ", "."])
+    patterns = {"value": 0}
+
+    def relocations(self):
+        return [Rel32DataRelocation(self.v)]
+
+
 class Dq(DataInstruction):
     v = Operand("v", int)
     tokens = [QwordToken]
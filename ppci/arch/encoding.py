@@ -2,8 +2,9 @@
 
 
 import abc
+from .arch_info import Endianness
 from .registers import Register
-from .token import TokenSequence
+from .token import Token, TokenSequence, _p2
 
 
 class Operand(property):
@@ -423,10 +424,13 @@ class Instruction(Constructor, metaclass=InsMeta):
 
         returns bytes for this instruction.
         """
-
-        tokens = self.get_tokens()
-        self.set_all_patterns(tokens)
-        return tokens.encode()
+        encoder, parts = get_encoder(self)
+        data = encoder.encode(parts)
+        if data is None:
+            tokens = self.get_tokens()
+            self.set_all_patterns(tokens)
+            data = tokens.encode()
+        return data
 
     @classmethod
     def decode(cls, data):
@@ -447,9 +451,9 @@ class Instruction(Constructor, metaclass=InsMeta):
     def relocations(self):
         """ Determine the total set of relocations for this instruction """
         relocs = []
-        positions = self.get_positions()
-        for nl, offset in positions.items():
-            for reloc in nl.gen_relocations():
+        encoder, parts = get_encoder(self)
+        for index, offset in encoder.relocation_offsets:
+            for reloc in parts[index].gen_relocations():
                 relocs.append(reloc.shifted(offset))
         return relocs
 
@@ -457,6 +461,201 @@ class Instruction(Constructor, metaclass=InsMeta):
         return []
 
 
+_encoders = {}
+
+
+def get_encoder(instruction):
+    """ Get the encoder for the structure of the given instruction.
+
+    Returns the encoder and the parts of the instruction, in the order of
+    the non_leaves property.
+    """
+    encoder = _encoders.get(type(instruction))
+    if encoder:
+        return encoder, (instruction,)
+
+    parts = tuple(instruction.non_leaves)
+    key = tuple(type(part) for part in parts)
+    encoder = _encoders.get(key)
+    if encoder is None:
+        encoder = Encoder(key)
+        _encoders[key] = encoder
+        if len(parts) == 1:
+            # Instructions without constructor operands:
+            _encoders[type(instruction)] = encoder
+    return encoder, parts
+
+
+class Encoder:
+    """ Encoder for instructions consisting of parts of the given classes.
+
+    The fixed patterns of the parts are applied once, into a template. To
+    encode an instruction, only the values of the variable patterns are
+    placed into this template. This gives the same result as setting all
+    patterns into tokens, which is done for instructions which cannot be
+    encoded in this way, for example because they have custom patterns.
+    """
+
+    def __init__(self, classes):
+        self.classes = classes
+        self.fields = None
+        self.template = 0
+        self.size = 0
+        self.byteorder = None
+
+        # The positions of the parts which can have relocations:
+        self.relocation_offsets = []
+        offset = 0
+        for index, cls in enumerate(classes):
+            if cls.gen_relocations is not Constructor.gen_relocations:
+                self.relocation_offsets.append((index, offset))
+            tokens = getattr(cls, "tokens", ())
+            offset += sum(t.Info.size for t in tokens) // 8
+
+        if self.is_supported():
+            self.compile()
+
+    def is_supported(self):
+        """ Check if the classes only use patterns which can be compiled """
+        instruction_class = self.classes[0]
+        if (
+            instruction_class.get_tokens is not Instruction.get_tokens
+            or instruction_class.set_all_patterns
+            is not Instruction.set_all_patterns
+        ):
+            return False
+
+        for cls in self.classes:
+            if (
+                cls.set_patterns is not Constructor.set_patterns
+                or cls.set_user_patterns is not Constructor.set_user_patterns
+            ):
+                return False
+
+            for token_class in getattr(cls, "tokens", ()):
+                if (
+                    token_class.encode is not Token.encode
+                    or token_class.pack.__func__ is not Token.pack.__func__
+                    or token_class.__setitem__ is not Token.__setitem__
+                ):
+                    return False
+        return True
+
+    def compile(self):
+        """ Create the template and the operations for the fields """
+        precodes = []
+        tokens = []
+        for cls in self.classes:
+            for token_class in getattr(cls, "tokens", ()):
+                token = token_class()
+                if token.Info.precode:
+                    precodes.append(token)
+                else:
+                    tokens.append(token)
+        tokens = TokenSequence(precodes + tokens)
+        if not tokens.tokens:
+            return
+
+        # Determine the bit offset of each token in the encoded data, the
+        # byte order of single byte tokens does not matter:
+        byteorders = set(
+            t.Info.endianness for t in tokens.tokens if t.Info.size > 8
+        )
+        if len(byteorders) > 1:
+            return
+        if Endianness.BIG in byteorders:
+            self.byteorder = "big"
+        else:
+            self.byteorder = "little"
+        self.size = sum(t.Info.size for t in tokens.tokens) // 8
+        token_offsets = {}
+        offset = 0
+        for token in tokens.tokens:
+            token_size = token.Info.size
+            if self.byteorder == "little":
+                token_offsets[token] = offset
+            else:
+                token_offsets[token] = self.size * 8 - offset - token_size
+            offset += token_size
+
+        fields = []
+        variable_bits = 0
+        for index, cls in enumerate(self.classes):
+            for pattern in cls.dict_to_patterns(cls.patterns):
+                token = first_token_with_field(tokens, pattern.field)
+                if token is None:
+                    return
+                field = getattr(type(token), pattern.field)
+                if not isinstance(field, _p2):
+                    return
+
+                pieces = []
+                bits = 0
+                for start, size, shift in field._pieces:
+                    position = token_offsets[token] + start
+                    mask = (1 << size) - 1
+                    pieces.append((position, mask, shift))
+                    bits |= mask << position
+
+                # Later patterns may not overwrite variable patterns:
+                if bits & variable_bits:
+                    return
+
+                if isinstance(pattern, FixedPattern):
+                    try:
+                        tokens.set_field(pattern.field, pattern.value)
+                    except (AssertionError, ValueError):
+                        return
+                else:
+                    variable_bits |= bits
+                    # Only single bit ranges check the range of the value:
+                    checked = len(field._pieces) == 1
+                    fields.append(
+                        (index, pattern.prop, checked, ~bits, tuple(pieces))
+                    )
+
+        for token in tokens.tokens:
+            self.template |= token.bit_value << token_offsets[token]
+        self.fields = fields
+
+    def encode(self, parts):
+        """ Encode an instruction with the given parts.
+
+        Returns None when the instruction cannot be encoded by this encoder,
+        also when this is due to an invalid value. The generic encoding
+        will then report the error.
+        """
+        if self.fields is None:
+            return None
+
+        bits = self.template
+        try:
+            for index, prop, checked, clear, pieces in self.fields:
+                value = prop.get_value(parts[index])
+                if checked:
+                    ((position, mask, _),) = pieces
+                    if value < 0:
+                        value += mask + 1
+                    if value < 0 or value > mask:
+                        return None
+                    bits = (bits & clear) | (value << position)
+                else:
+                    bits &= clear
+                    for position, mask, shift in pieces:
+                        bits |= ((value >> shift) & mask) << position
+        except TypeError:
+            return None
+        return bits.to_bytes(self.size, self.byteorder)
+
+
+def first_token_with_field(tokens, field):
+    """ Get the first token which has the given field, like set_field """
+    for token in tokens.tokens:
+        if hasattr(token, field):
+            return token
+    return None
+
+
 class Syntax:
     """ Defines a syntax for an instruction or part of an instruction.
 
@@ -3,11 +3,11 @@
 # pylint: disable=no-member,invalid-name
 from ..isa import Isa
 from ..encoding import Instruction, Syntax, Operand
-from ..data_instructions import Dd
+from ..data_instructions import Dd, Dcdrel
 from ...utils.bitfun import inrange
 from ..generic_instructions import ArtificialInstruction, Alignment
 from ..generic_instructions import SectionInstruction
-from ..generic_instructions import RegisterUseDef, Global
+from ..generic_instructions import RegisterUseDef, Global, Label
 from .registers import (
     RiscvRegister,
     RiscvFRegister,
@@ -231,8 +231,7 @@ class IBase(RiscvInstruction):
         tokens[0][7:12] = self.rd.num
         tokens[0][12:15] = self.func
         tokens[0][15:20] = self.rs1.num
-        self.offset = self.offset & 0xFFF
-        tokens[0][20:32] = self.offset
+        tokens[0][20:32] = self.offset & 0xFFF
         return tokens[0].encode()
 
 
@@ -699,6 +698,16 @@ def pattern_jmp(context, tree):
     context.emit(B(tgt.name, jumps=[tgt]))
 
 
+@isa.pattern("stm", "JMPI(reg)", size=4)
+def pattern_jmpi(context, tree, c0):
+    table_name, labels = tree.value
+    context.emit(Blr(R0, c0, 0, jumps=labels))
+    context.emit(Align(4))
+    context.emit(Label(table_name))
+    for label in labels:
+        context.emit(Dcdrel(label.name))
+
+
 @isa.pattern("stm", "MOVB(reg, reg)", size=40)
 def pattern_movb(context, tree, c0, c1):
     # Emit memcpy
@@ -129,6 +129,20 @@ class Fcvtswu(RiscvInstruction):
     }
 
 
+class FSqrt(RiscvInstruction):
+    rd = Operand("rd", RiscvFRegister, write=True)
+    rm = Operand("rm", RiscvFRegister, read=True)
+    syntax = Syntax(["fsqrt", ".", "s", " ", rd, ",", " ", rm])
+    patterns = {
+        "opcode": 0b1010011,
+        "rd": rd,
+        "funct3": 0b111,
+        "rs1": rm,
+        "rs2": 0,
+        "funct7": 0b0101100,
+    }
+
+
 class Fcvtws(RiscvInstruction):
     rd = Operand("rd", RiscvRegister, write=True)
     rm = Operand("rm", RiscvFRegister, read=True)
@@ -288,6 +302,14 @@ def pattern_neg_f32(context, tree, c0):
     return d
 
 
+@rvfisa.pattern("freg", "SQRTF64(freg)", size=5)
+@rvfisa.pattern("freg", "SQRTF32(freg)", size=5)
+def pattern_sqrt(context, tree, c0):
+    d = context.new_reg(RiscvFRegister)
+    context.emit(FSqrt(d, c0))
+    return d
+
+
 @rvfisa.pattern("stm", "MOVF32(freg)", size=5)
 @rvfisa.pattern("stm", "MOVF64(freg)", size=5)
 def pattern_mov32(context, tree, c0):
@@ -122,10 +122,6 @@ class Frame:
             self.is_used(a) for a in register.aliases
         )
 
-    def live_ranges(self, vreg):
-        """ Determine the live range of some register """
-        return self.cfg._live_ranges[vreg]
-
     def new_reg(self, cls, twain=""):
         """ Retrieve a new virtual register """
         tmp_name = self.temps.__next__() + twain
@@ -28,12 +28,15 @@ def u8(x):
 
 
 class _p2(property):
-    def __init__(self, getter, setter, bitsize, signed):
+    def __init__(self, getter, setter, bitsize, signed, pieces):
         if bitsize < 1:
             raise TypeError("Cannot create field with less than 1 bit")
         self._bitsize = bitsize
         self._signed = signed
         self._mask = (1 << bitsize) - 1
+        # The bits of the field, as tuples of the bit position in the token,
+        # the amount of bits and the position in the value:
+        self._pieces = pieces
         super().__init__(getter, setter)
 
     def __add__(self, other):
@@ -49,7 +52,7 @@ def bit_range(b, e, signed=False):
     def setter(s, v):
         s[b:e] = v
 
-    return _p2(getter, setter, e - b, signed)
+    return _p2(getter, setter, e - b, signed, ((b, e - b, 0),))
 
 
 def bit(b):
@@ -74,7 +77,13 @@ def bit_concat(*partials):
 
     bitsize = sum(at._bitsize for at in partials)
     signed = partials[0]._signed
-    return _p2(getter, setter, bitsize, signed)
+    pieces = []
+    shift = 0
+    for at in reversed(partials):
+        for start, size, piece_shift in at._pieces:
+            pieces.append((start, size, shift + piece_shift))
+        shift += at._bitsize
+    return _p2(getter, setter, bitsize, signed, tuple(pieces))
 
 
 class TokenMeta(type):
@@ -5,6 +5,7 @@ See for a reference: http://ref.x86asm.net/coder64.html
 
 from ..generic_instructions import Label, RegisterUseDef
 from ..isa import Isa
+from ..data_instructions import Dcdrel
 from ..encoding import Instruction, Operand, Syntax, Constructor, Relocation
 from .. import effects
 from ...utils.bitfun import wrap_negative
@@ -1340,6 +1341,15 @@ def pattern_jmp(context, tree):
     context.emit(NearJump(tgt.name, jumps=[tgt]))
 
 
+@isa.pattern("stm", "JMPI(reg64)", size=3)
+def pattern_jmpi(context, tree, c0):
+    table_name, labels = tree.value
+    context.emit(Jmp(RmReg64(c0), jumps=labels))
+    context.emit(Label(table_name))
+    for label in labels:
+        context.emit(Dcdrel(label.name))
+
+
 jump_opnames = {"<": Jl, ">": Jg, "==": Je, "!=": Jne, ">=": Jge, "<=": Jle}
 
 unsigned_jump_opnames = {
@@ -255,6 +255,24 @@ class Divsd(Sse2Instruction):
     syntax = Syntax(["divsd", " ", r, ",", " ", rm])
 
 
+class Sqrtss(Sse1Instruction):
+    """ Square root of scalar single-fp value """
+
+    r = Operand("r", XmmRegisterSingle, write=True)
+    rm = Operand("rm", xmm_single_rm_modes, read=True)
+    patterns = {"prefix": 0xF3, "opcode": 0x51}
+    syntax = Syntax(["sqrtss", " ", r, ",", " ", rm])
+
+
+class Sqrtsd(Sse2Instruction):
+    """ Square root of scalar double-fp value """
+
+    r = Operand("r", XmmRegisterDouble, write=True)
+    rm = Operand("rm", xmm_double_rm_modes, read=True)
+    patterns = {"prefix": 0xF2, "opcode": 0x51}
+    syntax = Syntax(["sqrtsd", " ", r, ",", " ", rm])
+
+
 class Cvtss2si(Sse1Instruction):
     """ Convert scalar single-fp to integer """
 
@@ -692,6 +710,20 @@ def pattern_div_f64(context, tree, c0, c1):
     return dst
 
 
+@sse1_isa.pattern("regfp32", "SQRTF32(regfp32)", size=4, cycles=4, energy=3)
+def pattern_sqrt_f32(context, tree, c0):
+    dst = context.new_reg(XmmRegisterSingle)
+    context.emit(Sqrtss(dst, RmXmmRegSingle(c0)))
+    return dst
+
+
+@sse2_isa.pattern("regfp64", "SQRTF64(regfp64)", size=4, cycles=6, energy=4)
+def pattern_sqrt_f64(context, tree, c0):
+    dst = context.new_reg(XmmRegisterDouble)
+    context.emit(Sqrtsd(dst, RmXmmRegDouble(c0)))
+    return dst
+
+
 @sse1_isa.pattern("stm", "MOVF32(regfp32)", size=3, cycles=2, energy=2)
 def pattern_mov_f32(context, tree, c0):
     context.move(tree.value, c0)
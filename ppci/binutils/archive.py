@@ -3,7 +3,9 @@
 
 import json
 import logging
+from ..common import get_file
 from . import objectfile
+from . import binaryobject
 
 
 def archive(objs):
@@ -16,37 +18,93 @@ def get_archive(filename):
     if isinstance(filename, Archive):
         return filename
 
-    return Archive.load(filename)
+    f = get_file(filename, "rb")
+    lib = Archive.load(f)
+    f.close()
+    return lib
+
+
+def make_symbol_index(objs):
+    """ Create a mapping from symbol name to the index of the defining object
+
+    Only globally defined symbols are indexed. When a symbol is defined
+    in multiple objects, the first object is used.
+    """
+    symbol_index = {}
+    for index, obj in enumerate(objs):
+        for name in obj.get_defined_symbols():
+            symbol_index.setdefault(name, index)
+    return symbol_index
 
 
 class Archive:
     """ The archive. Holder of object files. Similar to GNU ar.
+
+    The archive contains a symbol index, such that the object defining
+    a symbol can be found quickly. The symbol index is stored in the
+    archive file, like the armap of GNU ar.
     """
 
     logger = logging.getLogger("ar")
 
-    def __init__(self, objs):
+    def __init__(self, objs, symbol_index=None):
         self.objs = objs
+        self._symbol_index = symbol_index
 
     def __iter__(self):
         return iter(self.objs)
 
-    def save(self, output_file):
-        """ Save archive to file. """
+    @property
+    def symbol_index(self):
+        """ Mapping from defined symbol name to object index """
+        if self._symbol_index is None:
+            self._symbol_index = make_symbol_index(self.objs)
+        return self._symbol_index
+
+    def find_symbol(self, name):
+        """ Get the object defining the given symbol, or None """
+        index = self.symbol_index.get(name)
+        if index is not None:
+            return self.objs[index]
+
+    def save(self, output_file, fmt="json"):
+        """ Save archive to file.
+
+        Args:
+            output_file: the file to write to. For the binary format, this
+                must be a file opened in binary mode.
+            fmt: the format to use, either 'json' or 'binary'.
+        """
         self.logger.debug("Saving archive")
-        # Create funky json.
-        objs = [obj.serialize() for obj in self.objs]
+        if fmt == "json":
+            # Create funky json.
+            objs = [obj.serialize() for obj in self.objs]
 
-        d = {"objects": objs}
+            d = {"objects": objs, "symbols": self.symbol_index}
 
-        # Save to file:
-        json.dump(d, output_file, indent=2, sort_keys=True)
-        print(file=output_file)
+            # Save to file:
+            json.dump(d, output_file, indent=2, sort_keys=True)
+            print(file=output_file)
+        elif fmt == "binary":
+            output_file.write(
+                binaryobject.serialize_archive(self.objs, self.symbol_index)
+            )
+        else:
+            raise ValueError("Unknown archive format {}".format(fmt))
 
     @classmethod
     def load(cls, f):
-        """ Load archive from disk. """
+        """ Load archive from disk. The format is detected automatically.
+
+        When the archive file has no symbol index, it is created when
+        required.
+        """
         cls.logger.debug("Loading archive")
-        d = json.load(f)
-        objs = list(map(objectfile.deserialize, d["objects"]))
-        return cls(objs)
+        with binaryobject.map_file(f) as data:
+            if binaryobject.is_binary_archive(data):
+                objs, symbol_index = binaryobject.deserialize_archive(data)
+            else:
+                d = json.loads(data[:])
+                objs = list(map(objectfile.deserialize, d["objects"]))
+                symbol_index = d.get("symbols")
+        return cls(objs, symbol_index=symbol_index)
@@ -7,12 +7,13 @@
 import re
 from ..lang.tools.grammar import Grammar
 from ..lang.tools.earley import EarleyParser
+from ..lang.tools.topdown import TopDownParser, UnsupportedGrammar
 from ..lang.tools.baselex import BaseLexer, EPS, EOF
 from ..common import make_num
 from ..arch.generic_instructions import Label, Alignment, SectionInstruction
 from ..arch.generic_instructions import DebugData, Global
 from ..arch.encoding import Operand, Syntax, Register
-from ..common import CompilerError, SourceLocation
+from ..common import CompilerError, ParseError, SourceLocation
 from .debuginfo import DebugLocation, DebugDb
 
 id_regex = r"[A-Za-z_][A-Za-z\d_]*"
@@ -58,9 +59,18 @@ class AsmLexer(BaseLexer):
 
 
 class AsmParser:
-    """ Base parser for assembler language """
+    """ Base parser for assembler language.
+
+    Lines are parsed with a top down parser, which only tries the rules
+    starting with the mnemonic of the line. The earley parser is used when
+    the top down parser cannot handle some rule, or when a line cannot be
+    parsed, to report the error.
+    """
 
     def __init__(self):
+        self.parser = None
+        self.fallback = None
+        self.size = 0
         # Construct a parser given a grammar:
         terminals = ["ID", "NUMBER", EPS, "COMMENT", EOF] + Syntax.GLYPHS
         self.g = Grammar()
@@ -92,9 +102,18 @@ class AsmParser:
 
     def parse(self, lexer):
         """ Entry function to parser """
-        if not hasattr(self, "p"):
-            self.p = EarleyParser(self.g)
-        self.p.parse(lexer)
+        # Create parsers, and create them again when rules were added:
+        if self.parser is None or self.size != len(self.g.productions):
+            self.parser = TopDownParser(self.g)
+            self.fallback = EarleyParser(self.g)
+            self.size = len(self.g.productions)
+
+        tokens = list(lexer.tokens)
+        try:
+            self.parser.parse(tokens)
+        except (ParseError, UnsupportedGrammar):
+            lexer.tokens = iter(tokens)
+            self.fallback.parse(lexer)
 
 
 class BaseAssembler:
@@ -0,0 +1,386 @@
+""" Compact binary format for object files and archives.
+
+The json format of object files is easy to inspect, but it is large and
+slow to load. This module implements a binary alternative:
+
+- a file starts with a magic and a format version.
+- all names are stored once in a string table.
+- sections, symbols, relocations and images are stored in tables of
+  fixed size records.
+- section contents are stored as raw bytes.
+- debug information is optional, and stored as compressed json.
+
+All values are little endian. Files are decoded with ``unpack_from``
+directly from the file contents, which can be a memory mapped file.
+
+An archive consists of a table with the offset and size of each object,
+an optional symbol index, and the binary objects. The symbol index maps
+symbol names to the index of the object defining the symbol.
+"""
+
+import contextlib
+import io
+import json
+import mmap
+import struct
+import zlib
+from . import debuginfo
+from . import objectfile
+
+
+OBJECT_MAGIC = b"PPCIOBJ\x00"
+ARCHIVE_MAGIC = b"PPCIARC\x00"
+VERSION = 1
+
+# Object flags:
+FLAG_DEBUG = 1
+FLAG_ENTRY = 2
+
+# Archive flags:
+FLAG_SYMBOL_INDEX = 1
+
+# magic, version, flags, arch, entry symbol id, number of strings, size of
+# strings, number of sections, symbols, relocations, images and image
+# sections, size of section data, size of debug info:
+object_header = struct.Struct("<8sHHIiIIIIIIIQI")
+archive_header = struct.Struct("<8sHHI")
+archive_entry = struct.Struct("<QQ")
+symbol_index_header = struct.Struct("<II")
+string_length = struct.Struct("<I")
+section_record = struct.Struct("<IQIQ")
+symbol_record = struct.Struct("<iIIBqi")
+relocation_record = struct.Struct("<IiIQq")
+image_record = struct.Struct("<IQI")
+image_section_record = struct.Struct("<I")
+
+
+def is_binary_object(data):
+    """ Check if the given data starts with a binary object file """
+    return data[: len(OBJECT_MAGIC)] == OBJECT_MAGIC
+
+
+def is_binary_archive(data):
+    """ Check if the given data starts with a binary archive """
+    return data[: len(ARCHIVE_MAGIC)] == ARCHIVE_MAGIC
+
+
+@contextlib.contextmanager
+def map_file(f):
+    """ Get the contents of a file.
+
+    When possible, the file is memory mapped instead of read. The contents
+    of a text file are returned as a string.
+    """
+    if isinstance(f, io.TextIOBase):
+        yield f.read()
+        return
+
+    try:
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):
+        # Not a real file, or an empty file
+        yield f.read()
+        return
+
+    try:
+        yield m
+    finally:
+        m.close()
+
+
+class StringTable:
+    """ Collect unique strings, and assign indici to them """
+
+    def __init__(self):
+        self.strings = []
+        self.index_map = {}
+
+    def __len__(self):
+        return len(self.strings)
+
+    def add(self, string):
+        if string not in self.index_map:
+            self.index_map[string] = len(self.strings)
+            self.strings.append(string)
+        return self.index_map[string]
+
+    def serialize(self):
+        """ Get the lengths and the contents of the strings """
+        encoded = [s.encode("utf8") for s in self.strings]
+        lengths = b"".join(string_length.pack(len(e)) for e in encoded)
+        return lengths, b"".join(encoded)
+
+
+def serialize_object(obj):
+    """ Create binary data for the given object file """
+    strings = StringTable()
+    flags = 0
+    tables = []
+
+    section_index = {}
+    for index, section in enumerate(obj.sections):
+        section_index[section.name] = index
+        tables.append(
+            section_record.pack(
+                strings.add(section.name),
+                section.address,
+                section.alignment,
+                section.size,
+            )
+        )
+
+    for symbol in obj.symbols:
+        if symbol.undefined:
+            defined, value = 0, 0
+        else:
+            defined, value = 1, symbol.value
+        if symbol.section is None:
+            section = -1
+        else:
+            section = strings.add(symbol.section)
+        tables.append(
+            symbol_record.pack(
+                symbol.id,
+                strings.add(symbol.name),
+                strings.add(symbol.binding),
+                defined,
+                value,
+                section,
+            )
+        )
+
+    for reloc in obj.relocations:
+        tables.append(
+            relocation_record.pack(
+                strings.add(reloc.reloc_type),
+                reloc.symbol_id,
+                strings.add(reloc.section),
+                reloc.offset,
+                reloc.addend,
+            )
+        )
+
+    image_sections = []
+    for image in obj.images:
+        tables.append(
+            image_record.pack(
+                strings.add(image.name), image.address, len(image.sections)
+            )
+        )
+        for section in image.sections:
+            image_sections.append(
+                image_section_record.pack(section_index[section.name])
+            )
+    tables.extend(image_sections)
+
+    section_data = b"".join(bytes(section.data) for section in obj.sections)
+
+    if obj.debug_info:
+        flags |= FLAG_DEBUG
+        debug_data = zlib.compress(
+            json.dumps(debuginfo.serialize(obj.debug_info)).encode("utf8")
+        )
+    else:
+        debug_data = b""
+
+    if obj.entry_symbol_id is None:
+        entry_symbol_id = -1
+    else:
+        flags |= FLAG_ENTRY
+        entry_symbol_id = obj.entry_symbol_id
+
+    arch = strings.add(obj.arch.make_id_str())
+    string_lengths, string_data = strings.serialize()
+    header = object_header.pack(
+        OBJECT_MAGIC,
+        VERSION,
+        flags,
+        arch,
+        entry_symbol_id,
+        len(strings),
+        len(string_data),
+        len(obj.sections),
+        len(obj.symbols),
+        len(obj.relocations),
+        len(obj.images),
+        len(image_sections),
+        len(section_data),
+        len(debug_data),
+    )
+    return b"".join(
+        [header, string_lengths, string_data]
+        + tables
+        + [section_data, debug_data]
+    )
+
+
+def deserialize_object(data, offset=0):
+    """ Create an object file from binary data at the given offset """
+    from ..api import get_arch
+
+    (
+        magic,
+        version,
+        flags,
+        arch,
+        entry_symbol_id,
+        num_strings,
+        strings_size,
+        num_sections,
+        num_symbols,
+        num_relocations,
+        num_images,
+        num_image_sections,
+        data_size,
+        debug_size,
+    ) = object_header.unpack_from(data, offset)
+    if magic != OBJECT_MAGIC:
+        raise ValueError("Not a binary object file")
+    if version != VERSION:
+        raise ValueError("Unsupported object file version {}".format(version))
+    offset += object_header.size
+
+    # String table:
+    lengths = struct.unpack_from("<{}I".format(num_strings), data, offset)
+    offset += string_length.size * num_strings
+    strings = []
+    for length in lengths:
+        strings.append(bytes(data[offset : offset + length]).decode("utf8"))
+        offset += length
+
+    def records(record, count):
+        nonlocal offset
+        for _ in range(count):
+            yield record.unpack_from(data, offset)
+            offset += record.size
+
+    obj = objectfile.ObjectFile(get_arch(strings[arch]))
+    if flags & FLAG_ENTRY:
+        obj.entry_symbol_id = entry_symbol_id
+
+    section_sizes = []
+    for name, address, alignment, size in records(
+        section_record, num_sections
+    ):
+        section = objectfile.Section(strings[name])
+        section.address = address
+        section.alignment = alignment
+        obj.add_section(section)
+        section_sizes.append(size)
+
+    for symbol_id, name, binding, defined, value, section in records(
+        symbol_record, num_symbols
+    ):
+        if not defined:
+            value = None
+        section = None if section < 0 else strings[section]
+        obj.add_symbol(
+            symbol_id, strings[name], strings[binding], value, section
+        )
+
+    for reloc_type, symbol_id, section, reloc_offset, addend in records(
+        relocation_record, num_relocations
+    ):
+        obj.add_relocation(
+            objectfile.RelocationEntry(
+                strings[reloc_type],
+                symbol_id,
+                strings[section],
+                reloc_offset,
+                addend,
+            )
+        )
+
+    images = []
+    for name, address, count in records(image_record, num_images):
+        image = objectfile.Image(strings[name], address)
+        obj.add_image(image)
+        images.append((image, count))
+
+    for image, count in images:
+        for (index,) in records(image_section_record, count):
+            image.add_section(obj.sections[index])
+
+    for section, size in zip(obj.sections, section_sizes):
+        section.data = bytearray(data[offset : offset + size])
+        offset += size
+
+    if flags & FLAG_DEBUG:
+        debug_data = zlib.decompress(data[offset : offset + debug_size])
+        obj.debug_info = debuginfo.deserialize(json.loads(debug_data))
+
+    return obj
+
+
+def serialize_archive(objs, symbol_index=None):
+    """ Create a binary archive from the given object files.
+
+    Args:
+        objs: the object files to put in the archive.
+        symbol_index: an optional mapping from symbol name to the index
+            of the object defining the symbol.
+    """
+    flags = 0
+    parts = []
+    if symbol_index is not None:
+        flags |= FLAG_SYMBOL_INDEX
+        names = [name.encode("utf8") for name in symbol_index]
+        name_data = b"".join(names)
+        count = len(names)
+        parts.append(symbol_index_header.pack(count, len(name_data)))
+        parts.append(struct.pack("<{}I".format(count), *map(len, names)))
+        parts.append(
+            struct.pack("<{}I".format(count), *symbol_index.values())
+        )
+        parts.append(name_data)
+
+    blobs = [serialize_object(obj) for obj in objs]
+    offset = archive_header.size + archive_entry.size * len(blobs)
+    offset += sum(map(len, parts))
+    entries = []
+    for blob in blobs:
+        entries.append(archive_entry.pack(offset, len(blob)))
+        offset += len(blob)
+    header = archive_header.pack(ARCHIVE_MAGIC, VERSION, flags, len(blobs))
+    return b"".join([header] + entries + parts + blobs)
+
+
+def deserialize_archive(data):
+    """ Get the object files from a binary archive.
+
+    Returns:
+        A tuple with the list of object files and the symbol index. When
+        the archive contains no symbol index, the index is None.
+    """
+    magic, version, flags, num_objects = archive_header.unpack_from(data, 0)
+    if magic != ARCHIVE_MAGIC:
+        raise ValueError("Not a binary archive")
+    if version != VERSION:
+        raise ValueError("Unsupported archive version {}".format(version))
+
+    offset = archive_header.size
+    entries = []
+    for _ in range(num_objects):
+        entries.append(archive_entry.unpack_from(data, offset))
+        offset += archive_entry.size
+
+    if flags & FLAG_SYMBOL_INDEX:
+        count, names_size = symbol_index_header.unpack_from(data, offset)
+        offset += symbol_index_header.size
+        fmt = "<{}I".format(count)
+        lengths = struct.unpack_from(fmt, data, offset)
+        offset += struct.calcsize(fmt)
+        indici = struct.unpack_from(fmt, data, offset)
+        offset += struct.calcsize(fmt)
+        names = bytes(data[offset : offset + names_size])
+        symbol_index = {}
+        position = 0
+        for length, index in zip(lengths, indici):
+            name = names[position : position + length].decode("utf8")
+            symbol_index[name] = index
+            position += length
+    else:
+        symbol_index = None
+
+    objs = [deserialize_object(data, offset) for offset, _ in entries]
+    return objs, symbol_index
@@ -16,6 +16,7 @@ class DebugDb:
 
     logger = logging.getLogger("debugdb")
     verbose = False
+    label_prefix = ".LDBG_"
 
     def __init__(self):
         self.mappings = {}
@@ -25,7 +26,7 @@ class DebugDb:
     def new_label(self):
         """ Create a new label name that is unique """
         self.label_nr += 1
-        return ".LDBG_{}".format(self.label_nr)
+        return "{}{}".format(self.label_prefix, self.label_nr)
 
     def enter(self, src, info):
         """ Register debug info as a result of something """
@@ -1,6 +1,32 @@
-""" Contains disassembler stuff. """
+""" Contains disassembler stuff.
 
-from ..arch.data_instructions import DByte
+Instructions are decoded using the tokens and bit patterns which are used
+to encode them. For each instruction set, a decision tree is created once.
+The nodes of this tree select a branch based on the value of the bits
+which are fixed in many instructions, such as opcode fields. The leaves of
+the tree contain the few instructions which can match the selected bits.
+
+Instructions with operands which are one of several constructors, such as
+an addressing mode, are split into forms. A form has a single constructor
+for each of those operands, so it has a fixed size and fixed bit patterns.
+
+Instructions with a custom encode method have no bit patterns. For these,
+the bits of each operand are found by encoding instances with sample
+values, see the probe function.
+
+A decoded instruction is always encoded again, and only accepted when this
+results in the same data. Data which cannot be decoded is emitted as bytes.
+This is also the case for instructions which have operands that are filled
+in by relocations, such as labels, or operands other than registers and
+integers, such as register lists.
+"""
+
+from functools import lru_cache
+import itertools
+from ..arch.data_instructions import DByte, DataInstruction
+from ..arch.encoding import Constructor, Instruction, Register, Transform
+from ..arch.encoding import FixedPattern, VariablePattern
+from ..arch.token import TokenSequence
 
 
 class Disassembler:
@@ -8,33 +34,613 @@ class Disassembler:
 
     def __init__(self, arch):
         self.arch = arch
-        for instruction in arch.isa.instructions:
-            # print(instruction, instruction.patterns)
-            # for nl in instruction.non_leaves:
-            #    print('  ', nl.patterns)
-            pass
+        self.decoder = make_decoder(tuple(arch.isa.instructions))
 
     def disasm(self, data, outs, address=0):
         """ Disassemble data into an instruction stream """
-        # TODO: implement this!
-
-        # The trial and error method, will be slow as a snail:
-        # for instruction in self.arch.isa.instructions:
-        #    for size in instruction.sizes():
-        #        part = data[:size]
-        #        try:
-        #            print(instruction, part, size)
-        #            i = instruction.decode(part)
-        #            print(i)
-        #        except ValueError:
-        #            pass
-
-        # For now, all is bytes!
-        for byte in data:
-            ins = DByte(byte)
-            ins.address = address
-            outs.emit(ins)
-            address += len(ins.encode())
-
-    def take_one(self):
-        pass
+        offset = 0
+        while offset < len(data):
+            ins, size = self.take_one(data, offset)
+            if ins:
+                ins.address = address + offset
+                outs.emit(ins)
+            else:
+                for index in range(offset, offset + size):
+                    ins = DByte(data[index])
+                    ins.address = address + index
+                    outs.emit(ins)
+            offset += size
+
+    def take_one(self, data, offset):
+        """ Decode a single instruction at the given offset.
+
+        Returns a tuple with the instruction and its size. The instruction
+        is None when the data cannot be decoded.
+        """
+        return self.decoder.decode(data, offset)
+
+
+@lru_cache(maxsize=30)
+def make_decoder(instructions):
+    """ Create a decoder for the given instruction classes """
+    return Decoder(instructions)
+
+
+class Decoder:
+    """ Decodes instructions with a decision tree per instruction size """
+
+    def __init__(self, instructions):
+        forms = []
+        templates = {}
+        for cls in instructions:
+            if not is_decodable_class(cls):
+                continue
+            for form in expand(cls):
+                if cls.encode is Instruction.encode:
+                    new_forms = [form] if form.prepare() else []
+                else:
+                    new_forms = probe(form, templates)
+                for new_form in new_forms:
+                    # Try the most specific forms first:
+                    bits = bin(new_form.mask).count("1")
+                    new_form.rank = (-bits, not new_form.decodable, len(forms))
+                    forms.append(new_form)
+
+        self.trees = []
+        sizes = sorted(set(form.size for form in forms))
+        for size in sizes:
+            tree = DecisionNode([form for form in forms if form.size == size])
+            self.trees.append((size, tree))
+
+    def decode(self, data, offset):
+        """ Decode an instruction, see Disassembler.take_one """
+        candidates = []
+        for size, tree in self.trees:
+            part = data[offset : offset + size]
+            if len(part) < size:
+                break
+            bits = int.from_bytes(part, "big")
+            for form in tree.lookup(bits):
+                if bits & form.mask == form.value:
+                    candidates.append((form.rank, form, part))
+
+        candidates.sort(key=lambda c: c[0])
+        for _, form, part in candidates:
+            if not form.decodable:
+                return None, form.size
+            try:
+                ins = form.decode(part)
+                if ins.encode() == part:
+                    return ins, form.size
+            except (KeyError, TypeError, ValueError):
+                pass
+        return None, 1
+
+
+class DecisionNode:
+    """ Node in a decision tree, which selects forms by some bits.
+
+    The bits to decide on are the bits fixed by at least half of the forms.
+    Forms which do not fix all of these bits are put in each branch where
+    they can match, and in the default branch.
+    """
+
+    # Below this amount of forms, all forms are checked one by one:
+    leaf_size = 4
+
+    def __init__(self, forms, used=0):
+        self.mask = 0
+        self.branches = {}
+        self.default = None
+        self.forms = sorted(forms, key=lambda f: f.rank)
+
+        if len(forms) <= self.leaf_size:
+            return
+
+        size = max(form.size for form in forms)
+        for bit in range(size * 8):
+            bit_mask = 1 << bit
+            if bit_mask & used:
+                continue
+            count = sum(1 for form in forms if form.mask & bit_mask)
+            if count * 2 >= len(forms):
+                self.mask |= bit_mask
+
+        if not self.mask:
+            return
+
+        groups = {}
+        wildcards = []
+        for form in forms:
+            if form.mask & self.mask == self.mask:
+                groups.setdefault(form.value & self.mask, []).append(form)
+            else:
+                wildcards.append(form)
+
+        used |= self.mask
+        for key, group in groups.items():
+            for form in wildcards:
+                if (key ^ form.value) & form.mask & self.mask == 0:
+                    group.append(form)
+            self.branches[key] = DecisionNode(group, used)
+        self.default = DecisionNode(wildcards, used)
+        self.forms = None
+
+    def lookup(self, bits):
+        """ Get the forms which might match the given bits """
+        node = self
+        while node.forms is None:
+            node = node.branches.get(bits & node.mask, node.default)
+        return node.forms
+
+
+def is_decodable_class(cls):
+    """ Check if instances of a class can be created from its patterns """
+    return (
+        not issubclass(cls, DataInstruction)
+        and bool(cls.syntax)
+        and hasattr(cls, "tokens")
+    )
+
+
+def constructor_options(operand):
+    """ Get the constructor classes which an operand can be """
+    if isinstance(operand._cls, tuple):
+        options = operand._cls
+    else:
+        options = (operand._cls,)
+    return [
+        c
+        for c in options
+        if isinstance(c, type) and issubclass(c, Constructor) and c.syntax
+    ]
+
+
+def expand(cls):
+    """ Create all forms of a constructor class """
+    choices = []
+    for operand in cls.syntax.formal_arguments:
+        if operand.is_constructor:
+            choices.append(
+                [
+                    (operand, form)
+                    for option in constructor_options(operand)
+                    for form in expand(option)
+                ]
+            )
+    for combination in itertools.product(*choices):
+        yield Form(cls, dict(combination))
+
+
+class Form:
+    """ A constructor class with one choice for each constructor operand """
+
+    def __init__(self, cls, choices):
+        self.cls = cls
+        self.choices = choices
+        self.rank = None
+        self.size = 0
+        self.mask = 0
+        self.value = 0
+        self.token_classes = []
+        self.variables = {}
+        self.decodable = True
+
+    def __repr__(self):
+        return "Form({})".format(self.cls.__name__)
+
+    @property
+    def non_leaves(self):
+        """ Get the forms of all parts, in the order of their tokens """
+        yield self
+        for operand in self.cls.syntax.formal_arguments:
+            if operand in self.choices:
+                yield from self.choices[operand].non_leaves
+
+    def patterns(self):
+        """ Get the bit patterns of this part of the instruction.
+
+        Operands which map the chosen constructor to a value become
+        fixed patterns.
+        """
+        for pattern in self.cls.dict_to_patterns(self.cls.patterns):
+            if isinstance(pattern, VariablePattern):
+                operand = pattern.prop
+                if operand in self.choices and operand._value_map:
+                    value = operand._value_map[self.choices[operand].cls]
+                    pattern = FixedPattern(pattern.field, value)
+            yield pattern
+
+    def prepare(self):
+        """ Determine the tokens and fixed bits of this form.
+
+        Returns False when the patterns cannot be applied to the tokens.
+        """
+        precodes = []
+        tokens = []
+        for part in self.non_leaves:
+            for token_class in getattr(part.cls, "tokens", ()):
+                if token_class.Info.precode:
+                    precodes.append(token_class)
+                else:
+                    tokens.append(token_class)
+        self.token_classes = precodes + tokens
+        mask_tokens = self.create_tokens()
+        value_tokens = self.create_tokens()
+
+        for part in self.non_leaves:
+            part.variables = {}
+            for pattern in part.patterns():
+                try:
+                    field = field_property(value_tokens, pattern.field)
+                    if isinstance(pattern, FixedPattern):
+                        mask_tokens.set_field(pattern.field, field._mask)
+                        value_tokens.set_field(pattern.field, pattern.value)
+                    elif isinstance(pattern, VariablePattern):
+                        part.variables[pattern.prop.source] = pattern
+                except (AttributeError, KeyError, ValueError):
+                    return False
+
+            for operand in part.cls.syntax.formal_arguments:
+                if not part.can_decode(operand):
+                    self.decodable = False
+
+        mask = mask_tokens.encode()
+        self.size = len(mask)
+        self.mask = int.from_bytes(mask, "big")
+        self.value = int.from_bytes(value_tokens.encode(), "big")
+        return self.size > 0
+
+    def create_tokens(self):
+        """ Create new tokens for this form """
+        return TokenSequence([tc() for tc in self.token_classes])
+
+    def can_decode(self, operand):
+        """ Check if the value of an operand can be determined """
+        if operand in self.choices:
+            return True
+        elif operand in self.variables:
+            prop = self.variables[operand].prop
+            if isinstance(prop, Transform):
+                return type(prop).backwards is not Transform.backwards
+            return not operand.is_constructor
+        else:
+            # Implicit operand, which can be only one register:
+            return (
+                isinstance(operand._cls, type)
+                and issubclass(operand._cls, Register)
+                and len(operand._cls.all_registers()) == 1
+            )
+
+    def decode(self, data):
+        """ Create an instruction from data of the size of this form """
+        tokens = self.create_tokens()
+        tokens.fill(data)
+        return self.construct(tokens)
+
+    def construct(self, tokens):
+        """ Create the constructor of this form from filled tokens """
+        args = []
+        for operand in self.cls.syntax.formal_arguments:
+            if operand in self.choices:
+                arg = self.choices[operand].construct(tokens)
+            elif operand in self.variables:
+                pattern = self.variables[operand]
+                value = tokens.get_field(pattern.field)
+                arg = pattern.prop.from_value(value)
+            else:
+                arg = operand._cls.all_registers()[0]
+            args.append(arg)
+        return self.cls(*args)
+
+
+def field_property(tokens, field):
+    """ Get the property of the first token which has the given field """
+    for token in tokens.tokens:
+        if hasattr(token, field):
+            return getattr(type(token), field)
+    raise KeyError(field)
+
+
+def probe(form, templates):
+    """ Create forms for a class with a custom encode method.
+
+    The bits of such a class are found by encoding instances with sample
+    operand values. Values which change the size of the instruction, such
+    as registers which require a prefix, are probed in a new form.
+
+    Many classes share an encode method and differ only in some fixed
+    bits, such as an opcode. The forms found for the first of these
+    classes are used as templates for the others.
+    """
+    domains = {}
+    for part in form.non_leaves:
+        for operand in part.cls.syntax.formal_arguments:
+            if operand in part.choices:
+                continue
+            if operand._cls is int:
+                domains[(part, operand)] = 0
+            elif isinstance(operand._cls, type) and issubclass(
+                operand._cls, Register
+            ):
+                domains[(part, operand)] = list(operand._cls.all_registers())
+            else:
+                # Operands such as labels cannot be probed
+                return []
+
+    key = (
+        form.cls.encode,
+        tuple(part.cls for part in form.non_leaves if part is not form),
+        tuple(operand._cls for _, operand in domains),
+    )
+    if key in templates:
+        forms = [t.adopt(form, list(domains)) for t in templates[key]]
+        if all(forms):
+            return forms
+
+    forms = []
+    seen = set()
+    cache = {}
+    todo = [(domains, 0)]
+    while todo and len(forms) < ProbedForm.max_forms:
+        domains, depth = todo.pop(0)
+        domain_key = tuple(
+            tuple(map(id, d)) if isinstance(d, list) else d
+            for d in domains.values()
+        )
+        if domain_key in seen:
+            continue
+        seen.add(domain_key)
+        probed = ProbedForm(form, domains, cache)
+        if probed.prepare():
+            forms.append(probed)
+        if depth < ProbedForm.max_depth:
+            todo.extend((split, depth + 1) for split in probed.splits)
+    templates[key] = forms
+    return forms
+
+
+class ProbedForm:
+    """ A form of which the bits are found by encoding instances.
+
+    Register operands are decoded with a table of the bits of each register.
+    Integer operands are decoded bit by bit.
+    """
+
+    max_depth = 3
+    max_forms = 32
+
+    def __init__(self, form, domains, cache):
+        self.form = form
+        self.domains = domains
+        self.cache = cache
+        self.rank = None
+        self.decodable = True
+        self.size = 0
+        self.mask = 0
+        self.value = 0
+        self.bits = 0
+        self.base = {}
+        self.tables = {}
+        self.integers = {}
+        self.splits = []
+
+    def __repr__(self):
+        return "ProbedForm({})".format(self.form.cls.__name__)
+
+    def prepare(self):
+        """ Determine the fixed bits and the bits of each operand.
+
+        Returns False when the operands cannot be told apart.
+        """
+        self.base = {
+            leaf: domain[0] if isinstance(domain, list) else domain
+            for leaf, domain in self.domains.items()
+            if domain != []
+        }
+        if len(self.base) < len(self.domains):
+            return False
+
+        encoded = self.encode(self.base)
+        if not encoded:
+            return False
+        self.bits, self.size = encoded
+
+        used = 0
+        for leaf, domain in self.domains.items():
+            if isinstance(domain, list):
+                mask = self.probe_register(leaf, domain)
+            else:
+                mask = self.probe_integer(leaf, domain)
+            if mask & used:
+                return False
+            used |= mask
+
+        self.mask = ((1 << (self.size * 8)) - 1) & ~used
+        self.value = self.bits & self.mask
+        return True
+
+    def adopt(self, form, leaves):
+        """ Create a form with the same operand bits for another class.
+
+        Returns None when the class encodes differently.
+        """
+        leaf_map = dict(zip(self.domains, leaves))
+        other = ProbedForm(form, rename(self.domains, leaf_map), {})
+        other.base = rename(self.base, leaf_map)
+        other.tables = rename(self.tables, leaf_map)
+        other.integers = rename(self.integers, leaf_map)
+        encoded = other.encode(other.base)
+        if not encoded or encoded[1] != self.size:
+            return None
+        other.bits, other.size = encoded
+        other.mask = self.mask
+        other.value = other.bits & self.mask
+
+        # Check the bits of all operands at once:
+        values = dict(other.base)
+        bits = other.bits
+        for leaf, (_, table) in other.tables.items():
+            diff = max(table)
+            values[leaf] = table[diff]
+            bits ^= diff
+        for leaf, (base, bit_map, _) in other.integers.items():
+            for bit, data_bit in bit_map:
+                base ^= 1 << bit
+                bits ^= data_bit
+            values[leaf] = base
+        if other.encode(values) == (bits, other.size):
+            return other
+
+    def encode(self, values):
+        """ Encode an instance with the given values.
+
+        Returns the bits and the size, or None when the encoder rejects
+        the values.
+        """
+        key = tuple(values[leaf] for leaf in self.domains)
+        if key not in self.cache:
+            try:
+                data = build(self.form, values).encode()
+            except Exception:  # Encoders raise all kinds of errors
+                data = None
+            if data:
+                data = int.from_bytes(data, "big"), len(data)
+            self.cache[key] = data
+        return self.cache[key]
+
+    def encode_with(self, leaf, value):
+        """ Encode the base instance with one operand changed """
+        values = dict(self.base)
+        values[leaf] = value
+        encoded = self.encode(values)
+        if encoded and encoded[1] == self.size:
+            return encoded[0]
+
+    def probe_register(self, leaf, domain):
+        """ Create a table with the bits of each register """
+        table = {}
+        groups = {}
+        for register in domain:
+            values = dict(self.base)
+            values[leaf] = register
+            encoded = self.encode(values)
+            if encoded and encoded[1] == self.size:
+                table.setdefault(encoded[0] ^ self.bits, register)
+            else:
+                groups.setdefault(encoded and encoded[1], []).append(register)
+
+        for group in groups.values():
+            split = dict(self.domains)
+            split[leaf] = group
+            self.splits.append(split)
+
+        mask = 0
+        for diff in table:
+            mask |= diff
+        self.tables[leaf] = (mask, table)
+        return mask
+
+    def probe_integer(self, leaf, base):
+        """ Find the bit where each bit of an integer ends up """
+        bit_map = []
+        mask = 0
+        misses = 0
+        split = False
+        bit = 0
+        # Stop at the end of the field, but skip a few low bits, which
+        # might be absent for aligned values:
+        while bit < 64 and misses < (1 if bit_map else 8):
+            diff = None
+            for anchor in (base, base ^ (2 << bit)):
+                low = self.encode_with(leaf, anchor)
+                high = self.encode_with(leaf, anchor ^ (1 << bit))
+                if low is not None and high is not None:
+                    diff = low ^ high
+                    break
+                elif base == 0 and not split and low is not None:
+                    split = self.split_integer(leaf, 1 << bit)
+
+            if diff and diff & (diff - 1) == 0:
+                bit_map.append((bit, diff))
+                mask |= diff
+                misses = 0
+            else:
+                misses += 1
+            bit += 1
+
+        # Bits which are set for negative values only:
+        sign = 0
+        encoded = self.encode_with(leaf, ~base)
+        if encoded is not None and bit_map:
+            sign = (encoded ^ self.bits) & ~mask
+            mask |= sign
+
+        self.integers[leaf] = (base, bit_map, sign)
+        return mask
+
+    def split_integer(self, leaf, value):
+        """ Probe a value which changes the size in a new form.
+
+        Returns True when a new form is created.
+        """
+        values = dict(self.base)
+        values[leaf] = value
+        if self.encode(values):
+            split = dict(self.domains)
+            split[leaf] = value
+            self.splits.append(split)
+            return True
+        return False
+
+    def decode(self, data):
+        """ Create an instruction from data of the size of this form """
+        diff = int.from_bytes(data, "big") ^ self.bits
+        values = dict(self.base)
+        for leaf, (mask, table) in self.tables.items():
+            values[leaf] = table[diff & mask]
+
+        options = []
+        for leaf, (base, bit_map, sign) in self.integers.items():
+            value = base
+            for bit, data_bit in bit_map:
+                if diff & data_bit:
+                    value ^= 1 << bit
+            wrap = 1 << (bit_map[-1][0] + 1) if bit_map else 1
+            if sign:
+                if diff & sign == sign:
+                    # Two's complement, or a sign and a magnitude:
+                    candidates = [value - wrap, -value]
+                elif diff & sign == 0:
+                    candidates = [value]
+                else:
+                    raise ValueError("Invalid sign bits")
+            elif value & (wrap >> 1):
+                # Prefer a negative value, such as an offset:
+                candidates = [value - wrap, value]
+            else:
+                candidates = [value]
+            options.append([(leaf, v) for v in candidates])
+
+        for combination in itertools.product(*options):
+            values.update(combination)
+            ins = build(self.form, values)
+            if ins.encode() == data:
+                return ins
+        raise ValueError("Data does not encode as {}".format(self))
+
+
+def rename(values, leaf_map):
+    """ Use the operands of another form as keys of a dictionary """
+    return {leaf_map[leaf]: value for leaf, value in values.items()}
+
+
+def build(form, values):
+    """ Create the constructor of a form from values of its operands """
+    args = []
+    for operand in form.cls.syntax.formal_arguments:
+        if operand in form.choices:
+            args.append(build(form.choices[operand], values))
+        else:
+            args.append(values[(form, operand)])
+    return form.cls(*args)
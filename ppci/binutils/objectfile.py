@@ -21,12 +21,13 @@ import binascii
 from ..common import CompilerError, make_num, get_file
 from ..utils.binary_txt import bin2asc, asc2bin
 from . import debuginfo
+from . import binaryobject
 
 
 def get_object(obj):
     """ Try hard to load an object """
     if not isinstance(obj, ObjectFile):
-        f = get_file(obj)
+        f = get_file(obj, "rb")
         obj = ObjectFile.load(f)
         f.close()
     return obj
@@ -346,15 +347,32 @@ class ObjectFile:
         """
         return serialize(self)
 
-    def save(self, output_file):
-        """ Save object file to a file like object """
-        json.dump(self.serialize(), output_file, indent=2, sort_keys=True)
-        print(file=output_file)
+    def save(self, output_file, fmt="json"):
+        """ Save object file to a file like object.
+
+        Args:
+            output_file: the file to write to. For the binary format, this
+                must be a file opened in binary mode.
+            fmt: the format to use, either 'json' or 'binary'.
+        """
+        if fmt == "json":
+            json.dump(self.serialize(), output_file, indent=2, sort_keys=True)
+            print(file=output_file)
+        elif fmt == "binary":
+            output_file.write(binaryobject.serialize_object(self))
+        else:
+            raise ValueError("Unknown object file format {}".format(fmt))
 
     @staticmethod
     def load(input_file):
-        """ Load object file from file """
-        return deserialize(json.load(input_file))
+        """ Load object file from file.
+
+        The format, json or binary, is detected automatically.
+        """
+        with binaryobject.map_file(input_file) as data:
+            if binaryobject.is_binary_object(data):
+                return binaryobject.deserialize_object(data)
+            return deserialize(json.loads(data[:]))
 
 
 def print_object(obj):
@@ -0,0 +1,76 @@
+"""
+    Build state of task outputs, used for incremental builds.
+
+    For each output file, the options of the task and the hashes of all
+    input files are stored in a json file next to the output. Input files
+    are the files given to the task, as well as the files found while
+    building, such as included headers. The output is up to date when
+    the options are the same and none of the inputs changed.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+
+logger = logging.getLogger('buildstate')
+
+
+def hash_file(filename):
+    """ Get the sha256 hash of the contents of a file """
+    with open(filename, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def state_filename(output_filename):
+    """ Get the name of the file with the build state of an output """
+    return output_filename + '.buildstate'
+
+
+def is_up_to_date(output_filename, options, inputs):
+    """ Check if an output was built with the given options and inputs.
+
+    Args:
+        output_filename: the file created by the task.
+        options: a json compatible value with the options of the task.
+        inputs: the input files given to the task.
+    """
+    filename = state_filename(output_filename)
+    if not (os.path.exists(output_filename) and os.path.exists(filename)):
+        return False
+
+    try:
+        with open(filename, 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        logger.warning('Ignoring invalid build state %s', filename)
+        return False
+
+    if state.get('options') != options:
+        logger.debug('Options of %s changed', output_filename)
+        return False
+
+    hashes = state.get('inputs', {})
+    if not all(os.path.abspath(i) in hashes for i in inputs):
+        logger.debug('Inputs of %s changed', output_filename)
+        return False
+
+    for input_filename, digest in hashes.items():
+        if not os.path.exists(input_filename):
+            logger.debug('%s was removed', input_filename)
+            return False
+        if hash_file(input_filename) != digest:
+            logger.debug('%s changed', input_filename)
+            return False
+    return True
+
+
+def save_state(output_filename, options, inputs):
+    """ Record the options and inputs from which an output was built """
+    state = {
+        'options': options,
+        'inputs': {os.path.abspath(i): hash_file(i) for i in inputs},
+    }
+    with open(state_filename(output_filename), 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
@@ -7,8 +7,9 @@ module
 """
 
 from .tasks import Task, TaskError, register_task
+from . import buildstate
 from ..utils.reporting import HtmlReportGenerator, DummyReportGenerator
-from .. import api
+from .. import api, __version__
 from ..lang.tools.common import ParserException
 from ..common import CompilerError
 
@@ -48,12 +49,43 @@ class BuildTask(Task):
 class OutputtingTask(Task):
     """ Base task for tasks that create an object file """
 
-    def store_object(self, obj):
-        """ Store the object in the specified file """
-        output_filename = self.relpath(self.get_argument('output'))
+    @property
+    def output_filename(self):
+        return self.relpath(self.get_argument('output'))
+
+    def build_options(self):
+        """ Get the options which determine the output of this task """
+        return {
+            'task': self.name,
+            'arguments': self.arguments,
+            'version': __version__,
+        }
+
+    def is_up_to_date(self, inputs):
+        """ Check if the output must be created again.
+
+        This is only the case in an incremental build, when the output was
+        created before from the same inputs and options.
+        """
+        if self.incremental and buildstate.is_up_to_date(
+                self.output_filename, self.build_options(), inputs):
+            self.logger.info('%s is up to date', self.output_filename)
+            return True
+        return False
+
+    def store_object(self, obj, inputs=()):
+        """ Store the object in the specified file.
+
+        In an incremental build, the inputs from which the object was
+        created are recorded as well.
+        """
+        output_filename = self.output_filename
         self.ensure_path(output_filename)
         with open(output_filename, 'wt', encoding='utf8') as output_file:
             obj.save(output_file)
+        if self.incremental:
+            buildstate.save_state(
+                output_filename, self.build_options(), inputs)
 
 
 @register_task
@@ -69,6 +101,9 @@ class AssembleTask(OutputtingTask):
         else:
             debug = False
 
+        if self.is_up_to_date([source]):
+            return
+
         try:
             obj = api.asm(source, arch, debug=debug)
         except ParserException as err:
@@ -78,7 +113,7 @@ class AssembleTask(OutputtingTask):
         except OSError as err:
             raise TaskError('Error:' + str(err))
 
-        self.store_object(obj)
+        self.store_object(obj, [source])
         self.logger.debug('Assembling finished')
 
 
@@ -93,6 +128,9 @@ class C3CompileTask(OutputtingTask):
         else:
             includes = []
 
+        if self.is_up_to_date(sources + includes):
+            return
+
         if 'report' in self.arguments:
             report_file = self.relpath(self.arguments['report'])
             reporter = HtmlReportGenerator(
@@ -109,7 +147,7 @@ class C3CompileTask(OutputtingTask):
                 sources, includes, arch, opt_level=opt,
                 reporter=reporter, debug=debug)
 
-        self.store_object(obj)
+        self.store_object(obj, sources + includes)
 
 
 @register_task
@@ -123,6 +161,9 @@ class CCompileTask(OutputtingTask):
         else:
             includes = []
 
+        if self.is_up_to_date(sources):
+            return
+
         if 'report' in self.arguments:
             report_file = self.relpath(self.arguments['report'])
             reporter = HtmlReportGenerator(
@@ -139,16 +180,18 @@ class CCompileTask(OutputtingTask):
 
         with reporter:
             objs = []
+            headers = []
             for source in sources:
                 with open(source, 'r') as f:
                     obj = api.cc(
                         f, arch, coptions=coptions, opt_level=opt,
-                        reporter=reporter, debug=debug)
+                        reporter=reporter, debug=debug,
+                        included_files=headers)
                 objs.append(obj)
             obj = api.link(
                 objs, partial_link=True, reporter=reporter, debug=debug)
 
-        self.store_object(obj)
+        self.store_object(obj, sources + headers)
 
 
 @register_task
@@ -213,6 +256,10 @@ class LinkTask(OutputtingTask):
         debug = bool(self.get_argument('debug', default=False))
         partial = bool(self.get_argument('partial', default=False))
 
+        inputs = objects + ([layout] if layout else [])
+        if self.is_up_to_date(inputs):
+            return
+
         try:
             obj = api.link(
                 objects, layout=layout, use_runtime=True,
@@ -220,7 +267,7 @@ class LinkTask(OutputtingTask):
         except CompilerError as err:
             raise TaskError(err.msg)
 
-        self.store_object(obj)
+        self.store_object(obj, inputs)
 
 
 @register_task
@@ -1,12 +1,21 @@
 """
     This module defines tasks and a runner for these tasks. Tasks can
     have dependencies and it can be determined if they need to be run.
+
+    The runner can run independent targets in parallel worker processes.
+    The tasks of a single target are always run in sequence.
 """
 
+import contextlib
+import io
 import logging
+import logging.handlers
+import queue
 import re
 import os
 import glob
+import sys
+from ..utils.workers import can_fork, forked_pool, worker_state
 
 
 task_map = {}
@@ -107,15 +116,14 @@ class Target:
         """ Add another task as a dependency for this task """
         self.dependencies.add(target_name)
 
-    def __gt__(self, other):
-        return other.name in self.project.dependencies(self.name)
-
     def __repr__(self):
         return 'Target "{}"'.format(self.name)
 
 
 class Task:
     """ Task that can run, and depend on other tasks """
+    incremental = False
+
     def __init__(self, target, kwargs, sub_elements=[]):
         self.logger = logging.getLogger('task')
         self.target = target
@@ -168,9 +176,18 @@ class Task:
 
 
 class TaskRunner:
-    """ Basic task runner that can run some tasks in sequence """
-    def __init__(self):
+    """ Task runner that runs targets in order of their dependencies.
+
+    When jobs is more than one, targets which do not depend on each other
+    are run in parallel by this amount of worker processes. The output of
+    the targets is logged in the same order as when running in sequence.
+
+    In incremental mode, tasks skip creating outputs which are up to date.
+    """
+    def __init__(self, jobs=1, incremental=False):
         self.logger = logging.getLogger('taskrunner')
+        self.jobs = jobs
+        self.incremental = incremental
 
     def get_task(self, name):
         """ Tries to load the task type """
@@ -205,20 +222,124 @@ class TaskRunner:
             .union(set(target_list))
 
         # Lookup actual targets:
-        target_list = [project.get_target(target_name)
-                       for target_name in target_list]
-        target_list.sort()
+        target_list = self.order_targets(
+            [project.get_target(target_name) for target_name in target_list])
 
         self.logger.info('Target sequence: {}'.format(target_list))
 
         # Run tasks:
-        for target in target_list:
-            self.logger.info('Target {} Started'.format(target.name))
-            for tname, props in target.tasks:
-                for arg in props:
-                    props[arg] = project.expand_macros(props[arg])
-                task = self.get_task(tname)(target, props)
-                self.logger.info('Running {}'.format(task))
-                task.run()
-            self.logger.info('Target {} Ready'.format(target.name))
+        if self.jobs > 1 and len(target_list) > 1 and can_fork():
+            self.run_parallel(project, target_list)
+        else:
+            for target in target_list:
+                self.run_target(project, target)
         self.logger.info('All targets done!')
+
+    @staticmethod
+    def order_targets(targets):
+        """ Sort targets such that dependencies come first.
+
+        Targets without a dependency between them are sorted by name.
+        """
+        names = {target.name for target in targets}
+        waiting = {
+            target: target.dependencies & names for target in targets}
+        order = []
+        while waiting:
+            ready = sorted(
+                (t for t, deps in waiting.items() if not deps),
+                key=lambda t: t.name)
+            if not ready:
+                raise TaskError('Dependency loop between targets {}'.format(
+                    ', '.join(sorted(t.name for t in waiting))))
+            target = ready[0]
+            order.append(target)
+            del waiting[target]
+            for deps in waiting.values():
+                deps.discard(target.name)
+        return order
+
+    def run_target(self, project, target):
+        """ Run the tasks of a single target """
+        self.logger.info('Target {} Started'.format(target.name))
+        for tname, props in target.tasks:
+            for arg in props:
+                props[arg] = project.expand_macros(props[arg])
+            task = self.get_task(tname)(target, props)
+            task.incremental = self.incremental
+            self.logger.info('Running {}'.format(task))
+            task.run()
+        self.logger.info('Target {} Ready'.format(target.name))
+
+    def run_parallel(self, project, target_list):
+        """ Run targets in a pool of worker processes.
+
+        A target is started when all of its dependencies are ready. The
+        properties of the project are passed along, such that properties
+        set by a target are seen by the targets which depend on it.
+        """
+        names = {target.name for target in target_list}
+        waiting = {
+            target: target.dependencies & names for target in target_list}
+        done = queue.Queue()
+        results = {}
+        reported = 0
+        with forked_pool(self.jobs, (self, project)) as pool:
+            while reported < len(target_list):
+                # Start targets of which all dependencies are ready:
+                for target in target_list:
+                    if target in waiting and not waiting[target]:
+                        del waiting[target]
+                        pool.apply_async(
+                            _run_target_job,
+                            (target.name, project.properties),
+                            callback=done.put,
+                            error_callback=done.put)
+
+                result = done.get()
+                if isinstance(result, BaseException):
+                    raise result
+                name, properties, records, output, error = result
+                project.properties.update(properties)
+                results[name] = (records, output, error)
+                for deps in waiting.values():
+                    deps.discard(name)
+
+                # Report finished targets in order:
+                while reported < len(target_list) and \
+                        target_list[reported].name in results:
+                    records, output, error = results.pop(
+                        target_list[reported].name)
+                    for record in records:
+                        logging.getLogger(record.name).handle(record)
+                    sys.stdout.write(output)
+                    if error is not None:
+                        raise TaskError(error)
+                    reported += 1
+
+
+def _run_target_job(target_name, properties):
+    """ Run a target in a worker process.
+
+    Log records and printed output are collected, and returned to the
+    main process.
+    """
+    runner, project = worker_state()
+    project.properties = dict(properties)
+    records = queue.SimpleQueue()
+    output = io.StringIO()
+    root_logger = logging.getLogger()
+    handlers = root_logger.handlers
+    root_logger.handlers = [logging.handlers.QueueHandler(records)]
+    error = None
+    try:
+        with contextlib.redirect_stdout(output):
+            runner.run_target(project, project.get_target(target_name))
+    except TaskError as err:
+        error = err.msg
+    finally:
+        root_logger.handlers = handlers
+    log = []
+    while not records.empty():
+        log.append(records.get())
+    return target_name, project.properties, log, output.getvalue(), error
@@ -17,17 +17,21 @@ parser = argparse.ArgumentParser(
 )
 subparsers = parser.add_subparsers(dest="command", required=True)
 create_parser = subparsers.add_parser("create", help="create new archive")
+create_parser.add_argument("archive", help="Archive filename.")
 create_parser.add_argument(
-    "archive", type=argparse.FileType("w"), help="Archive filename."
+    "obj", type=argparse.FileType("rb"), nargs="*", help="the object to link"
 )
 create_parser.add_argument(
-    "obj", type=argparse.FileType("r"), nargs="*", help="the object to link"
+    "--format",
+    help="Archive file format",
+    choices=["json", "binary"],
+    default="json",
 )
 display_parser = subparsers.add_parser(
     "display", help="display contents of an archive."
 )
 display_parser.add_argument(
-    "archive", type=argparse.FileType("r"), help="Archive filename."
+    "archive", type=argparse.FileType("rb"), help="Archive filename."
 )
 
 
@@ -38,7 +42,9 @@ def archive(args=None):
         if args.command == "create":
             objects = [get_object(obj) for obj in args.obj]
             lib = api.archive(objects)
-            lib.save(args.archive)
+            mode = "wb" if args.format == "binary" else "w"
+            with open(args.archive, mode) as f:
+                lib.save(f, fmt=args.format)
         elif args.command == "display":
             lib = get_archive(args.archive)
             for obj in lib:
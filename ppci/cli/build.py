@@ -17,6 +17,20 @@ parser.add_argument(
     help="use buildfile, otherwise build.xml is the default",
     default="build.xml",
 )
+parser.add_argument(
+    "-j",
+    "--jobs",
+    help="run this many independent targets in parallel",
+    type=int,
+    default=1,
+)
+parser.add_argument(
+    "-i",
+    "--incremental",
+    help="only rebuild outputs of which the inputs or options changed",
+    action="store_true",
+    default=False,
+)
 parser.add_argument("targets", metavar="target", nargs="*")
 
 
@@ -24,7 +38,12 @@ def build(args=None):
     """ Run the build command from command line. Used by ppci-build.py """
     args = parser.parse_args(args)
     with LogSetup(args):
-        api.construct(args.buildfile, args.targets)
+        api.construct(
+            args.buildfile,
+            args.targets,
+            jobs=args.jobs,
+            incremental=args.incremental,
+        )
 
 
 if __name__ == "__main__":
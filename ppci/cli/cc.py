@@ -2,22 +2,35 @@
 
 Use this compiler to compile C source code to machine code for different
 computer architectures.
+
+Many sources can be compiled in a single run, into an object per source
+or into an archive, optionally by several worker processes. The sources
+can also be listed in a file, which is given as @file.
 """
 
 
 import argparse
+import contextlib
+import os
+import sys
 from .base import base_parser, march_parser
-from .compile_base import compile_parser, do_compile
+from .compile_base import compile_parser, do_compile, make_object
+from .compile_base import output_options, prepare_ir
 from .base import LogSetup, get_arch_from_args
 from .. import api
+from ..binutils.objectfile import serialize, deserialize
 from ..lang.c import create_ast, CAstPrinter
 from ..lang.c.options import COptions, coptions_parser
+from ..lang.c.pch import create_pch, save_pch
+from ..utils.reporting import DummyReportGenerator
+from ..utils.workers import can_fork, forked_pool, worker_state
 
 
 parser = argparse.ArgumentParser(
     description=__doc__,
     formatter_class=argparse.RawDescriptionHelpFormatter,
     parents=[base_parser, march_parser, compile_parser, coptions_parser],
+    fromfile_prefix_chars="@",
 )
 parser.add_argument(
     "-E", action="store_true", default=False, help="Stop after preprocessing"
@@ -38,17 +51,32 @@ parser.add_argument(
     "-c", action="store_true", default=False, help="Compile, but do not link"
 )
 parser.add_argument(
-    "sources",
-    metavar="source",
-    help="source file",
-    nargs="+",
-    type=argparse.FileType("r"),
+    "--emit-pch",
+    action="store_true",
+    default=False,
+    help="Create a precompiled header from the given header file",
+)
+parser.add_argument(
+    "--output-dir",
+    metavar="dir",
+    help="Compile each source into an object file in this directory",
+)
+parser.add_argument(
+    "--archive",
+    action="store_true",
+    default=False,
+    help="Compile each source into an object, and store these in an archive",
 )
+parser.add_argument("sources", metavar="source", help="source file", nargs="+")
 
 
 def cc(args=None):
     """ Run c compile task """
     args = parser.parse_args(args)
+    options = output_options(args)
+    if options and (args.archive or args.output_dir):
+        message = "{} cannot be used with --archive or --output-dir"
+        parser.error(message.format(options[0]))
     with LogSetup(args) as log_setup:
         # Compile sources:
         march = get_arch_from_args(args)
@@ -57,33 +85,124 @@ def cc(args=None):
 
         if args.E:  # Only pre process
             with open(args.output, "w") as output:
-                for src in args.sources:
-                    api.preprocess(src, output, coptions)
+                for filename in args.sources:
+                    with open_source(filename) as src:
+                        api.preprocess(src, output, coptions)
         elif args.M:  # Emit a makefile dep line.
             dependencies = []
             for filename in dependencies:
                 print(filename)
+        elif args.emit_pch:
+            if len(args.sources) != 1:
+                parser.error("--emit-pch requires a single header file")
+            filename = args.sources[0]
+            with open_source(filename) as src:
+                pch = create_pch(src, filename, march.info, coptions)
+            with open(args.output, "wb") as output:
+                save_pch(pch, output)
         elif args.ast:
             with open(args.output, "w") as output:
                 printer = CAstPrinter(file=output)
-                for src in args.sources:
+                for filename in args.sources:
                     # Stop after ast generation:
-                    filename = src.name if hasattr(src, "name") else None
-                    ast = create_ast(
-                        src, march.info, filename=filename, coptions=coptions
-                    )
+                    with open_source(filename) as src:
+                        ast = create_ast(
+                            src,
+                            march.info,
+                            filename=filename,
+                            coptions=coptions,
+                        )
                     printer.print(ast)
+        elif args.archive:
+            objs = compile_sources(
+                args.sources, march, coptions, log_setup.reporter, args
+            )
+            with open(args.output, "w") as output:
+                api.archive(objs).save(output)
+        elif args.output_dir:
+            filenames = object_names(args.sources, args.output_dir)
+            objs = compile_sources(
+                args.sources, march, coptions, log_setup.reporter, args
+            )
+            for filename, obj in zip(filenames, objs):
+                with open(filename, "w") as output:
+                    obj.save(output)
         else:
             ir_modules = []
-            for src in args.sources:
+            for filename in args.sources:
                 # Compile and optimize in any case:
-                ir_module = api.c_to_ir(
-                    src, march, coptions=coptions, reporter=log_setup.reporter
-                )
+                with open_source(filename) as src:
+                    ir_module = api.c_to_ir(
+                        src,
+                        march,
+                        coptions=coptions,
+                        reporter=log_setup.reporter,
+                    )
                 ir_modules.append(ir_module)
 
             do_compile(ir_modules, march, log_setup.reporter, log_setup.args)
 
 
+@contextlib.contextmanager
+def open_source(filename):
+    """ Open a source file for reading, where '-' is the standard input """
+    if filename == "-":
+        yield sys.stdin
+    else:
+        with open(filename, "r") as f:
+            yield f
+
+
+def object_names(sources, directory):
+    """ Determine the object filenames of the sources in a directory """
+    names = []
+    for source in sources:
+        name = os.path.splitext(os.path.basename(source))[0] + ".oj"
+        if name in names:
+            parser.error("Sources with the same name: {}".format(name))
+        names.append(name)
+    return [os.path.join(directory, name) for name in names]
+
+
+def compile_source(filename, march, coptions, reporter, args):
+    """ Compile a single source into an object """
+    with open_source(filename) as src:
+        ir_module = api.c_to_ir(
+            src, march, coptions=coptions, reporter=reporter
+        )
+    prepare_ir([ir_module], reporter, args)
+    return make_object([ir_module], march, reporter, args)
+
+
+def compile_sources(filenames, march, coptions, reporter, args):
+    """ Compile each source into an object.
+
+    All sources are compiled in this process, so they share the caches
+    of the compiler, such as the tokens of headers. When jobs is more than
+    one, the sources are divided over this amount of forked processes.
+    """
+    if args.jobs > 1 and len(filenames) > 1 and can_fork():
+        # Each worker generates the code of its sources in one process:
+        worker_args = argparse.Namespace(**dict(vars(args), jobs=1))
+        processes = min(args.jobs, len(filenames))
+        with forked_pool(processes, (march, coptions, worker_args)) as pool:
+            results = pool.map(_compile_job, filenames, chunksize=1)
+        return [deserialize(data) for data in results]
+    else:
+        return [
+            compile_source(filename, march, coptions, reporter, args)
+            for filename in filenames
+        ]
+
+
+def _compile_job(filename):
+    """ Compile a source in a worker, and return the serialized object """
+    march, coptions, args = worker_state()
+    obj = compile_source(
+        filename, march, coptions, DummyReportGenerator(), args
+    )
+    return serialize(obj)
+
+
 if __name__ == "__main__":
     cc()
@@ -39,6 +39,13 @@ compile_parser.add_argument(
 compile_parser.add_argument(
     "-O", help="optimize code", default="0", choices=api.OPT_LEVELS
 )
+compile_parser.add_argument(
+    "-j",
+    "--jobs",
+    help="Generate code for functions in parallel with this many processes",
+    type=int,
+    default=1,
+)
 compile_parser.add_argument(
     "--instrument-functions",
     help="Instrument given functions",
@@ -47,9 +54,19 @@ compile_parser.add_argument(
 )
 
 
-def do_compile(ir_modules, march, reporter, args):
-    """ Handle the proper output action """
+def output_options(args):
+    """ Get the options which select an output other than an object """
+    options = {
+        "-S": args.S,
+        "--ir": args.ir,
+        "--wasm": args.wasm,
+        "--pycode": args.pycode,
+    }
+    return [name for name, value in options.items() if value]
+
 
+def prepare_ir(ir_modules, reporter, args):
+    """ Optimize and instrument ir modules """
     # Optimize:
     for ir_module in ir_modules:
         api.optimize(ir_module, level=args.O, reporter=reporter)
@@ -59,6 +76,18 @@ def do_compile(ir_modules, march, reporter, args):
         for ir_module in ir_modules:
             add_tracer(ir_module)
 
+
+def make_object(ir_modules, march, reporter, args):
+    """ Generate an object from prepared ir modules """
+    return api.ir_to_object(
+        ir_modules, march, reporter=reporter, debug=args.g, jobs=args.jobs
+    )
+
+
+def do_compile(ir_modules, march, reporter, args):
+    """ Handle the proper output action """
+    prepare_ir(ir_modules, reporter, args)
+
     # TODO: what to do with the -c option? Add it here?
 
     # Generate output of choice:
@@ -70,7 +99,13 @@ def do_compile(ir_modules, march, reporter, args):
         with open(args.output, "w") as output:
             stream = TextOutputStream(printer=march.asm_printer, f=output)
             for ir_module in ir_modules:
-                api.ir_to_stream(ir_module, march, stream, reporter=reporter)
+                api.ir_to_stream(
+                    ir_module,
+                    march,
+                    stream,
+                    reporter=reporter,
+                    jobs=args.jobs,
+                )
     elif args.wasm:  # Output web-assembly code
         assert len(ir_modules) == 1
         ir_module = ir_modules[0]
@@ -81,9 +116,7 @@ def do_compile(ir_modules, march, reporter, args):
         with open(args.output, "w") as output:
             api.ir_to_python(ir_modules, output, reporter=reporter)
     else:  # Full object output
-        obj = api.ir_to_object(
-            ir_modules, march, reporter=reporter, debug=args.g
-        )
+        obj = make_object(ir_modules, march, reporter, args)
         with open(args.output, "w") as output:
             obj.save(output)
 
@@ -16,12 +16,12 @@ parser = argparse.ArgumentParser(
     parents=[base_parser, out_parser],
 )
 parser.add_argument(
-    "obj", type=argparse.FileType("r"), nargs="+", help="the object to link"
+    "obj", type=argparse.FileType("rb"), nargs="+", help="the object to link"
 )
 parser.add_argument(
     "--library",
     help="Add library to use when searching for symbols.",
-    type=argparse.FileType("r"),
+    type=argparse.FileType("rb"),
     action="append",
     default=[],
     metavar="library-filename",
@@ -44,6 +44,12 @@ parser.add_argument(
     action="store_true",
     default=False,
 )
+parser.add_argument(
+    "--format",
+    help="Object file format of relocatable output",
+    choices=["json", "binary"],
+    default="json",
+)
 parser.add_argument(
     "--entry",
     "-e",
@@ -63,10 +69,12 @@ def link(args=None):
             debug=args.g,
             partial_link=relocatable,
             entry=args.entry,
+            libraries=args.library,
         )
         if relocatable:
-            with open(args.output, "w") as output:
-                obj.save(output)
+            mode = "wb" if args.format == "binary" else "w"
+            with open(args.output, mode) as output:
+                obj.save(output, fmt=args.format)
         else:
             create_platform_executable(obj, args.output)
 
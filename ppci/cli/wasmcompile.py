@@ -9,6 +9,7 @@ from .base import base_parser, march_parser
 from .base import LogSetup, get_arch_from_args
 from .compile_base import compile_parser, do_compile
 from ..wasm import read_wasm, wasm_to_ir
+from ..wasm.intrinsics import supports_intrinsics
 
 
 parser = argparse.ArgumentParser(
@@ -33,6 +34,7 @@ def wasmcompile(args=None):
             wasm_module,
             march.info.get_type_info("ptr"),
             reporter=log_setup.reporter,
+            intrinsics=supports_intrinsics(march),
         )
 
         do_compile([ir_module], march, log_setup.reporter, log_setup.args)
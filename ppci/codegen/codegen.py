@@ -1,11 +1,19 @@
 """ Machine code generator.
 
 The architecture is provided when the generator is created.
+
+Code for the functions of a module can be generated in parallel. The
+functions are then generated in forked worker processes, and the
+instructions of each function are emitted in the order of the functions
+in the module. This gives the same output as generating the functions one
+after the other.
 """
 
+import io
 import logging
+import pickle
 from .. import ir
-from ..irutils import Verifier, split_block
+from ..irutils import Verifier, split_block, lower_jump_tables
 from ..arch.arch import Architecture
 from ..arch.generic_instructions import Label, Comment, Global, DebugData
 from ..arch.generic_instructions import RegisterUseDef, VirtualInstruction
@@ -17,6 +25,7 @@ from ..arch import data_instructions
 from ..arch.arch_info import Endianness
 from ..binutils.debuginfo import DebugType, DebugLocation, DebugDb
 from ..binutils.outstream import MasterOutputStream, FunctionOutputStream
+from ..utils.workers import can_fork, forked_pool, worker_state
 from .irdag import SelectionGraphBuilder
 from .instructionselector import InstructionSelector1
 from .instructionscheduler import InstructionScheduler
@@ -44,15 +53,23 @@ class CodeGenerator:
         self.instruction_selector = InstructionSelector1(
             arch, self.sgraph_builder, weights=selection_weights
         )
+        # Jump tables are used when the target can jump through them:
+        self.jump_tables = any(
+            pattern.tree.name == "JMPI" for pattern in arch.isa.patterns
+        )
         self.instruction_scheduler = InstructionScheduler()
         self.register_allocator = GraphColoringRegisterAllocator(
             arch, self.instruction_selector
         )
 
     def generate(
-        self, ircode: ir.Module, output_stream, reporter, debug=False
+        self, ircode: ir.Module, output_stream, reporter, debug=False, jobs=1
     ):
-        """ Generate machine code from ir-code into output stream """
+        """ Generate machine code from ir-code into output stream
+
+        When jobs is more than one, the functions are generated in parallel
+        by this amount of worker processes.
+        """
         assert isinstance(ircode, ir.Module)
         if ircode.debug_db:
             self.debug_db = ircode.debug_db
@@ -77,10 +94,16 @@ class CodeGenerator:
         # Munch program into a bunch of frames. One frame per function.
         # Each frame has a flat list of abstract instructions.
         output_stream.select_section("code")
-        for function in ircode.functions:
-            self.generate_function(
-                function, output_stream, reporter, debug=debug
+        if jobs > 1 and len(ircode.functions) > 1 and can_fork():
+            self.generate_functions_parallel(
+                ircode.functions, output_stream, reporter, debug, jobs
             )
+        else:
+            for index, function in enumerate(ircode.functions):
+                self.set_label_prefix(index)
+                self.generate_function(
+                    function, output_stream, reporter, debug=debug
+                )
 
         # Output debug type data:
         if debug:
@@ -145,6 +168,8 @@ class CodeGenerator:
         reporter.heading(3, "Log for {}".format(ir_function))
         reporter.dump_ir(ir_function)
 
+        lower_jump_tables(ir_function, jump_tables=self.jump_tables)
+
         # Split too large basic blocks in smaller chunks (for literal pools):
         # TODO: fix arbitrary number of 500. This works for arm and thumb..
         split_block_nr = 1
@@ -204,6 +229,35 @@ class CodeGenerator:
 
         reporter.dump_instructions(instruction_list, self.arch)
 
+    def set_label_prefix(self, index):
+        """ Number debug labels per function, so that the labels do not
+        depend on the process in which a function is generated.
+        """
+        self.debug_db.label_prefix = ".LDBG_{}_".format(index)
+        self.debug_db.label_nr = 0
+
+    def generate_functions_parallel(
+        self, functions, output_stream, reporter, debug, jobs
+    ):
+        """ Generate code for functions in a pool of worker processes.
+
+        The workers are forked, so they share the code generator and the
+        functions with this process. Only the generated instructions are
+        sent back. Per function reports are not available in this mode.
+        """
+        self.logger.info(
+            "Generating %s functions with %s jobs", len(functions), jobs
+        )
+        shared = shared_objects(self.debug_db)
+        state = (self, functions, debug, shared)
+        with forked_pool(min(jobs, len(functions)), state) as pool:
+            results = pool.imap(_generate_function_job, range(len(functions)))
+            for function, data in zip(functions, results):
+                instructions = load_instructions(data, shared)
+                output_stream.emit_all(instructions)
+                reporter.heading(3, "Log for {}".format(function))
+                reporter.dump_instructions(instructions, self.arch)
+
     def select_and_schedule(self, ir_function, frame, reporter):
         """ Perform instruction selection and scheduling """
         self.logger.debug("Selecting instructions")
@@ -321,3 +375,68 @@ class CodeGenerator:
 
         if value.binding == ir.Binding.GLOBAL:
             output_stream.emit(Global(value.name))
+
+
+def shared_objects(debug_db):
+    """ Get objects which must keep their identity between processes.
+
+    Instruction classes are sometimes created on the fly, and cannot be
+    pickled by name. Debug types are referred to by the debug info of
+    many functions. These objects are passed by their index in this list.
+    """
+    shared = []
+    classes = [Instruction]
+    while classes:
+        cls = classes.pop()
+        shared.append(cls)
+        classes.extend(cls.__subclasses__())
+    shared.extend(di for di in debug_db.infos if isinstance(di, DebugType))
+    return shared
+
+
+class InstructionPickler(pickle.Pickler):
+    """ Pickle instructions, with references to shared objects """
+
+    def __init__(self, f, shared):
+        super().__init__(f, pickle.HIGHEST_PROTOCOL)
+        self.shared_ids = {id(o): index for index, o in enumerate(shared)}
+
+    def persistent_id(self, obj):
+        return self.shared_ids.get(id(obj))
+
+
+class InstructionUnpickler(pickle.Unpickler):
+    """ Unpickle instructions, with references to shared objects """
+
+    def __init__(self, f, shared):
+        super().__init__(f)
+        self.shared = shared
+
+    def persistent_load(self, pid):
+        return self.shared[pid]
+
+
+def dump_instructions(instructions, shared):
+    f = io.BytesIO()
+    InstructionPickler(f, shared).dump(instructions)
+    return f.getvalue()
+
+
+def load_instructions(data, shared):
+    return InstructionUnpickler(io.BytesIO(data), shared).load()
+
+
+def _generate_function_job(index):
+    """ Generate code for a single function in a worker process """
+    from ..utils.reporting import DummyReportGenerator
+
+    code_generator, functions, debug, shared = worker_state()
+    code_generator.set_label_prefix(index)
+    instructions = []
+    code_generator.generate_function(
+        functions[index],
+        FunctionOutputStream(instructions.append),
+        DummyReportGenerator(),
+        debug=debug,
+    )
+    return dump_instructions(instructions, shared)
@@ -1,6 +1,14 @@
+""" Flow graph of machine instructions, used for liveness analysis.
+
+Liveness information is stored in bitsets. Each register in the flow graph
+is mapped to a dense index, and a set of registers is represented by an
+integer in which the bit at the index of a register is set.
+"""
+
+import heapq
 import logging
-from collections import defaultdict
 from ..graph.digraph import DiGraph, DiNode
+from ..utils.bitfun import iter_bits
 
 
 class FlowGraphNode(DiNode):
@@ -9,10 +17,10 @@ class FlowGraphNode(DiNode):
 
     def __init__(self, g, ins):
         super().__init__(g)
-        self.gen = set()
-        self.kill = set()
-        self.live_in = set()
-        self.live_out = set()
+        self.gen = 0
+        self.kill = 0
+        self.live_in = 0
+        self.live_out = 0
         self.instructions = []
 
         # Start with the instruction itself..
@@ -20,26 +28,46 @@ class FlowGraphNode(DiNode):
 
     def add_instruction(self, ins):
         """ Bundle the instruction into the current node. """
-        ins.gen = set(ins.used_registers)
-        ins.kill = set(ins.defined_registers)
+        ins.gen = self.graph.get_mask(ins.used_registers)
+        ins.kill = self.graph.get_mask(ins.defined_registers)
         self.instructions.append(ins)
 
         # Combine gen and kill effects of the node and the new instruction:
-        self.gen = self.gen | (ins.gen - self.kill)
+        self.gen = self.gen | (ins.gen & ~self.kill)
         self.kill = self.kill | ins.kill
 
+    def calculate_gen_kill(self):
+        """ Recalculate gen and kill sets, after instructions changed. """
+        instructions = self.instructions
+        self.gen = 0
+        self.kill = 0
+        self.instructions = []
+        for ins in instructions:
+            self.add_instruction(ins)
+
+    def calculate_instruction_liveness(self):
+        """ Propagate the live out set backwards through the instructions.
+        """
+        live = self.live_out
+        for ins in reversed(self.instructions):
+            ins.live_out = live
+            ins.live_in = live = ins.gen | (live & ~ins.kill)
+
     def __repr__(self):
         r = "CFG-node({})".format(len(self.instructions))
         return r
 
     @property
     def longrepr(self):
+        registers = self.graph.get_registers
         r = str(self)
         if self.gen:
-            r += " gen:" + ", ".join(str(u) for u in self.gen)
+            r += " gen:" + ", ".join(str(u) for u in registers(self.gen))
         if self.kill:
-            r += " kill:" + ", ".join(str(d) for d in self.kill)
-        r += " live_out={}, live_in={}".format(self.live_out, self.live_in)
+            r += " kill:" + ", ".join(str(d) for d in registers(self.kill))
+        r += " live_out={}, live_in={}".format(
+            registers(self.live_out), registers(self.live_in)
+        )
         r += ", Succ={}, Pred={}".format(self.successors, self.predecessors)
         return r
 
@@ -52,7 +80,9 @@ class FlowGraph(DiGraph):
         super().__init__()
         self.logger = logging.getLogger("flowgraph")
         self._map = {}
-        self._live_ranges = defaultdict(list)
+        self._ins_map = {}  # Mapping from instruction to node
+        self._register_index = {}
+        self.registers = []  # Registers by index
 
         # TODO: make this very tricky part of code better readable!!!
 
@@ -89,6 +119,7 @@ class FlowGraph(DiGraph):
                 # Node is not a leader, make sure we passed a leader already:
                 assert node is not None
                 node.add_instruction(ins)
+            self._ins_map[ins] = node
 
     def has_node(self, ins):
         """ Return true if statement is a leader instruction """
@@ -102,7 +133,82 @@ class FlowGraph(DiGraph):
             self.add_node(node)
         return self._map[ins]
 
-    # def live_range(
+    def find_node(self, ins):
+        """ Get the node which contains the given instruction """
+        return self._ins_map[ins]
+
+    def insert_code_before(self, instruction, code):
+        """ Insert a code sequence before an instruction.
+
+        The code must not contain jumps. Returns the node in which the
+        code was inserted.
+        """
+        node = self._ins_map[instruction]
+        pt = node.instructions.index(instruction)
+        node.instructions[pt:pt] = code
+        for ins in code:
+            self._ins_map[ins] = node
+        return node
+
+    def insert_code_after(self, instruction, code):
+        """ Insert a code sequence after an instruction.
+
+        The code must not contain jumps. Returns the node in which the
+        code was inserted.
+        """
+        node = self._ins_map[instruction]
+        pt = node.instructions.index(instruction) + 1
+        node.instructions[pt:pt] = code
+        for ins in code:
+            self._ins_map[ins] = node
+        return node
+
+    def get_index(self, register):
+        """ Get the index of a register, assigning a new one if required """
+        index = self._register_index.get(register, None)
+        if index is None:
+            index = len(self.registers)
+            self._register_index[register] = index
+            self.registers.append(register)
+        return index
+
+    def get_mask(self, registers):
+        """ Get the bitset for a collection of registers """
+        mask = 0
+        for register in registers:
+            mask |= 1 << self.get_index(register)
+        return mask
+
+    def get_registers(self, mask):
+        """ Get a list of the registers in the given bitset """
+        return [self.registers[index] for index in iter_bits(mask)]
+
+    def postorder(self):
+        """ Get the nodes in post order, starting at the entry node.
+
+        Nodes which are not reachable from the entry are appended.
+        """
+        visited = set()
+        order = []
+        for root in self.nodes:
+            if root in visited:
+                continue
+            visited.add(root)
+            stack = [(root, iter(self.successors(root)))]
+            while stack:
+                node, successors = stack[-1]
+                for successor in successors:
+                    if successor not in visited:
+                        visited.add(successor)
+                        stack.append(
+                            (successor, iter(self.successors(successor)))
+                        )
+                        break
+                else:
+                    stack.pop()
+                    order.append(node)
+        return order
+
     def calculate_liveness(self):
         """ Calculate liveness in CFG: """
         ###
@@ -111,52 +217,103 @@ class FlowGraph(DiGraph):
         #  out[n] = for s in n.succ in union in[s]
         ###
         for node in self:
-            node.live_in = set()
-            node.live_out = set()
+            node.live_in = 0
+            node.live_out = 0
 
-        # Sort flowgraph nodes backwards:
-        cfg_nodes = list(self.nodes)
+        # Visit nodes in post order, such that successors are visited
+        # before their predecessors. The worklist is a heap of positions
+        # in this order.
+        order = self.postorder()
+        position = {node: i for i, node in enumerate(order)}
+        successors = [list(self.successors(node)) for node in order]
+        predecessors = [
+            [position[p] for p in self.predecessors(node)] for node in order
+        ]
+        worklist = list(range(len(order)))
+        queued = [True] * len(order)
 
-        # Dataflow fixed point iteration over the nodes in the CFG:
+        # Dataflow worklist iteration over the nodes in the CFG:
         n_iterations = 0
-        change = True
-        while change:
-            change = False
-            for node in cfg_nodes:
-                _in = node.live_in
-                _out = node.live_out
-                node.live_in = node.gen | (node.live_out - node.kill)
-                if node.successors:
-                    node.live_out = set.union(
-                        *(s.live_in for s in node.successors)
-                    )
-                else:
-                    node.live_out = set()
-
-                # Record for change:
-                change = (
-                    change or (_in != node.live_in) or (_out != node.live_out)
-                )
+        while worklist:
+            i = heapq.heappop(worklist)
+            queued[i] = False
             n_iterations += 1
+            node = order[i]
+            live_out = 0
+            for successor in successors[i]:
+                live_out |= successor.live_in
+            node.live_out = live_out
+            live_in = node.gen | (live_out & ~node.kill)
+            if live_in != node.live_in:
+                node.live_in = live_in
+                for j in predecessors[i]:
+                    if not queued[j]:
+                        queued[j] = True
+                        heapq.heappush(worklist, j)
 
         # In one pass fix all instructions:
         for node in self:
             assert len(node.instructions) > 0
-            ins2 = node.instructions[-1]
-            ins2.live_out = node.live_out  # Propagate into last instruction
-            ins2.live_in = ins2.gen | (ins2.live_out - ins2.kill)
-            if len(node.instructions) > 1:
-                for ins in reversed(node.instructions[:-1]):
-                    ins1 = ins
+            node.calculate_instruction_liveness()
+
+        self.logger.debug(
+            "Iterations: %s,  nodes: %s", n_iterations, len(self)
+        )
 
-                    ins1.live_out = ins2.live_in
-                    ins1.live_in = ins1.gen | (ins1.live_out - ins1.kill)
+    def update_liveness(self, registers, modified_nodes):
+        """ Update liveness after a local modification of the code.
 
-                    for vreg in ins2.live_in & ins1.live_out:
-                        self._live_ranges[vreg].append((ins1, ins2))
+        Liveness of each register can be determined independent of other
+        registers. Only the liveness of the given registers is calculated
+        again, the liveness of other registers is retained.
 
-                    ins2 = ins1
+        Args:
+            registers: The bitset of registers whose liveness may have
+                changed. This must include all registers which are used or
+                defined by modified instructions, as well as registers
+                which were removed from the code.
+            modified_nodes: The nodes of which instructions were inserted
+                or changed.
+
+        Returns:
+            A list with instructions of which liveness information was
+            updated.
+        """
+        for node in modified_nodes:
+            node.calculate_gen_kill()
+
+        # Dataflow analysis, restricted to the given registers:
+        gen = {node: node.gen & registers for node in self}
+        kill = {node: node.kill & registers for node in self}
+        live_in = {node: 0 for node in self}
+        live_out = {node: 0 for node in self}
+        worklist = [node for node in self if gen[node]]
+        n_iterations = 0
+        while worklist:
+            node = worklist.pop()
+            n_iterations += 1
+            live_in[node] = gen[node] | (live_out[node] & ~kill[node])
+            for predecessor in node.predecessors:
+                if live_in[node] & ~live_out[predecessor]:
+                    live_out[predecessor] |= live_in[node]
+                    worklist.append(predecessor)
+
+        # Merge into the existing liveness information:
+        instructions = []
+        for node in self:
+            if (node in modified_nodes) or (
+                node.live_out & registers != live_out[node]
+            ):
+                node.live_out = (node.live_out & ~registers) | live_out[node]
+                node.calculate_instruction_liveness()
+                node.live_in = node.instructions[0].live_in
+                instructions.extend(node.instructions)
 
         self.logger.debug(
-            "Iterations: %s,  nodes: %s", n_iterations, len(self)
+            "Updated liveness of %s registers in %s iterations,"
+            " %s instructions updated",
+            bin(registers).count("1"),
+            n_iterations,
+            len(instructions),
         )
+        return instructions
@@ -43,6 +43,8 @@ operations are listed in the below table:
 +---------------+---------+-----------------------------------------+
 | CJMP          | I,U     | Conditional jump to a label             |
 +---------------+---------+-----------------------------------------+
+| JMPI(c0)      |         | Jump to address c0, via a jump table    |
++---------------+---------+-----------------------------------------+
 
 ...
 
@@ -56,6 +58,8 @@ Memory move operations:
 
 import abc
 import logging
+from collections import namedtuple
+from functools import lru_cache
 from ..utils.tree import Tree
 from .treematcher import State
 from .. import ir
@@ -80,7 +84,8 @@ ops = [
     "AND",
     "XOR",  # bitwise stuff
     "NEG",
-    "INV",  # Unary operations
+    "INV",
+    "SQRT",  # Unary operations
     "MOV",
     "REG",
     "LDR",
@@ -108,6 +113,7 @@ terminals = tuple(x + y for x in ops for y in data_types) + (
     "LABEL",
     "MOVB",  # Attempts at blob data copies
     "JMP",
+    "JMPI",  # Indirect jump through a jump table
     "EXIT",
     "ENTRY",
     "ALLOCA",
@@ -152,10 +158,77 @@ class InstructionContext(ContextInterface):
 
 
 class TreeSelector:
-    """ Tree matcher that can match a tree and generate instructions """
+    """ Tree matcher that can match a tree and generate instructions.
+
+    The rules of the burg system are compiled into a matcher once, when
+    the selector is created. For each rule, a function is made that tests
+    the terminals in its tree pattern, and a function that extracts the
+    kid trees. Also, the chain rules which follow from each rule are
+    collected up front, so labeling a tree does not need to walk the
+    patterns of the rules.
+    """
 
     def __init__(self, sys):
         self.sys = sys
+        self.matchers = {}
+        self.by_nr = {}
+        for rule in sys.rules:
+            matcher = self.compile_rule(rule)
+            self.by_nr[rule.nr] = matcher
+            self.matchers.setdefault(rule.tree.name, []).append(matcher)
+
+    def compile_rule(self, rule):
+        """ Create a matcher for a single rule """
+        test = self.compile_test(rule.tree, "t")
+        if test:
+            test = compile_lambda(" and ".join(test))
+        else:
+            test = None
+        kids = self.compile_kids(rule.tree, "t")
+        if kids:
+            kids = compile_lambda("({},)".format(", ".join(kids)))
+        else:
+            kids = no_kids
+        nts = tuple(self.sys.get_nts(rule.tree))
+        closure = []
+        self.chain_closure(rule, 0, set(), closure)
+        return RuleMatcher(
+            rule.nr, rule.acceptance, test, kids, nts, tuple(closure)
+        )
+
+    def compile_test(self, template_tree, prefix):
+        """ Create tests for the terminals below the root of a pattern """
+        tests = []
+        for index, child in enumerate(template_tree.children):
+            if child.name in self.sys.terminals:
+                child_prefix = "{}.children[{}]".format(prefix, index)
+                test = '{}.name == "{}"'.format(child_prefix, child.name)
+                tests.append(test)
+                tests.extend(self.compile_test(child, child_prefix))
+        return tests
+
+    def compile_kids(self, template_tree, prefix):
+        """ Create expressions for the kid trees of a pattern """
+        if template_tree.name in self.sys.non_terminals:
+            return [prefix]
+        kids = []
+        for index, child in enumerate(template_tree.children):
+            child_prefix = "{}.children[{}]".format(prefix, index)
+            kids.extend(self.compile_kids(child, child_prefix))
+        return kids
+
+    def chain_closure(self, rule, cost, marked_rules, closure):
+        """ Determine the goals which are reached when a rule matches.
+
+        This results in tuples of goal, cost on top of the cost of the kids
+        and rule number, in the order in which they must be set.
+        """
+        cost = cost + rule.cost
+        closure.append((rule.non_term, cost, rule.nr))
+        marked_rules.add(rule)
+        for cr in self.sys.chain_rules_for_nt(rule.non_term):
+            if cr not in marked_rules:
+                self.chain_closure(cr, cost, marked_rules, closure)
 
     def gen(self, context, tree):
         """ Generate code for a given tree. The tree will be tiled with
@@ -174,46 +247,36 @@ class TreeSelector:
 
         # Now the child nodes have been labeled, assign a state to the tree:
         tree.state = State()
+        labels = tree.state.labels
 
         # Check all rules for matching with this subtree and
         # check if a state can be determined
-        for rule in self.sys.get_rules_for_root(tree.name):
-            if self.sys.tree_terminal_equal(tree, rule.tree):
-                nts = self.nts(rule.nr)
-                kids = self.kids(tree, rule.nr)
-
-                # Check for acceptance:
-                if rule.acceptance:
-                    accept = rule.acceptance(tree)
-                else:
-                    accept = True
-
-                if (
-                    all(x.state.has_goal(y) for x, y in zip(kids, nts))
-                    and accept
-                ):
-                    cost = sum(x.state.get_cost(y) for x, y in zip(kids, nts))
-                    marked_rules = set()
-                    self.mark_tree(tree, rule, cost, marked_rules)
-
-    def mark_tree(self, tree, rule, cost, marked_rules):
-        cost = cost + rule.cost
-        tree.state.set_cost(rule.non_term, cost, rule.nr)
-        marked_rules.add(rule)
-
-        # Also set cost for chain rules here:
-        for cr in self.sys.chain_rules_for_nt(rule.non_term):
-            if cr not in marked_rules:
-                self.mark_tree(tree, cr, cost, marked_rules)
+        for matcher in self.matchers.get(tree.name, ()):
+            if matcher.test and not matcher.test(tree):
+                continue
+
+            # Determine the cost of the kids, if they can be matched:
+            cost = 0
+            for kid, nt in zip(matcher.kids(tree), matcher.nts):
+                label = kid.state.labels.get(nt)
+                if label is None:
+                    break
+                cost += label[0]
+            else:
+                if matcher.acceptance and not matcher.acceptance(tree):
+                    continue
+                for goal, rule_cost, nr in matcher.closure:
+                    label = labels.get(goal)
+                    if label is None or label[0] > cost + rule_cost:
+                        labels[goal] = (cost + rule_cost, nr)
 
     def apply_rules(self, context, tree, goal):
         """ Apply all selected instructions to the tree """
         rule = tree.state.get_rule(goal)
+        matcher = self.by_nr[rule]
         results = [
             self.apply_rules(context, kid_tree, kid_goal)
-            for kid_tree, kid_goal in zip(
-                self.kids(tree, rule), self.nts(rule)
-            )
+            for kid_tree, kid_goal in zip(matcher.kids(tree), matcher.nts)
         ]
         # Get the function to call:
         rule_f = self.sys.get_rule(rule).template
@@ -224,13 +287,30 @@ class TreeSelector:
 
     def kids(self, tree, rule):
         """ Determine the kid trees for a rule """
-        template_tree = self.sys.get_rule(rule).tree
-        return self.sys.get_kids(tree, template_tree)
+        return list(self.by_nr[rule].kids(tree))
 
     def nts(self, rule):
         """ Get the open ends of this rules pattern """
-        template_tree = self.sys.get_rule(rule).tree
-        return self.sys.get_nts(template_tree)
+        return list(self.by_nr[rule].nts)
+
+
+RuleMatcher = namedtuple(
+    "RuleMatcher", ["nr", "acceptance", "test", "kids", "nts", "closure"]
+)
+
+
+def no_kids(tree):
+    return ()
+
+
+@lru_cache(maxsize=None)
+def compile_lambda(expression):
+    """ Compile a function of a tree t from an expression.
+
+    Many rules, also of different architectures, have the same tree shape,
+    so these functions are shared.
+    """
+    return eval("lambda t: " + expression)
 
 
 class InstructionSelector1:
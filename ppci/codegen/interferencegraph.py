@@ -3,6 +3,9 @@
 .. autoclass:: ppci.codegen.interferencegraph.InterferenceGraph
     :members: get_node, combine, interfere
 
+.. autoclass:: ppci.codegen.interferencegraph.InterferenceTable
+    :members: add_interference, remove_register
+
 """
 
 import logging
@@ -10,6 +13,7 @@ from collections import defaultdict
 from ..graph.graph import Node
 from ..graph.maskable_graph import MaskableGraph
 from ..arch.registers import Register
+from ..utils.bitfun import iter_bits
 
 
 class InterferenceGraphNode(Node):
@@ -32,6 +36,88 @@ class InterferenceGraphNode(Node):
         )
 
 
+class InterferenceTable:
+    """ Interference relation of the registers in a flowgraph.
+
+    Registers are identified by their index in the flowgraph, and the
+    registers interfering with a register are stored as a bitset.
+    The table is not modified during coloring, and can be updated
+    when the code changes.
+    """
+
+    def __init__(self, flowgraph):
+        self.flowgraph = flowgraph
+        self.present = 0  # Bitset of registers in the table
+        self.adjecent = defaultdict(int)
+        self.def_map = defaultdict(list)
+        self.use_map = defaultdict(list)
+
+    def calculate_interference(self):
+        """ Calculate interference of all instructions in the flowgraph """
+        for n in self.flowgraph:
+            for ins in n.instructions:
+                self.add_interference(ins)
+                self.add_usage(ins)
+
+    def add_interference(self, ins, registers=None):
+        """ Add the interference caused by a single instruction.
+
+        When a bitset of registers is given, only interference of these
+        registers is added.
+        """
+        # Live out and zero length defined variables:
+        live_and_def = ins.live_out | ins.kill
+        self.present |= ins.live_in | live_and_def
+
+        if registers is None:
+            sources = live_and_def
+        else:
+            sources = live_and_def & registers
+
+        if sources:
+            # Add clobbered interfering edges:
+            if ins.clobbers:
+                clobbers = self.flowgraph.get_mask(ins.clobbers)
+                self.present |= clobbers
+                interfering = live_and_def | clobbers
+            else:
+                interfering = live_and_def
+
+            # Add interfering edges:
+            adjecent = self.adjecent
+            for index in iter_bits(sources):
+                adjecent[index] |= interfering
+
+    def add_usage(self, ins, registers=None):
+        """ Record usage of registers by the given instruction.
+
+        When a collection of registers is given, only usage of these
+        registers is recorded.
+        """
+        for reg in ins.defined_registers:
+            if registers is None or reg in registers:
+                self.def_map[reg].append(ins)
+        for reg in ins.used_registers:
+            if registers is None or reg in registers:
+                self.use_map[reg].append(ins)
+
+    def has_register(self, register):
+        """ Check if the register is present in this table """
+        index = self.flowgraph.get_index(register)
+        return bool(self.present & (1 << index))
+
+    def remove_register(self, register):
+        """ Remove a register and all of its interference """
+        index = self.flowgraph.get_index(register)
+        mask = ~(1 << index)
+        self.present &= mask
+        self.adjecent.pop(index, None)
+        for other, adjecent in self.adjecent.items():
+            self.adjecent[other] = adjecent & mask
+        self.def_map.pop(register, None)
+        self.use_map.pop(register, None)
+
+
 class InterferenceGraph(MaskableGraph):
     """ Interference graph. """
 
@@ -51,32 +137,30 @@ class InterferenceGraph(MaskableGraph):
 
     def calculate_interference(self, flowgraph):
         """ Construct interference graph """
-        for n in flowgraph:
-            for ins in n.instructions:
-                # ins.live_out |= ins.
-                for tmp in ins.live_in:
-                    self.get_node(tmp)
-
-                # Live out and zero length defined variables:
-                live_and_def = ins.live_out | ins.kill
-
-                # Add interfering edges:
-                for tmp in live_and_def:
-                    n1 = self.get_node(tmp)
-                    for tmp2 in live_and_def - {tmp}:
-                        n2 = self.get_node(tmp2)
-                        self.add_edge(n1, n2)
-
-                    # Add clobbered interfering edges:
-                    for tmp2 in ins.clobbers:
-                        n2 = self.get_node(tmp2)
-                        self.add_edge(n1, n2)
-
-                # Generate usage info:
-                for reg in ins.defined_registers:
-                    self._def_map[reg].append(ins)
-                for reg in ins.used_registers:
-                    self._use_map[reg].append(ins)
+        table = InterferenceTable(flowgraph)
+        table.calculate_interference()
+        self.add_table(table)
+
+    def add_table(self, table):
+        """ Create nodes and edges from an interference table.
+
+        Usage information is shared with the table.
+        """
+        registers = table.flowgraph.registers
+        nodes = {}
+        for index in iter_bits(table.present):
+            nodes[index] = self.get_node(registers[index])
+
+        adj_map = self.adj_map
+        for index, mask in table.adjecent.items():
+            n1 = nodes[index]
+            for other in iter_bits(mask & ~(1 << index)):
+                n2 = nodes[other]
+                adj_map[n1].add(n2)
+                adj_map[n2].add(n1)
+
+        self._def_map = table.def_map
+        self._use_map = table.use_map
 
     def has_node(self, tmp):
         """ Check if there exists a node for this temp register """
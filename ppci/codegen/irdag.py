@@ -286,6 +286,56 @@ class SelectionGraphBuilder:
         self.chain(sgnode)
         self.debug_db.map(node, sgnode)
 
+    def do_jump_table(self, node):
+        """ Process jump table into dag.
+
+        Jump tables are lowered before instruction selection, so the table
+        contains every value in its range, and the value is known to be in
+        this range. Each entry of the table is a 32 bit offset from the
+        entry to the label of the block.
+        """
+        first = node.values[0]
+        assert node.values == list(range(first, first + len(node.values)))
+        ty = node.v.ty
+        index = self.get_value(node.v)
+        if first != 0:
+            index = self.new_node(
+                "SUB", ty, index, self.new_const(ty, first)
+            ).new_output("index")
+        if ty is not self.ptr_ty:
+            index = self.new_node(
+                "{}TO".format(str(ty).upper()), ir.ptr, index
+            ).new_output("index")
+        offset = self.new_node(
+            "SHL", ir.ptr, index, self.new_const(ir.ptr, 2)
+        ).new_output("offset")
+        table_name = self.function_info.frame.new_name("jump_table")
+        table = self.new_node("LABEL", ir.ptr, value=table_name)
+        entry = self.new_node(
+            "ADD", ir.ptr, table.new_output("table"), offset
+        ).new_output("entry")
+        load = self.new_node("LDR", ir.i32, entry)
+        self.chain(load)
+        distance = load.new_output("distance")
+        if self.ptr_ty.size != 4:
+            # Convert the signed offset to the size of a pointer:
+            offset_ty = {2: ir.i16, 8: ir.i64}[self.ptr_ty.size]
+            distance = self.new_node("I32TO", offset_ty, distance).new_output(
+                "distance"
+            )
+        target = self.new_node("ADD", ir.ptr, entry, distance)
+        labels = [self.function_info.label_map[b] for _, b in node.table]
+        sgnode = self.new_node("JMPI", None, target.new_output("target"))
+        sgnode.value = (table_name, labels)
+        self.chain(sgnode)
+        self.debug_db.map(node, sgnode)
+
+    def new_const(self, ty, value):
+        """ Create a constant which is used as an operand """
+        output = self.new_node("CONST", ty, value=value).new_output("const")
+        output.wants_vreg = False
+        return output
+
     def do_exit(self, node):
         # Jump to epilog:
         sgnode = self.new_node("JMP", None)
@@ -408,7 +458,7 @@ class SelectionGraphBuilder:
 
     def do_unop(self, node):
         """ Visit an unary operator and create a DAG node """
-        names = {"-": "NEG", "~": "INV"}
+        names = {"-": "NEG", "~": "INV", "sqrt": "SQRT"}
         op = names[node.operation]
         a = self.get_value(node.a)
         sgnode = self.new_node(op, node.ty, a)
@@ -77,6 +77,12 @@ effect on the colorability of the graph.
 
 **Spilling**
 
+When no color can be found for a node, its value is placed in memory, and
+load and store instructions are inserted around each use and definition.
+Since liveness of a register can be determined independent of other
+registers, only liveness and interference of the registers involved in
+the spill code are recalculated, instead of those of the whole frame.
+
 **Iterated register coalescing**
 
 Iterated register coalescing (IRC) is a combination of graph coloring,
@@ -116,7 +122,7 @@ import logging
 from functools import lru_cache
 from collections import defaultdict
 from .flowgraph import FlowGraph
-from .interferencegraph import InterferenceGraph
+from .interferencegraph import InterferenceGraph, InterferenceTable
 from ..arch.arch import Architecture, Frame
 from ..arch.registers import Register
 from ..utils.tree import Tree
@@ -207,6 +213,10 @@ class GraphColoringRegisterAllocator:
     logger = logging.getLogger("regalloc")
     verbose = False  # Set verbose to True to get more logging info
 
+    # Update liveness and interference only around spill code, instead
+    # of recalculating them for the whole frame after each spill:
+    incremental = True
+
     def __init__(self, arch: Architecture, instruction_selector):
         assert isinstance(arch, Architecture), arch
         self.arch = arch
@@ -255,7 +265,10 @@ class GraphColoringRegisterAllocator:
             elif self.spill_worklist:
                 self.spill()
                 self.logger.debug("Starting over")
-                self.init_data(frame)
+                if self.incremental:
+                    self.update_data()
+                else:
+                    self.init_data(frame)
             else:
                 break  # Done!
         self.logger.debug("Now assinging colors")
@@ -282,14 +295,54 @@ class GraphColoringRegisterAllocator:
         """ Initialize data structures """
         self.frame = frame
 
-        cfg = FlowGraph(self.frame.instructions)
+        self.cfg = FlowGraph(self.frame.instructions)
+        self.frame.cfg = self.cfg
         self.logger.debug(
-            "Constructed flowgraph with %s nodes", len(cfg.nodes)
+            "Constructed flowgraph with %s nodes", len(self.cfg.nodes)
         )
 
-        cfg.calculate_liveness()
+        self.cfg.calculate_liveness()
+
+        # Keep the interference in a table, which is not modified during
+        # coloring. The graph used for coloring is created from this table.
+        self.interference = InterferenceTable(self.cfg)
+        self.interference.calculate_interference()
+        self.init_worklists()
+
+    def update_data(self):
+        """ Update data structures after spill code was inserted.
+
+        Liveness and interference are updated for the registers involved
+        in the spilling only.
+        """
+        new_code = set(self.spill_code)
+        registers = set(self.spilled_temps)
+        for ins in new_code:
+            registers.update(ins.registers)
+        new_registers = {
+            r for r in registers if not self.interference.has_register(r)
+        }
+        mask = self.cfg.get_mask(registers)
+
+        instructions = self.cfg.update_liveness(mask, self.spill_nodes)
+
+        for tmp in self.spilled_temps:
+            self.interference.remove_register(tmp)
+
+        for ins in instructions:
+            if ins in new_code:
+                self.interference.add_interference(ins)
+                self.interference.add_usage(ins)
+            else:
+                self.interference.add_interference(ins, mask)
+                self.interference.add_usage(ins, new_registers)
+
+        self.init_worklists()
+
+    def init_worklists(self):
+        """ Create a fresh interference graph and fill the worklists """
         self.frame.ig = InterferenceGraph()
-        self.frame.ig.calculate_interference(cfg)
+        self.frame.ig.add_table(self.interference)
         self.logger.debug(
             "Constructed interferencegraph with %s nodes",
             len(self.frame.ig.nodes),
@@ -627,6 +680,10 @@ class GraphColoringRegisterAllocator:
         slot = self.frame.alloc(size, alignment)
         self.logger.debug("Allocating stack slot %s", slot)
         # TODO: maybe break-up coalesced node before doing this?
+        # Keep track of the changes, for incremental updating:
+        self.spilled_temps = list(node.temps)
+        self.spill_code = []
+        self.spill_nodes = set()
         for tmp in node.temps:
             instructions = OrderedSet(
                 self.frame.ig.uses(tmp) + self.frame.ig.defs(tmp)
@@ -635,12 +692,17 @@ class GraphColoringRegisterAllocator:
                 vreg2 = self.frame.new_reg(type(tmp))
                 self.logger.debug("tmp: %s, new: %s", tmp, vreg2)
                 instruction.replace_register(tmp, vreg2)
+                self.spill_nodes.add(self.cfg.find_node(instruction))
                 if instruction.reads_register(vreg2):
                     code = self.spill_gen.gen_load(self.frame, vreg2, slot)
                     self.frame.insert_code_before(instruction, code)
+                    self.cfg.insert_code_before(instruction, code)
+                    self.spill_code.extend(code)
                 if instruction.writes_register(vreg2):
                     code = self.spill_gen.gen_store(self.frame, vreg2, slot)
                     self.frame.insert_code_after(instruction, code)
+                    self.cfg.insert_code_after(instruction, code)
+                    self.spill_code.extend(code)
 
     def assign_colors(self):
         """ Add nodes back to the graph to color it. """
@@ -11,6 +11,7 @@ Functions present:
 """
 
 import logging
+from .. import ir
 
 # TODO: this is possibly the third edition of flow graph code.. Merge at will!
 from .digraph import DiGraph, DiNode
@@ -64,7 +65,7 @@ def ir_function_to_graph(ir_function):
                 node.add_edge(successor_node)
 
             # TODO: hack to store yes and no blocks:
-            if len(block.successors) == 2:
+            if isinstance(block.last_instruction, ir.CJump):
                 node.yes = block_map[block.last_instruction.lab_yes]
                 node.no = block_map[block.last_instruction.lab_no]
 
@@ -894,7 +894,7 @@ class ProcedureCall(Instruction):
 class Unop(LocalValue):
     """ Generic unary operation """
 
-    ops = ["-", "~"]  # someday perhaps: 'floor', 'sqrt'
+    ops = ["-", "~", "sqrt"]
     a = value_use("a")
 
     def __init__(self, operation, a, name, ty):
@@ -1246,9 +1246,12 @@ class JumpBase(FinalInstruction):
 
     def delete(self):
         """ Clear references """
+        super().delete()
         while self._block_map:
             _, block = self._block_map.popitem()
-            block.references.remove(self)
+            # A block may be targeted more than once:
+            if block not in self._block_map.values():
+                block.references.remove(self)
 
     @property
     def targets(self):
@@ -1307,6 +1310,10 @@ class CJump(JumpBase):
 class JumpTable(JumpBase):
     """ Jump table.
 
+    Jumps to the block of the value in the table, or to the default block
+    when the value is not in the table. The table is a list of pairs of
+    an integer value and a block.
+
     In the worst case, this is expanded to a whole bunch of CJump statements.
     """
 
@@ -1316,9 +1323,33 @@ class JumpTable(JumpBase):
     def __init__(self, v, table, default):
         super().__init__()
         self.v = v
-        self.table = table
+        self.values = []
+        for value, block in table:
+            if not isinstance(value, int):
+                raise TypeError("Expected int, got {}".format(value))
+            self.set_target_block(len(self.values), block)
+            self.values.append(value)
+        if len(set(self.values)) != len(self.values):
+            raise ValueError("Duplicate values in jump table")
         self.lab_default = default
-        raise NotImplementedError("TODO")
+
+    @property
+    def table(self):
+        """ Get the pairs of values and blocks in this table """
+        return [
+            (value, self._block_map[index])
+            for index, value in enumerate(self.values)
+        ]
+
+    @property
+    def targets(self):
+        """ Gets the blocks this instruction jumps to, each only once """
+        return list(OrderedSet(self._block_map.values()))
 
     def __str__(self):
-        return "jmp_table {}".format(self.v.name)
+        table = ", ".join(
+            "{}: {}".format(value, block.name) for value, block in self.table
+        )
+        return "jmp_table {} ? [{}] : {}".format(
+            self.v.name, table, self.lab_default.name
+        )
@@ -8,6 +8,7 @@ from .builder import Builder, split_block
 from .link import ir_link
 from .io import to_json, from_json
 from .instrument import add_tracer
+from .jumptable import lower_jump_tables
 
 __all__ = [
     "Builder",
@@ -22,4 +23,5 @@ __all__ = [
     "to_json",
     "from_json",
     "add_tracer",
+    "lower_jump_tables",
 ]
@@ -0,0 +1,155 @@
+""" Lowering of jump tables.
+
+The values of a jump table are split into clusters. A cluster is either a
+single value, or a range of values which is dense enough to remain a
+jump table. A code generator can turn such a jump table into an indirect
+jump through a table of addresses.
+
+The clusters are selected by a balanced binary search, so a value is
+found with a logarithmic number of comparisons, instead of one comparison
+per value.
+"""
+
+from .. import ir
+from ..utils.bitfun import correct
+
+
+def lower_jump_tables(
+    function, jump_tables=True, min_size=4, min_density=0.4
+):
+    """ Lower the jump table instructions of the given function.
+
+    When jump_tables is false, all values are selected with comparisons.
+    Otherwise, ranges of at least min_size values which fill at least
+    min_density of the range remain jump tables. These jump tables
+    contain every value in their range, and are only reached with a value
+    in this range.
+    """
+    for block in list(function):
+        if isinstance(block.last_instruction, ir.JumpTable):
+            lowering = JumpTableLowering(
+                block.last_instruction, jump_tables, min_size, min_density
+            )
+            lowering.lower()
+
+
+class JumpTableLowering:
+    """ Replace a single jump table by a search over its values """
+
+    max_chain = 3
+
+    def __init__(self, instruction, jump_tables, min_size, min_density):
+        self.instruction = instruction
+        self.jump_tables = jump_tables
+        self.min_size = min_size
+        self.min_density = min_density
+        self.value = instruction.v
+        self.default = instruction.lab_default
+        self.block = instruction.block
+        self.predecessors = {}
+
+    def lower(self):
+        ty = self.value.ty
+        cases = {}
+        for value, target in self.instruction.table:
+            if ty.is_integer:
+                value = correct(value, ty.bits, ty.is_signed)
+            cases.setdefault(value, target)
+        clusters = self.make_clusters(sorted(cases.items()))
+
+        targets = self.instruction.targets
+        self.block.remove_instruction(self.instruction)
+        self.instruction.delete()
+        self.gen_search(self.block, clusters, None, None)
+
+        # The targets are now jumped to from the new blocks:
+        for target in targets:
+            target.replace_incoming(
+                self.block, self.predecessors.get(target, [])
+            )
+
+    def make_clusters(self, cases):
+        """ Split the sorted cases into clusters """
+        clusters = []
+        start = 0
+        while start < len(cases):
+            end = start + 1
+            if self.jump_tables:
+                # Find the largest range which is dense enough:
+                low = cases[start][0]
+                for count in range(self.min_size, len(cases) - start + 1):
+                    span = cases[start + count - 1][0] - low + 1
+                    if count >= self.min_density * span:
+                        end = start + count
+            clusters.append(cases[start:end])
+            start = end
+        return clusters
+
+    def gen_search(self, block, clusters, low, high):
+        """ Select among the clusters.
+
+        The value is known to be in the range low to high, where None
+        means that there is no bound.
+        """
+        if len(clusters) <= self.max_chain:
+            for cluster in clusters[:-1]:
+                next_block = self.new_block()
+                self.gen_cluster(block, cluster, low, high, next_block)
+                block = next_block
+            self.gen_cluster(block, clusters[-1], low, high, self.default)
+        else:
+            middle = len(clusters) // 2
+            pivot = clusters[middle][0][0]
+            lower_block = self.new_block()
+            upper_block = self.new_block()
+            self.compare(block, "<", pivot, lower_block, upper_block)
+            self.gen_search(lower_block, clusters[:middle], low, pivot - 1)
+            self.gen_search(upper_block, clusters[middle:], pivot, high)
+
+    def gen_cluster(self, block, cluster, low, high, miss_block):
+        """ Jump to the target of the value in the cluster, or else to the
+        miss block. """
+        first, last = cluster[0][0], cluster[-1][0]
+        if len(cluster) == 1:
+            target = cluster[0][1]
+            if low == high == first:
+                self.jump(block, ir.Jump(target))
+            else:
+                self.compare(block, "==", first, target, miss_block)
+        else:
+            if low is None or low < first:
+                table_block = self.new_block()
+                self.compare(block, "<", first, miss_block, table_block)
+                block = table_block
+            if high is None or high > last:
+                table_block = self.new_block()
+                self.compare(block, ">", last, miss_block, table_block)
+                block = table_block
+            targets = dict(cluster)
+            table = [
+                (value, targets.get(value, miss_block))
+                for value in range(first, last + 1)
+            ]
+            self.jump(block, ir.JumpTable(self.value, table, miss_block))
+
+    def compare(self, block, condition, value, yes_block, no_block):
+        """ Compare the value against a constant, and jump """
+        constant = ir.Const(value, "case", self.value.ty)
+        block.add_instruction(constant)
+        self.jump(
+            block,
+            ir.CJump(self.value, condition, constant, yes_block, no_block),
+        )
+
+    def jump(self, block, instruction):
+        """ Add a jump instruction, and remember the new predecessors """
+        block.add_instruction(instruction)
+        for target in instruction.targets:
+            predecessors = self.predecessors.setdefault(target, [])
+            if block not in predecessors:
+                predecessors.append(block)
+
+    def new_block(self):
+        block = ir.Block("{}_case".format(self.block.name))
+        self.block.function.add_block(block)
+        return block
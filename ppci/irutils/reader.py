@@ -365,6 +365,9 @@ class Reader:
             elif a == "load":
                 address = self.parse_value_ref()
                 ins = ir.Load(address, name, ty)
+            elif a == "sqrt":
+                value = self.parse_value_ref()
+                ins = ir.Unop(a, value, name, ty)
             elif a == "cast":
                 value = self.parse_value_ref()
                 ins = ir.Cast(value, name, ty)
@@ -422,6 +425,8 @@ class Reader:
             ins = self.parse_jmp()
         elif self.at_keyword("cjmp"):
             ins = self.parse_cjmp()
+        elif self.at_keyword("jmp_table"):
+            ins = self.parse_jmp_table()
         elif self.at_keyword("return"):
             ins = self.parse_return()
         elif self.at_keyword("store"):
@@ -456,6 +461,24 @@ class Reader:
         ins = ir.CJump(a, op, b, L1, L2)
         return ins
 
+    def parse_jmp_table(self):
+        self.consume_keyword("jmp_table")
+        v = self.parse_value_ref()
+        self.consume("?")
+        self.consume("[")
+        table = []
+        while self.peek != "]":
+            if table:
+                self.consume(",")
+            value = self.parse_integer()
+            self.consume(":")
+            table.append((value, self.parse_block_ref()))
+        self.consume("]")
+        self.consume(":")
+        default = self.parse_block_ref()
+        ins = ir.JumpTable(v, table, default)
+        return ins
+
     def parse_jmp(self):
         self.consume_keyword("jmp")
         L1 = self.parse_block_ref()
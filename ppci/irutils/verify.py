@@ -159,6 +159,13 @@ class Verifier:
                         instruction.a.ty, instruction.b.ty, instruction
                     )
                 )
+        elif isinstance(instruction, ir.JumpTable):
+            if not instruction.v.ty.is_integer:
+                raise IrFormError(
+                    "Type {} is not an integer type in {}".format(
+                        instruction.v.ty, instruction
+                    )
+                )
         elif isinstance(instruction, (ir.FunctionCall, ir.ProcedureCall)):
             if isinstance(
                 instruction.callee, (ir.SubRoutine, ir.ExternalSubRoutine)
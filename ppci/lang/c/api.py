@@ -16,13 +16,21 @@ def preprocess(f, output_file, coptions=None):
     CTokenPrinter().dump(tokens, file=output_file)
 
 
-def c_to_ir(source: io.TextIOBase, march, coptions=None, reporter=None):
+def c_to_ir(
+    source: io.TextIOBase,
+    march,
+    coptions=None,
+    reporter=None,
+    included_files=None,
+):
     """ C to ir translation.
 
     Args:
         source (file-like object): The C source to compile.
         march (str): The targetted architecture.
         coptions: C specific compilation options.
+        included_files (list): When given, the filenames of the headers
+            which the source includes are appended to this list.
 
     Returns:
         An :class:`ppci.ir.Module`.
@@ -45,4 +53,6 @@ def c_to_ir(source: io.TextIOBase, march, coptions=None, reporter=None):
         filename = None
 
     ir_module = cbuilder.build(source, filename, reporter=reporter)
+    if included_files is not None:
+        included_files.extend(cbuilder.included_files)
     return ir_module
@@ -6,6 +6,7 @@ from .parser import CParser
 from .semantics import CSemantics
 from .preprocessor import CPreProcessor, prepare_for_parsing
 from .codegenerator import CCodeGenerator
+from .pch import use_pch
 from .utils import print_ast
 
 
@@ -18,6 +19,7 @@ class CBuilder:
         self.arch_info = arch_info
         self.coptions = coptions
         self.cgen = None
+        self.included_files = []  # Files included by the last build.
 
     def build(self, src: io.TextIOBase, filename: str, reporter=None):
         if reporter:
@@ -29,7 +31,9 @@ class CBuilder:
         self.logger.info("Starting C compilation (%s)", cdialect)
 
         context = CContext(self.coptions, self.arch_info)
-        compile_unit = _parse(src, filename, context)
+        preprocessor = CPreProcessor(self.coptions)
+        compile_unit = _parse(src, filename, context, preprocessor)
+        self.included_files = preprocessor.included_files
 
         if reporter:
             f = io.StringIO()
@@ -65,13 +69,19 @@ def create_ast(src, arch_info, filename="<snippet>", coptions=None):
     return _parse(src, filename, context)
 
 
-def _parse(src, filename, context):
-    preprocessor = CPreProcessor(context.coptions)
+def _parse(src, filename, context, preprocessor=None):
+    if preprocessor is None:
+        preprocessor = CPreProcessor(context.coptions)
     tokens = preprocessor.process_file(src, filename)
     semantics = CSemantics(context)
     parser = CParser(context.coptions, semantics)
+    scope, typedefs = None, ()
+    if context.coptions["pch"]:
+        tokens, scope, typedefs = use_pch(
+            context.coptions["pch"], preprocessor, tokens, context
+        )
     tokens = prepare_for_parsing(tokens, parser.keywords)
-    ast = parser.parse(tokens)
+    ast = parser.parse(tokens, scope=scope, typedefs=typedefs)
     return ast
 
 
@@ -557,7 +557,9 @@ class CCodeGenerator:
             https://www.codeproject.com/Articles/100473/
             Something-You-May-Not-Know-About-the-Switch-Statem
 
-        For now, implemented as a gigantic if-then forest.
+        The switching logic is a jump table, which is lowered by the
+        code generator into jumps through a table of addresses or into a
+        binary search.
         """
         backup = self.switch_options
         self.switch_options = {}
@@ -576,24 +578,20 @@ class CCodeGenerator:
         self.break_block_stack.pop(-1)
 
         # Implement switching logic, now that we have the branches:
-        # TODO: implement jump tables and other performance related stuff.
         self.builder.set_block(test_block)
         test_value = self.gen_expr(stmt.expression, rvalue=True)
-        switch_ir_typ = self.get_ir_type(stmt.expression.typ)
-        for option, target_block in self.switch_options.items():
-            if option != "default":
-                option = self.emit(ir.Const(option, "case", switch_ir_typ))
-                next_test_block = self.builder.new_block()
-                self.emit(
-                    ir.CJump(
-                        test_value, "==", option, target_block, next_test_block
-                    )
-                )
-                self.builder.set_block(next_test_block)
+        table = [
+            (option, target_block)
+            for option, target_block in self.switch_options.items()
+            if option != "default"
+        ]
 
         # If all else fails, jump to the default case if we have it.
-        target_block = self.switch_options.get("default", final_block)
-        self.emit(ir.Jump(target_block))
+        default_block = self.switch_options.get("default", final_block)
+        if table:
+            self.emit(ir.JumpTable(test_value, table, default_block))
+        else:
+            self.emit(ir.Jump(default_block))
 
         # Set continuation point:
         self.builder.set_block(final_block)
@@ -1,11 +1,14 @@
 """ C Language lexer """
 
+import bisect
 import logging
 import io
+import re
 
+from ...common import CompilerError
 from ..common import SourceLocation
 from .token import CToken
-from ..tools.handlexer import HandLexerBase, Char
+from ..tools.handlexer import Char
 
 
 class SourceFile:
@@ -80,340 +83,329 @@ def continued_lines_filter(characters):
                 yield char
 
 
+def logical_lines(f, source_file, trigraphs=False, continuations=False):
+    """ Read lines, with trigraphs replaced and continued lines glued.
+
+    Yields the text of each logical line, together with the information
+    to determine the location of each character. This is a list of
+    pieces, one for each physical line. A piece is a tuple with the
+    offset of the physical line in the text, its filename and row and the
+    column of its first character. For lines in which characters were
+    replaced or removed, a list with the column of each character is given
+    instead of the first column.
+    """
+    text = ""
+    pieces = []
+    for line in f:
+        line = line.expandtabs()
+        filename = source_file.filename
+        row = source_file.row
+        if (trigraphs and "??" in line) or (continuations and "\\" in line):
+            # Use the character filters for this line only:
+            line_file = SourceFile(filename)
+            line_file.row = row
+            characters = create_characters([line], line_file)
+            if trigraphs:
+                characters = trigraph_filter(characters)
+            if continuations:
+                characters = continued_lines_filter(characters)
+            characters = list(characters)
+            processed = "".join(c.char for c in characters)
+            columns = [c.loc.col for c in characters]
+            continued = line.endswith("\n") and not processed.endswith("\n")
+        else:
+            processed = line
+            columns = 1
+            continued = False
+        pieces.append((len(text), filename, row, columns))
+        text += processed
+        if not continued:
+            yield text, pieces
+            text = ""
+            pieces = []
+        source_file.row += 1
+
+    if text:
+        yield text, pieces
+
+
 def lex_text(text, coptions):
     """ Lex a piece of text """
     lexer = CLexer(coptions)
     return list(lexer.lex_text(text))
 
 
-class CLexer(HandLexerBase):
-    """ Lexer used for the preprocessor """
+# Patterns for the tokens:
+ESCAPE = (
+    r"(?:['\"?\\abfnrtve]|[0-7]{1,3}|x[0-9a-fA-F]{0,2}|[uU][0-9a-fA-F]{0,4})"
+)
+CHAR = r"L?'(?:\\" + ESCAPE + r"|[^\\])'"
+STRING_PREFIX = r'"(?:[^"\\]|\\[\'"?\\abfnrtve0-7xuU])*'
+NUMBER = (
+    r"(?:0[xX][0-9a-fA-F]*|0[bB][01]*|0[0-7]*|[1-9][0-9]*)"
+    r"(?:\.[0-9]*(?:[eEpP][+-]?[0-9]*)?|[LlUu]{0,3})"
+)
+OPERATORS = [
+    "...",
+    "<<=",
+    ">>=",
+    "<=",
+    "<<",
+    ">=",
+    ">>",
+    "==",
+    "!=",
+    "||",
+    "|=",
+    "&&",
+    "&=",
+    "##",
+    "++",
+    "+=",
+    "--",
+    "-=",
+    "->",
+    "*=",
+    "%=",
+    "^=",
+    "~=",
+    "/=",
+]
+TOKEN = "|".join(
+    "(?P<{}>{})".format(name, pattern)
+    for name, pattern in [
+        ("WS", r"[ \t]+"),
+        ("BOL", r"\n"),
+        ("CHAR", r"L?'"),
+        ("ID", r"[A-Za-z_][A-Za-z0-9_]*"),
+        ("NUMBER", NUMBER),
+        ("FLOAT", r"\.[0-9]+(?:[eEpP][+-]?[0-9]*)?"),
+        ("LINECOMMENT", r"//[^\n]*"),
+        ("BLOCKCOMMENT", r"/\*"),
+        ("STRING", r'"'),
+        ("FORMFEED", r"\f"),
+        (
+            "OPERATOR",
+            "|".join(re.escape(op) for op in OPERATORS)
+            + r"|[/<>=!|&#+\-*%^~.;{}()\[\],?:\\]",
+        ),
+    ]
+)
+
+
+class CLexer:
+    """ Lexer used for the preprocessor.
+
+    Tokens are matched with regular expressions on whole lines. Trigraphs
+    and continued lines are handled up front, when reading the lines.
+    Locations are only determined for the tokens, from their offset in
+    the line.
+    """
 
     logger = logging.getLogger("clexer")
-    lower_letters = "abcdefghijklmnopqrstuvwxyz"
-    upper_letters = lower_letters.upper()
-    binary_numbers = "01"
-    octal_numbers = binary_numbers + "234567"
-    numbers = octal_numbers + "89"
-    hex_numbers = numbers + "abcdefABCDEF"
+    token_regex = re.compile(TOKEN)
+    char_regex = re.compile(CHAR)
+    escape_regex = re.compile(ESCAPE)
+    string_regex = re.compile(STRING_PREFIX + '"')
+    string_prefix_regex = re.compile(STRING_PREFIX)
+
+    # Token types which differ from the token text:
+    operator_types = {"<<=": "<<"}
 
     def __init__(self, coptions):
-        super().__init__()
         self.coptions = coptions
 
     def lex(self, src, source_file):
         """ Read a source and generate a series of tokens """
         self.logger.debug("Lexing %s", source_file.filename)
-
-        characters = create_characters(src, source_file)
-        if self.coptions["trigraphs"]:
-            characters = trigraph_filter(characters)
-        characters = continued_lines_filter(characters)
-        # print('=== lex ')
-        # print(s)
-        # print('=== end lex ')
-
-        # s = '\n'.join(r)
-        return self.tokenize(characters)
+        if isinstance(src, str):
+            src = io.StringIO(src)
+        lines = logical_lines(
+            src,
+            source_file,
+            trigraphs=self.coptions["trigraphs"],
+            continuations=True,
+        )
+        return self.tokenize(lines)
 
     def lex_text(self, txt):
         """ Create tokens from the given text """
         f = io.StringIO(txt)
         filename = None
         source_file = SourceFile(filename)
-        characters = characters = create_characters(f, source_file)
-        return self.tokenize(characters)
-
-    def tokenize(self, characters):
-        """ Generate tokens from characters """
+        return self.tokenize(logical_lines(f, source_file))
+
+    def tokenize(self, lines):
+        """ Generate tokens from logical lines """
+        self.lines = lines
+        self.text = ""
+        self.pieces = []
+        text = ""
+        pos = 0
         space = ""
         first = True
-        token = None
-        for token in super().tokenize(characters, self.lex_c):
-            if token.typ == "BOL":
+        last = None  # Offset of the last token, including white space
+        last_loc = None
+        c89 = self.coptions["std"] == "c89"
+        while True:
+            if pos == len(text):
+                if last is not None:
+                    last_loc = self.location(last)
+                    last = None
+                if not self.next_line():
+                    break
+                text = self.text
+                pos = 0
+
+            match = self.token_regex.match(text, pos)
+            if match is None:  # pragma: no cover
+                raise NotImplementedError(Char(text[pos], self.location(pos)))
+
+            kind = match.lastgroup
+            if kind == "WS":
+                space += match.group()
+                last = pos
+                pos = match.end()
+            elif kind == "BOL":
                 if first:
                     # Yield an extra start of line
-                    yield CToken("BOL", "", "", first, token.loc)
+                    yield CToken("BOL", "", "", first, self.location(pos))
                 first = True
                 space = ""
-            elif token.typ == "WS":
-                space += token.val
+                last = pos
+                pos += 1
+            elif kind == "LINECOMMENT":
+                if c89:
+                    self.error(
+                        "C++ style comments are not allowed in C90", pos + 2
+                    )
+                pos = match.end()
+            elif kind == "BLOCKCOMMENT":
+                pos = self.skip_block_comment(pos)
+                text = self.text
+            elif kind == "FORMFEED":
+                # Skip form feed ^L chr(0xc) character
+                pos += 1
             else:
-                yield CToken(token.typ, token.val, space, first, token.loc)
+                if kind == "STRING":
+                    end = self.match_string(pos)
+                    text = self.text
+                elif kind == "CHAR":
+                    end = self.match_char(pos, match.end())
+                    text = self.text
+                else:
+                    end = match.end()
+                val = text[pos:end]
+                if kind == "OPERATOR":
+                    typ = self.operator_types.get(val, val)
+                elif kind == "FLOAT":
+                    typ = "NUMBER"
+                else:
+                    typ = kind
+                yield CToken(typ, val, space, first, self.location(pos))
                 space = ""
                 first = False
+                last = pos
+                pos = end
 
         # Emit last newline:
-        if first and token:
+        if first and last_loc:
             # Yield an extra start of line
-            yield CToken("BOL", "", "", first, token.loc)
-
-    def lex_c(self):
-        """ Root parsing function """
-        r = self.next_char()
-        if r is None:
-            pass
-        elif r.char == "L":
-            # Wide char or identifier
-            if self.accept("'"):
-                return self.lex_char
-            else:
-                return self.lex_identifier
-        elif r.char in self.lower_letters + self.upper_letters + "_":
-            return self.lex_identifier
-        elif r.char in self.numbers:
-            self.backup_char(r)
-            return self.lex_number
-        elif r.char in " \t":
-            return self.lex_whitespace
-        elif r.char in "\n":
-            self.emit("BOL")
-            return self.lex_c
-        elif r.char == "\f":
-            # Skip form feed ^L chr(0xc) character
-            self.ignore()
-            return self.lex_c
-        elif r.char == "/":
-            if self.accept("/"):
-                if self.coptions["std"] == "c89":
-                    self.error("C++ style comments are not allowed in C90")
-                return self.lex_linecomment
-            elif self.accept("*"):
-                return self.lex_blockcomment
-            elif self.accept("="):
-                self.emit("/=")
-                return self.lex_c
-            else:
-                self.emit("/")
-                return self.lex_c
-        elif r.char == '"':
-            return self.lex_string
-        elif r.char == "'":
-            return self.lex_char
-        elif r.char == "<":
-            if self.accept("="):
-                self.emit("<=")
-            elif self.accept("<"):
-                if self.accept("="):
-                    self.emit("<<")
-                else:
-                    self.emit("<<")
-            else:
-                self.emit("<")
-            return self.lex_c
-        elif r.char == ">":
-            if self.accept("="):
-                self.emit(">=")
-            elif self.accept(">"):
-                if self.accept("="):
-                    self.emit(">>=")
-                else:
-                    self.emit(">>")
-            else:
-                self.emit(">")
-            return self.lex_c
-        elif r.char == "=":
-            if self.accept("="):
-                self.emit("==")
-            else:
-                self.emit("=")
-            return self.lex_c
-        elif r.char == "!":
-            if self.accept("="):
-                self.emit("!=")
-            else:
-                self.emit("!")
-            return self.lex_c
-        elif r.char == "|":
-            if self.accept("|"):
-                self.emit("||")
-            elif self.accept("="):
-                self.emit("|=")
-            else:
-                self.emit("|")
-            return self.lex_c
-        elif r.char == "&":
-            if self.accept("&"):
-                self.emit("&&")
-            elif self.accept("="):
-                self.emit("&=")
-            else:
-                self.emit("&")
-            return self.lex_c
-        elif r.char == "#":
-            if self.accept("#"):
-                self.emit("##")
-            else:
-                self.emit("#")
-            return self.lex_c
-        elif r.char == "+":
-            if self.accept("+"):
-                self.emit("++")
-            elif self.accept("="):
-                self.emit("+=")
-            else:
-                self.emit("+")
-            return self.lex_c
-        elif r.char == "-":
-            if self.accept("-"):
-                self.emit("--")
-            elif self.accept("="):
-                self.emit("-=")
-            elif self.accept(">"):
-                self.emit("->")
-            else:
-                self.emit("-")
-            return self.lex_c
-        elif r.char == "*":
-            if self.accept("="):
-                self.emit("*=")
-            else:
-                self.emit("*")
-            return self.lex_c
-        elif r.char == "%":
-            if self.accept("="):
-                self.emit("%=")
-            else:
-                self.emit("%")
-            return self.lex_c
-        elif r.char == "^":
-            if self.accept("="):
-                self.emit("^=")
-            else:
-                self.emit("^")
-            return self.lex_c
-        elif r.char == "~":
-            if self.accept("="):
-                self.emit("~=")
-            else:
-                self.emit("~")
-            return self.lex_c
-        elif r.char == ".":
-            if self.accept_sequence([".", "."]):
-                self.emit("...")
-            elif self.accept(self.numbers):
-                # We got .[0-9]
-                return self.lex_float
-            else:
-                self.emit(".")
-            return self.lex_c
-        elif r.char in ";{}()[],?:":
-            self.emit(r.char)
-            return self.lex_c
-        elif r.char == "\\":
-            self.emit(r.char)
-            return self.lex_c
-        else:  # pragma: no cover
-            raise NotImplementedError(r)
-
-    def lex_identifier(self):
-        id_chars = self.lower_letters + self.upper_letters + self.numbers + "_"
-        self.accept_run(id_chars)
-        self.emit("ID")
-        return self.lex_c
-
-    def lex_number(self):
-        if self.accept("0"):
-            # Octal, binary or hex!
-            if self.accept("xX"):
-                number_chars = self.hex_numbers
-            elif self.accept("bB"):
-                number_chars = self.binary_numbers
-            else:
-                number_chars = self.octal_numbers
+            yield CToken("BOL", "", "", first, last_loc)
+
+    def next_line(self):
+        """ Continue with the next logical line, which is not empty """
+        line = next(self.lines, None)
+        while line and not line[0]:
+            line = next(self.lines, None)
+        if line is None:
+            return False
+        self.text, self.pieces = line
+        self.starts = [piece[0] for piece in self.pieces]
+        return True
+
+    def more(self):
+        """ Append the next logical line, for tokens spanning lines """
+        line = next(self.lines, None)
+        if line is None:
+            return False
+        text, pieces = line
+        offset = len(self.text)
+        self.text += text
+        for start, filename, row, columns in pieces:
+            self.pieces.append((start + offset, filename, row, columns))
+            self.starts.append(start + offset)
+        return True
+
+    def location(self, offset):
+        """ Determine the location of the character at the given offset """
+        if len(self.pieces) == 1:
+            start, filename, row, columns = self.pieces[0]
         else:
-            number_chars = self.numbers
-
-        # Accept a series of number characters:
-        self.accept_run(number_chars)
-        if self.accept("."):
-            return self.lex_float()
+            index = bisect.bisect_right(self.starts, offset) - 1
+            start, filename, row, columns = self.pieces[index]
+        if isinstance(columns, int):
+            col = columns + offset - start
         else:
-            # Accept some suffixes:
-            self.accept("LlUu")
-            self.accept("LlUu")
-            # TODO: handle suffixes better
-            self.accept("LlUu")
-
-            # self.accept('
-            self.emit("NUMBER")
-            return self.lex_c
-
-    def lex_float(self):
-        self.accept_run(self.numbers)
-        if self.accept("eEpP"):
-            self.accept("+-")
-            self.accept_run(self.numbers)
-
-        self.emit("NUMBER")
-        return self.lex_c
-
-    def lex_whitespace(self):
-        self.accept_run(" \t")
-        self.emit("WS")
-        return self.lex_c
-
-    def lex_linecomment(self):
-        c = self.next_char()
-        while c and c.char != "\n":
-            c = self.next_char()
-        self.backup_char(c)
-        self.ignore()
-        return self.lex_c
-
-    def lex_blockcomment(self):
+            col = columns[offset - start]
+        return SourceLocation(filename, row, col, 1)
+
+    def skip_block_comment(self, pos):
+        """ Find the end of a block comment """
+        end = self.text.find("*/", pos + 2)
+        while end < 0:
+            search = max(pos + 2, len(self.text) - 1)
+            if not self.more():
+                self.error("Expected a character, but at end of file", None)
+            end = self.text.find("*/", search)
+        return end + 2
+
+    def match_string(self, pos):
+        """ Scan for a complete string """
         while True:
-            if self.accept("*"):
-                if self.accept("/"):
-                    self.ignore()
-                    # self.emit('WS')
-                    break
+            match = self.string_regex.match(self.text, pos)
+            if match:
+                return match.end()
+
+            # The string ends at an invalid escape or the end of the text:
+            end = self.string_prefix_regex.match(self.text, pos).end()
+            if end + 1 >= len(self.text) and self.more():
+                continue
+            if end == len(self.text):
+                self.error("Expected a character, but at end of file", None)
+            self.error("Unexpected escape character", end + 1)
+
+    def match_char(self, pos, start):
+        """ Scan for a complete character constant """
+        while True:
+            match = self.char_regex.match(self.text, pos)
+            if match:
+                return match.end()
+
+            # Determine where the character constant is wrong:
+            if start == len(self.text):
+                message = "Expected a character, but at end of file"
+                offset = start
+            elif self.text[start] == "\\":
+                match = self.escape_regex.match(self.text, start + 1)
+                if match:
+                    message = "Expected '"
+                    offset = match.end()
+                else:
+                    message = "Unexpected escape character"
+                    offset = start + 1
             else:
-                self.next_char(eof=False)
-        return self.lex_c
+                message = "Expected '"
+                offset = start + 1
 
-    def lex_string(self):
-        """ Scan for a complete string """
-        c = self.next_char(eof=False)
-        while c.char != '"':
-            if c.char == "\\":
-                self._handle_escape_character()
-            c = self.next_char(eof=False)
-        self.emit("STRING")
-        return self.lex_c
-
-    def lex_char(self):
-        """ Scan for a complete character constant """
-        if self.accept("\\"):
-            self._handle_escape_character()
-        else:
-            # Normal char:
-            self.next_char(eof=False)
-
-        self.expect("'")
-
-        self.emit("CHAR")
-        return self.lex_c
-
-    def _handle_escape_character(self):
-        # Escape char!
-        if self.accept("'\"?\\abfnrtve"):
-            pass
-        elif self.accept(self.octal_numbers):
-            self.accept(self.octal_numbers)
-            self.accept(self.octal_numbers)
-        elif self.accept("x"):
-            self.accept(self.hex_numbers)
-            self.accept(self.hex_numbers)
-        elif self.accept("u"):
-            self.accept(self.hex_numbers)
-            self.accept(self.hex_numbers)
-            self.accept(self.hex_numbers)
-            self.accept(self.hex_numbers)
-        elif self.accept("U"):
-            self.accept(self.hex_numbers)
-            self.accept(self.hex_numbers)
-            self.accept(self.hex_numbers)
-            self.accept(self.hex_numbers)
+            if offset >= len(self.text) and self.more():
+                continue
+            self.error(message, offset)
+
+    def error(self, message, offset):
+        """ Raise an error at the character at the given offset """
+        if offset is None or offset >= len(self.text):
+            loc = None
         else:
-            self.error("Unexpected escape character")
+            loc = self.location(offset)
+        raise CompilerError(message, loc)
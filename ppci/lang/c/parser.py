@@ -157,21 +157,25 @@ class CParser(RecursiveDescentParser):
         return self.coptions["std"] == "c99"
 
     # Entry points:
-    def parse(self, tokens):
+    def parse(self, tokens, scope=None, typedefs=()):
         """ Here the parsing of C is begun ...
 
-        Parse the given tokens.
+        Parse the given tokens. The scope and typedefs of an earlier parse
+        can be given to continue after it, as done for precompiled headers.
         """
         self.logger.debug("Parsing some nice C code!")
         self.init_lexer(tokens)
-        self.typedefs = set()
-        cu = self.parse_translation_unit()
+        self.typedefs = set(typedefs)
+        cu = self.parse_translation_unit(scope)
         self.logger.info("Parsing finished")
         return cu
 
-    def parse_translation_unit(self):
+    def parse_translation_unit(self, scope=None):
         """ Top level start of parsing """
-        self.semantics.begin()
+        if scope is None:
+            self.semantics.begin()
+        else:
+            self.semantics.resume(scope)
         while not self.at_end:
             self.parse_declarations()
         return self.semantics.finish_compilation_unit()
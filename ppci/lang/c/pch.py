@@ -0,0 +1,206 @@
+""" Precompiled headers.
+
+A precompiled header contains the state of the C frontend after a header
+file was processed: the macros of the preprocessor, and the declarations,
+types and typedefs of the parser. Compiling a source with a precompiled
+header is the same as including the header at the start of the source,
+but the header is not preprocessed and parsed again.
+
+The state is stored with pickle, so only load precompiled headers which
+you created yourself.
+
+A precompiled header can only be used with the same C options and target
+types as it was created with, and while the header files are unchanged.
+Otherwise the header itself is included.
+"""
+
+import gc
+import logging
+import os
+import pickle
+import sys
+from ... import __version__
+from ...arch.arch_info import TypeInfo
+from ...common import CompilerError
+from .context import CContext
+from .macro import Macro
+from .parser import CParser
+from .preprocessor import CPreProcessor, prepare_for_parsing
+from .semantics import CSemantics
+
+
+logger = logging.getLogger("pch")
+
+
+class PrecompiledHeader:
+    """ The state of the C frontend after processing a header file """
+
+    def __init__(self, filename, key, dependencies):
+        self.filename = filename
+        self.key = key
+        self.dependencies = dependencies
+        self.macros = []
+        self.include_guards = {}
+        self.once_files = set()
+        self.counter = 0
+        self.typedefs = set()
+        self.scope = None
+
+    def is_valid(self, coptions, arch_info):
+        """ Check if the header can be used for the given options """
+        return self.key == make_key(coptions, arch_info) and all(
+            file_stamp(filename) == stamp
+            for filename, stamp in self.dependencies
+        )
+
+    def restore(self, preprocessor):
+        """ Continue preprocessing after this header """
+        for macro in self.macros:
+            preprocessor.macros[macro.name] = macro
+        preprocessor.include_guards.update(self.include_guards)
+        preprocessor.once_files.update(self.once_files)
+        preprocessor.included_files.extend(
+            filename for filename, _ in self.dependencies
+        )
+        preprocessor.counter = self.counter
+
+
+def make_key(coptions, arch_info):
+    """ Create a value which identifies the options of a header """
+    settings = sorted(
+        (name, value)
+        for name, value in coptions.settings.items()
+        if name not in ("pch", "verbose")
+    )
+    type_infos = sorted(
+        (str(typ), (info.size, info.alignment))
+        if isinstance(info, TypeInfo)
+        else (str(typ), str(info))
+        for typ, info in arch_info.type_infos.items()
+    )
+    registers = sorted(
+        register.name
+        for register_class in arch_info.register_classes
+        for register in register_class.registers or ()
+    )
+    return (
+        __version__,
+        tuple(settings),
+        tuple(coptions.include_directories),
+        tuple(coptions.macros),
+        tuple(coptions.undefine_macros),
+        tuple(type_infos),
+        arch_info.endianness.name,
+        tuple(registers),
+    )
+
+
+def file_stamp(filename):
+    """ Get the modification time and size of a file """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def create_pch(f, filename, arch_info, coptions):
+    """ Process a header file into a precompiled header """
+    context = CContext(coptions, arch_info)
+    preprocessor = CPreProcessor(coptions)
+    semantics = CSemantics(context)
+    parser = CParser(coptions, semantics)
+    tokens = preprocessor.process_file(f, filename)
+    parser.parse(prepare_for_parsing(tokens, parser.keywords))
+
+    dependencies = []
+    for name in [filename] + preprocessor.included_files:
+        if name not in [d[0] for d in dependencies]:
+            dependencies.append((name, file_stamp(name)))
+
+    pch = PrecompiledHeader(
+        filename, make_key(coptions, arch_info), dependencies
+    )
+    pch.macros = [
+        macro
+        for macro in preprocessor.macros.values()
+        if isinstance(macro, Macro)
+    ]
+    pch.include_guards = preprocessor.include_guards
+
+    # Allow the header itself to be skipped, when a source includes it:
+    guard = preprocessor.load_header(filename).guard
+    if guard is not None:
+        pch.include_guards[filename] = guard
+    pch.once_files = preprocessor.once_files
+    pch.counter = preprocessor.counter
+    pch.typedefs = parser.typedefs
+    pch.scope = semantics.scope
+    return pch
+
+
+# Deeply nested syntax trees need a deep recursion when pickling:
+recursion_limit = 20000
+
+
+def save_pch(pch, f):
+    """ Write a precompiled header to a binary file """
+    old_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(old_limit, recursion_limit))
+    try:
+        pickle.dump(pch, f, protocol=pickle.HIGHEST_PROTOCOL)
+    finally:
+        sys.setrecursionlimit(old_limit)
+
+
+def load_pch(filename):
+    """ Read a precompiled header from the given file """
+    old_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(old_limit, recursion_limit))
+    # Loading creates many objects, without garbage:
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with open(filename, "rb") as f:
+            pch = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError) as ex:
+        raise CompilerError(
+            "Cannot read precompiled header {}: {}".format(filename, ex)
+        )
+    finally:
+        if gc_enabled:
+            gc.enable()
+        sys.setrecursionlimit(old_limit)
+
+    if not isinstance(pch, PrecompiledHeader):
+        raise CompilerError("{} is no precompiled header".format(filename))
+    return pch
+
+
+def use_pch(filename, preprocessor, tokens, context):
+    """ Continue compiling a source after a precompiled header.
+
+    Returns the tokens to parse, and the scope and typedefs to start the
+    parser with. When the precompiled header is outdated, the header is
+    included in front of the tokens instead.
+    """
+    pch = load_pch(filename)
+    if pch.is_valid(context.coptions, context.arch_info):
+        logger.debug("Using precompiled header %s", filename)
+        pch.restore(preprocessor)
+        return tokens, pch.scope, pch.typedefs
+    else:
+        logger.warning(
+            "Precompiled header %s is outdated, including %s instead",
+            filename,
+            pch.filename,
+        )
+        tokens = include_header(pch.filename, preprocessor, tokens)
+        return tokens, None, ()
+
+
+def include_header(filename, preprocessor, tokens):
+    """ Preprocess a header before the given tokens """
+    with open(filename, "r") as f:
+        yield from preprocessor.process_file(f, filename)
+    yield from tokens
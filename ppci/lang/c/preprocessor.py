@@ -25,6 +25,64 @@ from .utils import cnum, charval, replace_escape_codes, LineInfo
 from .macro import Macro, FunctionMacro
 
 
+# Lexed headers, which are shared by all preprocessors in this process:
+header_cache = {}
+
+
+class IncludeCache:
+    """ Cache of directory listings, and of located include files.
+
+    The cache is shared by all preprocessors in a process. Listings are
+    checked for modifications once per translation unit, in refresh.
+    """
+
+    # Listings of directories modified shortly before they were read are
+    # not trusted, since the modification time is not precise enough to
+    # see a change made during the same tick:
+    racy_time = 2 * 10 ** 9
+
+    def __init__(self):
+        self.listings = {}  # Directory to its mtime, read time and names.
+        self.located = {}  # Include to the located file.
+
+    def refresh(self):
+        """ Drop listings of modified directories, and what was located """
+        stale = [
+            directory
+            for directory, (mtime, read_time, _) in self.listings.items()
+            if directory_mtime(directory) != mtime
+            or (mtime is not None and read_time - mtime < self.racy_time)
+        ]
+        if stale:
+            for directory in stale:
+                del self.listings[directory]
+            self.located.clear()
+
+    def exists(self, path):
+        """ Test if a file exists, using the listing of its directory """
+        directory, name = os.path.split(path)
+        if directory not in self.listings:
+            read_time = int(time.time() * 10 ** 9)
+            mtime = directory_mtime(directory)
+            try:
+                names = frozenset(os.listdir(directory or "."))
+            except OSError:
+                names = frozenset()
+            self.listings[directory] = (mtime, read_time, names)
+        return name in self.listings[directory][2]
+
+
+def directory_mtime(directory):
+    """ Get the modification time of a directory, or None if it is gone """
+    try:
+        return os.stat(directory or ".").st_mtime_ns
+    except OSError:
+        return None
+
+
+include_cache = IncludeCache()
+
+
 class CPreProcessor:
     """ A pre-processor for C source code """
 
@@ -35,8 +93,12 @@ class CPreProcessor:
         self.verbose = coptions["verbose"]
         self.macros = {}  # A mapping of macros
         self.files = []  # Stack of included files.
+        self.included_files = []  # All files included so far.
+        self.include_guards = {}  # Guard macros of the included files.
+        self.once_files = set()  # Files with a `#pragma once`.
         self.counter = 0  # For the __COUNTER__ macro
 
+        include_cache.refresh()
         self.predefine_builtin_macros()
 
     def predefine_builtin_macros(self):
@@ -164,10 +226,14 @@ class CPreProcessor:
 
     def process_file(self, f, filename=None):
         """ Process the given open file into tokens. """
-        self.logger.debug("Processing %s", filename)
         source_file = SourceFile(filename)
         clexer = CLexer(self.coptions)
         tokens = clexer.lex(f, source_file)
+        yield from self.process_source(source_file, tokens)
+
+    def process_source(self, source_file, tokens):
+        """ Process the tokens of a source file. """
+        self.logger.debug("Processing %s", source_file.filename)
         ex = FileExpander(source_file, tokens)
         self.files.append(ex)
         yield LineInfo(1, source_file.filename)
@@ -198,12 +264,37 @@ class CPreProcessor:
             - loc: the location where this include is included.
             - use_current_dir: If true, look in the directory of
                 the current file.
+
+        Results are cached, and existence of files is determined from
+        cached directory listings.
+        """
+        current_filename = self.files[-1].source_file.filename
+        if use_current_dir:
+            current_dir = os.path.dirname(current_filename)
+        else:
+            current_dir = None
+        key = (
+            current_dir,
+            filename,
+            current_filename if include_next else None,
+            tuple(self.coptions.include_directories),
+        )
+        full_path = include_cache.located.get(key)
+        if full_path is None:
+            full_path = self.search_include(
+                filename, loc, current_dir, include_next
+            )
+            include_cache.located[key] = full_path
+        return full_path
+
+    def search_include(self, filename, loc, current_dir, include_next):
+        """ Search the include directories for the given include filename.
         """
         self.logger.debug("Locating %s", filename)
 
         # Maybe it is an absolute path:
         if os.path.isabs(filename):
-            if os.path.exists(filename):
+            if include_cache.exists(filename):
                 self.logger.debug("Absolute path, not searching include paths")
                 return filename
             else:
@@ -213,9 +304,8 @@ class CPreProcessor:
 
         # Determine search paths:
         search_directories = []
-        if use_current_dir:
+        if current_dir is not None:
             # In the case of: #include "foo.h"
-            current_dir = os.path.dirname(self.files[-1].source_file.filename)
             search_directories.append(current_dir)
         search_directories.extend(self.coptions.include_directories)
 
@@ -223,7 +313,7 @@ class CPreProcessor:
         for path in search_directories:
             self.logger.debug("Searching in %s", path)
             full_path = os.path.join(path, filename)
-            if os.path.exists(full_path):
+            if include_cache.exists(full_path):
                 if include_next:
                     current_filename = self.files[-1].source_file.filename
                     if full_path == current_filename:
@@ -238,16 +328,66 @@ class CPreProcessor:
         self, filename, loc, use_current_dir=False, include_next=False
     ):
         """ Turn the given filename into a series of tokens.
+
+        Files with a `#pragma once`, and files of which the include guard
+        is defined, are skipped without reading them again.
         """
         full_path = self.locate_include(
             filename, loc, use_current_dir, include_next
         )
-        self.logger.debug("Including %s", full_path)
         source_file = SourceFile(full_path)
         self.files[-1].dependencies.append(source_file)
-        with open(full_path, "r") as f:
-            for token in self.process_file(f, full_path):
-                yield token
+        self.included_files.append(full_path)
+
+        guard = self.include_guards.get(full_path)
+        if full_path in self.once_files:
+            self.logger.debug("Skipping %s, included once", full_path)
+            yield LineInfo(1, full_path)
+        elif guard is not None and self.is_defined(guard):
+            self.logger.debug("Skipping %s, %s is defined", full_path, guard)
+            yield LineInfo(1, full_path)
+        else:
+            self.logger.debug("Including %s", full_path)
+            header = self.load_header(full_path)
+            if header.tokens is None:
+                with open(full_path, "r") as f:
+                    yield from self.process_file(f, full_path)
+            else:
+                if header.guard is not None:
+                    self.include_guards[full_path] = header.guard
+                tokens = (token.copy() for token in header.tokens)
+                yield from self.process_source(source_file, tokens)
+
+        yield LineInfo(
+            loc.row + 1,
+            loc.filename,
+            flags=[LineInfo.FLAG_RETURN_FROM_INCLUDE],
+        )
+
+    def load_header(self, full_path):
+        """ Get the lexed tokens of a header file.
+
+        The tokens are lexed once, and reused while the file is unchanged.
+        """
+        stat = os.stat(full_path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        # The lexer result depends on these options:
+        key = (full_path, self.coptions["trigraphs"], self.coptions["std"])
+        header = header_cache.get(key)
+        if header is None or header.stamp != stamp:
+            header = CachedHeader(stamp)
+            clexer = CLexer(self.coptions)
+            with open(full_path, "r") as f:
+                try:
+                    tokens = list(clexer.lex(f, SourceFile(full_path)))
+                except CompilerError:
+                    # Report the error when reaching it during processing.
+                    tokens = None
+            if tokens is not None and not has_line_directive(tokens):
+                header.tokens = tokens
+                header.guard = find_include_guard(tokens)
+            header_cache[key] = header
+        return header
 
     # Token consume / peeking:
     @property
@@ -625,7 +765,7 @@ class CPreProcessor:
             elif directive == "warning":
                 yield from self.handle_warning_directive(directive_token)
             elif directive == "pragma":
-                yield from self.handle_warning_directive(directive_token)
+                yield from self.handle_pragma_directive(directive_token)
             else:  # pragma: no cover
                 self.error(
                     "not implemented: {}".format(directive),
@@ -752,36 +892,20 @@ class CPreProcessor:
     def handle_include_directive(self, directive_token):
         """ Process the `#include` directive. """
         use_current_dir, include_filename = self.parse_included_filename()
-
-        for token in self.include(
+        yield from self.include(
             include_filename,
             directive_token.loc,
             use_current_dir=use_current_dir,
-        ):
-            yield token
-
-        yield LineInfo(
-            directive_token.loc.row + 1,
-            directive_token.loc.filename,
-            flags=[LineInfo.FLAG_RETURN_FROM_INCLUDE],
         )
 
     def handle_include_next_directive(self, directive_token):
         """ Process the `#include_next` directive. """
         use_current_dir, include_filename = self.parse_included_filename()
-
-        for token in self.include(
+        yield from self.include(
             include_filename,
             directive_token.loc,
             use_current_dir=use_current_dir,
             include_next=True,
-        ):
-            yield token
-
-        yield LineInfo(
-            directive_token.loc.row + 1,
-            directive_token.loc.filename,
-            flags=[LineInfo.FLAG_RETURN_FROM_INCLUDE],
         )
 
     def parse_included_filename(self):
@@ -889,7 +1013,10 @@ class CPreProcessor:
         """ Process `#pragma` directive. """
         # Pragma's must be handled, or ignored.
         message = self.tokens_to_string(self.eat_line())
-        self.logger.warning("Ignoring pragma: %s", message)
+        if message == "once":
+            self.once_files.add(self.files[-1].filename)
+        else:
+            self.logger.warning("Ignoring pragma: %s", message)
         new_line_token = CToken("WS", "", "", True, directive_token.loc)
         yield new_line_token
 
@@ -1074,6 +1201,7 @@ class FileExpander:
 
     def __init__(self, source_file, tokens):
         self.source_file = source_file
+        self.filename = source_file.filename  # Not changed by `#line`.
         self.dependencies = []  # List of dependent files.
         self.if_stack = []  # If-def stack
         self.token_buffer = []  # Token undo stack
@@ -1150,6 +1278,74 @@ class FileExpander:
         self.token_buffer.insert(0, token)
 
 
+class CachedHeader:
+    """ The tokens of a header file, which are valid for a file stamp.
+
+    The tokens are None when they cannot be reused, for example because
+    the locations depend on `#line` directives.
+    """
+
+    def __init__(self, stamp):
+        self.stamp = stamp
+        self.tokens = None
+        self.guard = None
+
+
+def directive_lines(tokens):
+    """ Get the name and the index of the line of each directive """
+    index = -1
+    directives = []
+    for position, token in enumerate(tokens):
+        if token.first and token.typ != "BOL":
+            index += 1
+            if token.typ == "#" and position + 1 < len(tokens):
+                name_token = tokens[position + 1]
+                if name_token.typ == "ID" and not name_token.first:
+                    directives.append((name_token.val, index, position))
+    return directives, index + 1
+
+
+def has_line_directive(tokens):
+    """ Test if there is a `#line` directive in the given tokens """
+    directives, _ = directive_lines(tokens)
+    return any(name == "line" for name, _, _ in directives)
+
+
+def find_include_guard(tokens):
+    """ Find the macro which guards a file against multiple inclusion.
+
+    This is the case when the file consists of an `#ifndef` directive at
+    the start, and the matching `#endif` at the end, without any `#else`
+    or `#elif`. When the macro is defined, including the file again gives
+    no tokens, so it can be skipped.
+    """
+    directives, line_count = directive_lines(tokens)
+    if not directives or directives[0][:2] != ("ifndef", 0):
+        return None
+
+    # The directive must be exactly `#ifndef GUARD`:
+    position = directives[0][2] + 2
+    if position >= len(tokens):
+        return None
+    guard = tokens[position]
+    if guard.typ != "ID" or guard.first:
+        return None
+    if position + 1 < len(tokens) and not tokens[position + 1].first:
+        return None
+
+    nesting = 0
+    for name, index, _ in directives:
+        if name in ["if", "ifdef", "ifndef"]:
+            nesting += 1
+        elif name == "endif":
+            nesting -= 1
+            if nesting == 0:
+                return guard.val if index == line_count - 1 else None
+        elif name in ["else", "elif"] and nesting == 1:
+            return None
+    return None
+
+
 class MacroExpansion:
     """ Macro expansion.
 
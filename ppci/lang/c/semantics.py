@@ -48,6 +48,11 @@ class CSemantics:
         """ Enter a new file / compilation unit. """
         self.scope = Scope()
 
+    def resume(self, scope):
+        """ Continue in the top scope of an earlier compilation unit. """
+        assert scope.parent is None
+        self.scope = scope
+
     def finish_compilation_unit(self):
         """ Called at the end of a file / compilation unit. """
         assert self.scope.parent is None  # Must be the topscope now.
@@ -6,6 +6,7 @@ import logging
 import time
 from ... import ir
 from ...graph import relooper
+from ...irutils import lower_jump_tables
 
 
 def literal_label(lit):
@@ -36,11 +37,12 @@ class IrToPythonCompiler:
     """ Can generate python script from ir-code """
 
     logger = logging.getLogger("ir2py")
+    structured = True
 
     def __init__(self, output_file, reporter):
         self.output_file = output_file
         self.reporter = reporter
-        self.stack_size = 0
+        self.uses_stack = False
         self.func_ptr_map = {}
         self._level = 0
 
@@ -58,8 +60,10 @@ class IrToPythonCompiler:
     @contextlib.contextmanager
     def indented(self):
         self._indent()
-        yield
-        self._dedent()
+        try:
+            yield
+        finally:
+            self._dedent()
 
     def emit(self, txt):
         """ Emit python code at current indentation level """
@@ -126,20 +130,31 @@ class IrToPythonCompiler:
             (ir.u8, "B", 1),
         ]
 
-        for ty, fmt, size in foo:
+        for ty, fmt, _ in foo:
+            name = ty.name
+
+            # Precompiled struct which unpacks and packs in place:
+            self.print(0, '_struct_{} = struct.Struct("{}")'.format(name, fmt))
+            self.print(0, "_unpack_{0} = _struct_{0}.unpack_from".format(name))
+            self.print(0, "_pack_{0} = _struct_{0}.pack_into".format(name))
+            self.print(0, "")
+
             # Generate load helpers:
-            self.print(0, "def load_{}(p):".format(ty.name))
+            self.print(0, "def load_{}(p):".format(name))
+            self.print(1, "if p >= HEAP_START:")
             self.print(
-                1,
-                'return struct.unpack("{0}", read_mem(p, {1}))[0]'.format(
-                    fmt, size
-                ),
+                2, "return _unpack_{}(heap, p - HEAP_START)[0]".format(name)
             )
+            self.print(1, "else:")
+            self.print(2, "return _unpack_{}(stack, p)[0]".format(name))
             self.print(0, "")
 
             # Generate store helpers:
-            self.print(0, "def store_{}(v, p):".format(ty.name))
-            self.print(1, 'write_mem(p, struct.pack("{0}", v))'.format(fmt))
+            self.print(0, "def store_{}(v, p):".format(name))
+            self.print(1, "if p >= HEAP_START:")
+            self.print(2, "_pack_{}(heap, p - HEAP_START, v)".format(name))
+            self.print(1, "else:")
+            self.print(2, "_pack_{}(stack, p, v)".format(name))
             self.print(0, "")
 
     def generate_builtins(self):
@@ -184,11 +199,6 @@ class IrToPythonCompiler:
         self.print(1, "return (ptr, amount)")
         self.print(0, "")
 
-        self.print(0, "def _free(amount):")
-        self.print(1, "for _ in range(amount):")
-        self.print(2, "stack.pop()")
-        self.print(0, "")
-
     def generate(self, ir_mod):
         """ Write ir-code to file f """
         self.mod_name = ir_mod.name
@@ -222,130 +232,242 @@ class IrToPythonCompiler:
 
     def generate_function(self, ir_function):
         """ Generate a function to python code """
-        self.stack_size = 0
+        lower_jump_tables(ir_function, jump_tables=False)
         args = ",".join(a.name for a in ir_function.arguments)
         self.emit("def {}({}):".format(ir_function.name, args))
         with self.indented():
+            # Allocations can be done in loops, so remember the top of
+            # the stack, and free everything above it upon return:
+            self.uses_stack = any(
+                isinstance(ins, ir.Alloc)
+                for block in ir_function
+                for ins in block
+            )
+            if self.uses_stack:
+                self.emit("_stack_top = len(stack)")
+
+            # Generate into a buffer, so that we can start over in case
+            # the structured approach fails:
+            output_file = self.output_file
+            num_literals = len(self.literals)
+            self.output_file = io.StringIO()
             try:
-                # TODO: remove this to enable shape style:
-                raise ValueError
-                shape, _rmap = relooper.find_structure(ir_function)
-                src = io.StringIO()
-                relooper.print_shape(shape, file=src)
-                self.reporter.dump_source(ir_function.name, src.getvalue())
-                self._rmap = _rmap
-                self._shape_style = True
-                self.generate_shape(shape)
-            except ValueError:
-                self.logger.debug("Falling back to block-switch-style")
-                # Fall back to block switch stack!
-                self._shape_style = False
+                if not self.structured:
+                    raise ValueError("Structured code generation disabled")
+                self.generate_function_structured(ir_function)
+            except ValueError as ex:
+                self.logger.debug(
+                    "Falling back to block dispatch for %s: %s",
+                    ir_function.name,
+                    ex,
+                )
+                self.output_file = io.StringIO()
+                del self.literals[num_literals:]
                 self.generate_function_fallback(ir_function)
+            finally:
+                code = self.output_file.getvalue()
+                self.output_file = output_file
+            self.output_file.write(code)
 
         # Register function for function pointers:
         self.emit("func_pointers.append({})".format(ir_function.name))
         self.func_ptr_map[ir_function] = len(self.func_ptr_map)
         self.emit("")
 
-    def generate_shape(self, shape):
-        """ Generate python code for a shape structured program """
+    def generate_function_structured(self, ir_function):
+        """ Generate structured while and if statements.
+
+        The shape of the function is determined by the relooper. Each
+        control flow edge is checked to end up at the right block, when
+        this is not the case, a ValueError is raised.
+        """
+        shape, self._rmap = relooper.find_structure(ir_function)
+        if self.reporter:
+            src = io.StringIO()
+            relooper.print_shape(shape, file=src)
+            self.reporter.dump_source(ir_function.name, src.getvalue())
+        self._loops = []
+        if self.shape_entry(shape) is not ir_function.entry:
+            raise ValueError("Shape does not start at entry block")
+        self.generate_shape(shape, None)
+
+    def shape_entry(self, shape):
+        """ Determine the block at which the given shape starts """
+        if isinstance(shape, (relooper.BasicShape, relooper.IfShape)):
+            return self._rmap[shape.content]
+        elif isinstance(shape, relooper.SequenceShape):
+            shapes = [s for s in shape.shapes if s is not None]
+            if not shapes:
+                raise ValueError("Empty sequence")
+            return self.shape_entry(shapes[0])
+        elif isinstance(shape, relooper.LoopShape):
+            return self.shape_entry(shape.body)
+        elif isinstance(shape, relooper.ContinueShape) and self._loops:
+            return self._loops[-1][0]
+        elif isinstance(shape, relooper.BreakShape) and self._loops:
+            return self._loops[-1][1]
+        else:
+            raise ValueError("Cannot determine entry of {}".format(shape))
+
+    def generate_shape(self, shape, follow):
+        """ Generate python code for a shape structured program.
+
+        The follow block is the block which is executed when control
+        flows off the end of the shape.
+        """
         if isinstance(shape, relooper.BasicShape):
-            self.generate_block(self._rmap[shape.content])
+            block = self._rmap[shape.content]
+            jump = self.generate_block(block)
+            if isinstance(jump, ir.Jump):
+                self.generate_edge(block, jump.target, follow)
+            elif isinstance(jump, ir.CJump) and jump.lab_yes is jump.lab_no:
+                self.generate_edge(block, jump.lab_yes, follow)
+            elif jump is not None:
+                raise ValueError("Unexpected jump {}".format(jump))
         elif isinstance(shape, relooper.SequenceShape):
-            if shape.shapes:
-                for sub_shape in shape.shapes:
-                    self.generate_shape(sub_shape)
-            else:
-                self.emit("pass")
+            shapes = [s for s in shape.shapes if s is not None]
+            for sub_shape, next_shape in zip(shapes, shapes[1:] + [None]):
+                if next_shape is None:
+                    sub_follow = follow
+                else:
+                    sub_follow = self.shape_entry(next_shape)
+                self.generate_shape(sub_shape, sub_follow)
         elif isinstance(shape, relooper.IfShape):
-            blk = self._rmap[shape.content]
-            self.generate_block(blk)
+            block = self._rmap[shape.content]
+            jump = self.generate_block(block)
+            if not isinstance(jump, ir.CJump):
+                raise ValueError("Expected cjump, got {}".format(jump))
+            self.emit_condition(jump)
             with self.indented():
-                if shape.yes_shape:
-                    self.generate_shape(shape.yes_shape)
-                else:
-                    self.emit("pass")
-            if shape.no_shape:
-                self.emit("else:")
-                with self.indented():
-                    self.generate_shape(shape.no_shape)
+                self.generate_branch(
+                    block, jump.lab_yes, shape.yes_shape, follow
+                )
+            self.emit("else:")
+            with self.indented():
+                self.generate_branch(
+                    block, jump.lab_no, shape.no_shape, follow
+                )
         elif isinstance(shape, relooper.LoopShape):
+            header = self.shape_entry(shape.body)
+            self._loops.append((header, follow))
             self.emit("while True:")
             with self.indented():
-                self.generate_shape(shape.body)
+                self.generate_shape(shape.body, header)
+            self._loops.pop(-1)
         elif isinstance(shape, relooper.ContinueShape):
             self.emit("continue")
         elif isinstance(shape, relooper.BreakShape):
             self.emit("break")
-        elif shape is None:
-            self.emit("pass")
         else:  # pragma: no cover
             raise NotImplementedError(str(shape))
 
+    def generate_branch(self, block, target, shape, follow):
+        """ Generate one of the branches of an if-shape """
+        if shape is None or isinstance(
+            shape, (relooper.BreakShape, relooper.ContinueShape)
+        ):
+            self.generate_edge(block, target, follow)
+        else:
+            if self.shape_entry(shape) is not target:
+                raise ValueError("Branch does not start at {}".format(target))
+            self.fill_phis(block, target)
+            self.generate_shape(shape, follow)
+
+    def generate_edge(self, block, target, follow):
+        """ Transfer control from block to target.
+
+        This can be done by falling through to the follow block, or by
+        continuing or breaking the innermost loop.
+        """
+        phis_filled = self.fill_phis(block, target)
+        if target is follow:
+            if not phis_filled:
+                self.emit("pass")
+        elif self._loops and target is self._loops[-1][0]:
+            self.emit("continue")
+        elif self._loops and target is self._loops[-1][1]:
+            self.emit("break")
+        else:
+            raise ValueError(
+                "Cannot transfer control from {} to {}".format(block, target)
+            )
+
     def generate_function_fallback(self, ir_function):
         """ Generate a while-true with a switch-case on current block.
 
-        This is an non-optimal, but always working strategy.
+        This is an non-optimal, but always working strategy. Blocks are
+        identified by an integer, and the entry block is checked first.
         """
-        self.emit("prev_block = None")
-        self.emit("current_block = '{}'".format(ir_function.entry.name))
+        blocks = [ir_function.entry] + [
+            b for b in ir_function.blocks if b is not ir_function.entry
+        ]
+        self._block_ids = {block: i for i, block in enumerate(blocks)}
+        self.emit("current_block = 0")
         self.emit("while True:")
         with self.indented():
-            for block in ir_function.blocks:
-                self.emit('if current_block == "{}":'.format(block.name))
+            for block in blocks:
+                self.emit(
+                    "if current_block == {}:".format(self._block_ids[block])
+                )
                 with self.indented():
-                    self.generate_block(block)
+                    jump = self.generate_block(block)
+                    if jump is not None:
+                        self.generate_dispatch(block, jump)
         self.emit("")
 
+    def generate_dispatch(self, block, jump):
+        """ Select the next block to execute by setting the block id """
+        if isinstance(jump, ir.CJump):
+            self.emit_condition(jump)
+            with self.indented():
+                self.generate_goto(block, jump.lab_yes)
+            self.emit("else:")
+            with self.indented():
+                self.generate_goto(block, jump.lab_no)
+        elif isinstance(jump, ir.Jump):
+            self.generate_goto(block, jump.target)
+        else:  # pragma: no cover
+            raise NotImplementedError(str(jump))
+
+    def generate_goto(self, block, target):
+        self.fill_phis(block, target)
+        self.emit("current_block = {}".format(self._block_ids[target]))
+
+    def emit_condition(self, jump):
+        """ Emit the if statement of a conditional jump """
+        self.emit("if {} {} {}:".format(jump.a.name, jump.cond, jump.b.name))
+
     def generate_block(self, block):
-        """ Generate code for one block """
+        """ Generate code for one block.
+
+        The code for a final jump instruction is not generated, instead
+        the jump is returned.
+        """
         for ins in block:
+            if isinstance(ins, ir.JumpBase):
+                return ins
             self.generate_instruction(ins, block)
 
-        if not self._shape_style:
-            self.fill_phis(block)
+    def fill_phis(self, block, target):
+        """ Generate phi fill code for the edge from block to target.
 
-    def fill_phis(self, block):
-        # Generate eventual phi fill code:
-        phis = [p for s in block.successors for p in s.phis]
+        Returns whether any code was generated.
+        """
+        phis = target.phis
         if phis:
             phi_names = ", ".join(p.name for p in phis)
             value_names = ", ".join(p.inputs[block].name for p in phis)
             self.emit("{} = {}".format(phi_names, value_names))
+        return bool(phis)
 
     def reset_stack(self):
-        self.emit("_free({})".format(self.stack_size))
-        self.stack_size = 0
+        if self.uses_stack:
+            self.emit("del stack[_stack_top:]")
 
     def generate_instruction(self, ins, block):
         """ Generate python code for this instruction """
-        if isinstance(ins, ir.CJump):
-            if self._shape_style:
-                self.fill_phis(block)
-                self.emit(
-                    "if {} {} {}:".format(ins.a.name, ins.cond, ins.b.name)
-                )
-            else:
-                self.emit(
-                    "if {} {} {}:".format(ins.a.name, ins.cond, ins.b.name)
-                )
-                with self.indented():
-                    self.emit("prev_block = current_block")
-                    self.emit('current_block = "{}"'.format(ins.lab_yes.name))
-                self.emit("else:")
-                with self.indented():
-                    self.emit("prev_block = current_block")
-                    self.emit('current_block = "{}"'.format(ins.lab_no.name))
-        elif isinstance(ins, ir.Jump):
-            if self._shape_style:
-                self.fill_phis(block)
-                self.emit("pass")
-            else:
-                self.emit("prev_block = current_block")
-                self.emit('current_block = "{}"'.format(ins.target.name))
-        elif isinstance(ins, ir.Alloc):
+        if isinstance(ins, ir.Alloc):
             self.emit("{} = _alloca({})".format(ins.name, ins.amount))
-            self.stack_size += ins.amount
         elif isinstance(ins, ir.AddressOf):
             self.emit("{} = {}[0]".format(ins.name, ins.src.name))
         elif isinstance(ins, ir.Const):
@@ -360,7 +482,13 @@ class IrToPythonCompiler:
             )
         elif isinstance(ins, ir.Unop):
             op = ins.operation
-            self.emit("{} = {}{}".format(ins.name, op, ins.a.name))
+            if op == "sqrt":
+                self.emit(
+                    "{0} = math.sqrt({1}) if {1} >= 0 else "
+                    "float('nan')".format(ins.name, ins.a.name)
+                )
+            else:
+                self.emit("{} = {}{}".format(ins.name, op, ins.a.name))
             if ins.ty.is_integer:
                 self.emit(
                     "{0} = correct({0}, {1}, {2})".format(
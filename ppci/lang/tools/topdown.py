@@ -0,0 +1,239 @@
+""" Top down parser for ambiguous grammars.
+
+The parser only tries the productions of a non-terminal that can start with
+the next token. Tables with these productions are created once per grammar,
+so the parser does not need to consider the whole grammar for each input,
+like the earley parser does.
+
+All ways in which a symbol can be parsed at some position are found, and
+remembered. When a symbol can be parsed in several ways up to the same
+position, the way with the lowest priority is kept. Priorities of the
+productions are compared top down, and the last symbol of a production
+first, like the earley parser does. Unlike the earley parser, ties
+between productions of equal priority are always broken in the same way,
+by preferring the production which was added to the grammar first.
+
+Left recursion is supported when a production refers to itself directly,
+such as ``list -> list ',' item``. Non-terminals which are left recursive
+through other non-terminals are not supported. For these, the parser
+raises an error, and another parser must be used.
+"""
+
+from ...common import ParseError
+from .common import ParserGenerationException
+
+
+class UnsupportedGrammar(ParserGenerationException):
+    """ Raised when parsing input requires unsupported left recursion """
+
+    pass
+
+
+def calculate_nullable(grammar):
+    """ Determine which non-terminals can produce the empty string """
+    nullable = set()
+    changed = True
+    while changed:
+        changed = False
+        for production in grammar.productions:
+            if production.name in nullable:
+                continue
+            if all(s in nullable for s in production.symbols):
+                nullable.add(production.name)
+                changed = True
+    return nullable
+
+
+class TopDownParser:
+    """ Parser which tries productions based on the next token """
+
+    def __init__(self, grammar):
+        self.grammar = grammar
+        self.nonterminals = set(grammar.nonterminals)
+        self.nullable = calculate_nullable(grammar)
+        first = self.calculate_first_sets()
+
+        # Split productions into directly left recursive and other ones:
+        self.recursive = {}
+        self.tables = {}
+        self.empty = {}
+        self.order = {}
+        for index, production in enumerate(grammar.productions):
+            # Of productions with equal priority, prefer the first one:
+            self.order[production] = index
+            name = production.name
+            self.tables.setdefault(name, {})
+            self.empty.setdefault(name, [])
+            symbols = production.symbols
+            if symbols and symbols[0] == name:
+                self.recursive.setdefault(name, []).append(production)
+                continue
+
+            # Register the production for the tokens it can start with:
+            for token_type in self.first_of(symbols, first):
+                self.tables[name].setdefault(token_type, []).append(
+                    production
+                )
+            if all(s in self.nullable for s in symbols):
+                self.empty[name].append(production)
+
+        # Nullable productions are candidates for any token:
+        for name, table in self.tables.items():
+            for token_type, productions in table.items():
+                for production in self.empty[name]:
+                    if production not in productions:
+                        productions.append(production)
+
+        self.unsupported = self.find_indirect_left_recursion()
+
+    def calculate_first_sets(self):
+        """ Determine the token types each non-terminal can start with """
+        first = {name: set() for name in self.nonterminals}
+        changed = True
+        while changed:
+            changed = False
+            for production in self.grammar.productions:
+                new = self.first_of(production.symbols, first)
+                if new - first[production.name]:
+                    first[production.name] |= new
+                    changed = True
+        return first
+
+    def first_of(self, symbols, first):
+        """ Get the token types a sequence of symbols can start with """
+        result = set()
+        for symbol in symbols:
+            if symbol in self.nonterminals:
+                result |= first[symbol]
+                if symbol not in self.nullable:
+                    break
+            else:
+                result.add(symbol)
+                break
+        return result
+
+    def find_indirect_left_recursion(self):
+        """ Find non-terminals which are left recursive via other ones """
+        left = {name: set() for name in self.nonterminals}
+        for production in self.grammar.productions:
+            symbols = production.symbols
+            if symbols and symbols[0] == production.name:
+                # Direct left recursion, must be followed by some token:
+                if all(s in self.nullable for s in symbols[1:]):
+                    left[production.name].add(production.name)
+                continue
+            for symbol in symbols:
+                if symbol not in self.nonterminals:
+                    break
+                left[production.name].add(symbol)
+                if symbol not in self.nullable:
+                    break
+
+        unsupported = set()
+        for name in self.nonterminals:
+            reachable = set()
+            worklist = list(left[name])
+            while worklist:
+                symbol = worklist.pop()
+                if symbol not in reachable:
+                    reachable.add(symbol)
+                    worklist.extend(left[symbol])
+            if name in reachable:
+                unsupported.add(name)
+        return unsupported
+
+    def parse(self, tokens):
+        """ Parse a list of tokens, and apply the semantic actions """
+        self.tokens = tokens
+        self.memo = {}
+        results = self.match(self.grammar.start_symbol, 0)
+        if len(tokens) not in results:
+            raise ParseError("Parsing failed")
+        _, tree = results[len(tokens)]
+        return self.evaluate(tree)
+
+    def match(self, symbol, position):
+        """ Find all ways to parse a symbol at the given position.
+
+        Returns a dictionary with the end positions of the symbol as keys,
+        and the priority and parse tree as values.
+        """
+        tokens = self.tokens
+        if symbol not in self.nonterminals:
+            if position < len(tokens) and tokens[position].typ == symbol:
+                return {position + 1: ((), tokens[position])}
+            return {}
+
+        key = (symbol, position)
+        if key in self.memo:
+            return self.memo[key]
+
+        if symbol in self.unsupported:
+            raise UnsupportedGrammar(
+                "{} is indirectly left recursive".format(symbol)
+            )
+
+        if position < len(tokens):
+            productions = self.tables[symbol].get(
+                tokens[position].typ, self.empty[symbol]
+            )
+        else:
+            productions = self.empty[symbol]
+
+        results = {}
+        for production in productions:
+            self.match_production(production, position, (), results)
+
+        # Grow directly left recursive productions:
+        if symbol in self.recursive:
+            worklist = list(results.items())
+            while worklist:
+                end, result = worklist.pop(0)
+                for production in self.recursive[symbol]:
+                    new = {}
+                    self.match_production(production, end, (result,), new)
+                    for new_end, new_result in new.items():
+                        if self.add_result(results, new_end, new_result):
+                            worklist.append((new_end, new_result))
+
+        self.memo[key] = results
+        return results
+
+    def match_production(self, production, position, prefix, results):
+        """ Match the symbols of a production, after the given prefix """
+        partials = [(position, prefix)]
+        for symbol in production.symbols[len(prefix) :]:
+            new_partials = []
+            for start, parts in partials:
+                for end, result in self.match(symbol, start).items():
+                    new_partials.append((end, parts + (result,)))
+            partials = new_partials
+            if not partials:
+                return
+
+        for end, parts in partials:
+            keys = tuple(result[0] for result in reversed(parts))
+            trees = [result[1] for result in parts]
+            key = (production.priority, self.order[production]) + keys
+            self.add_result(results, end, (key, (production, trees)))
+
+    @staticmethod
+    def add_result(results, end, result):
+        """ Add a result, when it is better than a result with the same end.
+
+        Returns True if the result was added.
+        """
+        if end not in results or result[0] < results[end][0]:
+            results[end] = result
+            return True
+        return False
+
+    def evaluate(self, tree):
+        """ Apply the semantic actions of a parse tree """
+        if isinstance(tree, tuple):
+            production, children = tree
+            args = [self.evaluate(child) for child in children]
+            if production.f:
+                return production.f(*args)
+            return None
+        return tree
@@ -1,8 +1,11 @@
 from .clean import CleanPass
 from .mem2reg import Mem2RegPromotor
 from .cse import CommonSubexpressionEliminationPass
+from .gvn import GlobalValueNumberingPass
 from .constantfolding import ConstantFolder
+from .licm import LoopInvariantCodeMotionPass
 from .load_after_store import LoadAfterStorePass
+from .strength_reduction import StrengthReductionPass
 from .transform import RemoveAddZeroPass
 from .transform import DeleteUnusedInstructionsPass
 from .transform import ModulePass, FunctionPass, BlockPass, InstructionPass
@@ -17,7 +20,10 @@ __all__ = [
     "CommonSubexpressionEliminationPass",
     "ConstantFolder",
     "DeleteUnusedInstructionsPass",
+    "GlobalValueNumberingPass",
     "LoadAfterStorePass",
+    "LoopInvariantCodeMotionPass",
     "Mem2RegPromotor",
     "RemoveAddZeroPass",
+    "StrengthReductionPass",
 ]
@@ -0,0 +1,130 @@
+""" Global value numbering.
+
+Walk the dominator tree, and replace each computation by an equal
+computation which dominates it. This extends common subexpression
+elimination across blocks.
+"""
+
+from .transform import FunctionPass
+from .. import ir
+from ..graph.domtree import CfgInfo
+
+
+class GlobalValueNumberingPass(FunctionPass):
+    """ Replace values by equal values defined in a dominating block.
+
+    Binary and unary operations, constants, casts, addresses and loads
+    are numbered. A load is only replaced by an earlier load of the same
+    address when memory cannot have been changed in between.
+    """
+
+    commutative_operations = ("+", "*", "&", "|", "^")
+    memory_writes = (
+        ir.Store,
+        ir.FunctionCall,
+        ir.ProcedureCall,
+        ir.CopyBlob,
+        ir.InlineAsm,
+    )
+
+    def on_function(self, function):
+        cfg_info = CfgInfo(function)
+        self.memory_version = 0
+        values = {}
+        replaced = 0
+
+        # Walk the dominator tree, and forget the values of a block when
+        # leaving its subtree:
+        worklist = [(cfg_info.cfg.root_tree, None, None)]
+        while worklist:
+            item = worklist.pop()
+            if isinstance(item, list):
+                for key in item:
+                    del values[key]
+                continue
+
+            tree_node, parent_block, memory = item
+            cfg_node = tree_node.node
+            if not cfg_info.has_block(cfg_node):
+                continue
+            block = cfg_info.get_block(cfg_node)
+
+            # Memory is only unchanged when coming straight from the
+            # dominating block:
+            if block.predecessors != [parent_block]:
+                memory = self.new_memory_version()
+
+            keys = []
+            for instruction in block:
+                if isinstance(instruction, self.memory_writes):
+                    memory = self.new_memory_version()
+                    continue
+
+                key = self.make_key(instruction, memory)
+                if key is None:
+                    continue
+
+                existing = self.lookup(values, key)
+                if existing is None:
+                    values[key] = instruction
+                    keys.append(key)
+                else:
+                    instruction.replace_by(existing)
+                    replaced += 1
+
+            worklist.append(keys)
+            for child in tree_node.children:
+                worklist.append((child, block, memory))
+
+        if replaced > 0:
+            self.logger.debug(
+                "Replaced %s instructions in %s", replaced, function.name
+            )
+
+    def new_memory_version(self):
+        self.memory_version += 1
+        return self.memory_version
+
+    def make_key(self, instruction, memory):
+        """ Create a key which is equal for instructions with equal
+        values, or None if the instruction cannot be numbered. """
+        if isinstance(instruction, ir.Binop):
+            return (
+                ir.Binop,
+                instruction.a,
+                instruction.operation,
+                instruction.b,
+                instruction.ty,
+            )
+        elif isinstance(instruction, ir.Const):
+            # Use repr to distinguish 0.0 from -0.0:
+            value = instruction.value
+            return (ir.Const, type(value), repr(value), instruction.ty)
+        elif isinstance(instruction, ir.Cast):
+            return (ir.Cast, instruction.src, instruction.ty)
+        elif isinstance(instruction, ir.Unop):
+            return (
+                ir.Unop,
+                instruction.operation,
+                instruction.a,
+                instruction.ty,
+            )
+        elif isinstance(instruction, ir.AddressOf):
+            return (ir.AddressOf, instruction.src)
+        elif isinstance(instruction, ir.Load):
+            if instruction.volatile:
+                return None
+            return (ir.Load, instruction.address, instruction.ty, memory)
+        else:
+            return None
+
+    def lookup(self, values, key):
+        """ Find an equal value """
+        if key in values:
+            return values[key]
+
+        # Try the operands the other way around:
+        if key[0] is ir.Binop and key[2] in self.commutative_operations:
+            _, a, operation, b, ty = key
+            return values.get((ir.Binop, b, operation, a, ty))
+        return None
@@ -0,0 +1,116 @@
+""" Loop invariant code motion.
+
+Computations inside a loop which have the same value in each iteration
+are moved into the preheader of the loop, so they are done only once.
+"""
+
+from .transform import FunctionPass
+from .loops import find_loops, move_instruction
+from .. import ir
+
+
+class LoopInvariantCodeMotionPass(FunctionPass):
+    """ Hoist loop invariant computations out of loops.
+
+    Binary and unary operations and casts are hoisted when their operands
+    are defined outside of the loop. Integer divisions are not hoisted,
+    since they can trap when the loop would not execute them.
+
+    A load is only hoisted when the loop does not write memory, and when
+    the load is done in every iteration or loads a variable.
+
+    Constants and addresses of locals are not hoisted on their own, since
+    code generators can embed them in instructions. They are copied into
+    the preheader when a hoisted instruction uses them.
+    """
+
+    memory_writes = (
+        ir.Store,
+        ir.FunctionCall,
+        ir.ProcedureCall,
+        ir.CopyBlob,
+        ir.InlineAsm,
+    )
+
+    def on_function(self, function):
+        hoisted = 0
+        for loop in find_loops(function):
+            hoisted += self.hoist_loop(loop)
+
+        if hoisted > 0:
+            self.logger.debug(
+                "Hoisted %s instructions out of loops in %s",
+                hoisted,
+                function.name,
+            )
+
+    def hoist_loop(self, loop):
+        """ Move the invariant instructions of a loop into its preheader """
+        blocks = [b for b in loop.header.function if b in loop.blocks]
+        writes_memory = any(
+            isinstance(instruction, self.memory_writes)
+            for block in blocks
+            for instruction in block
+        )
+        preheader = None
+        hoisted = 0
+        changed = True
+        while changed:
+            changed = False
+            for block in blocks:
+                for instruction in list(block):
+                    if not self.is_invariant(instruction, loop, writes_memory):
+                        continue
+
+                    if preheader is None:
+                        preheader = loop.get_preheader()
+                        if preheader is None:
+                            return hoisted
+
+                    self.copy_operands(instruction, loop, preheader)
+                    move_instruction(instruction, preheader)
+                    hoisted += 1
+                    changed = True
+        return hoisted
+
+    def is_invariant(self, instruction, loop, writes_memory):
+        """ Test if the instruction can be moved out of the loop """
+        if isinstance(instruction, ir.Binop):
+            if instruction.operation in ("/", "%"):
+                if instruction.ty.is_integer:
+                    return False
+        elif isinstance(instruction, ir.Load):
+            if writes_memory or instruction.volatile:
+                return False
+            if not (
+                instruction.block in loop.exit_dominators
+                or isinstance(instruction.address, ir.Variable)
+            ):
+                return False
+        elif not isinstance(instruction, (ir.Unop, ir.Cast)):
+            return False
+
+        return all(
+            self.is_copyable(value, loop) or not loop.defines(value)
+            for value in instruction.uses
+        )
+
+    @staticmethod
+    def is_copyable(value, loop):
+        """ Test if the value can be copied into the preheader """
+        if isinstance(value, ir.AddressOf):
+            return not loop.defines(value.src)
+        return isinstance(value, ir.Const)
+
+    def copy_operands(self, instruction, loop, preheader):
+        """ Copy the constants and addresses used by the instruction """
+        for value in list(instruction.uses):
+            if loop.defines(value) and self.is_copyable(value, loop):
+                if isinstance(value, ir.Const):
+                    copy = ir.Const(value.value, value.name, value.ty)
+                else:
+                    copy = ir.AddressOf(value.src, value.name)
+                preheader.insert_instruction(
+                    copy, preheader.last_instruction
+                )
+                instruction.replace_use(value, copy)
@@ -0,0 +1,106 @@
+""" Loops in ir-code functions, for use by loop optimizations. """
+
+from .. import ir
+from ..graph.domtree import CfgInfo
+
+
+class Loop:
+    """ A natural loop, which is entered via its header block """
+
+    def __init__(self, header, blocks, exit_dominators):
+        self.header = header
+        self.blocks = blocks
+        self.exit_dominators = exit_dominators
+        self.outer_loops = []
+
+    def __repr__(self):
+        return "Loop(header={}, blocks={})".format(
+            self.header.name, len(self.blocks)
+        )
+
+    @property
+    def latches(self):
+        """ The blocks in the loop which jump back to the header """
+        return [b for b in self.header.predecessors if b in self.blocks]
+
+    def defines(self, value):
+        """ Test if the value is computed inside this loop """
+        return isinstance(value, ir.Instruction) and value.block in self.blocks
+
+    def get_preheader(self):
+        """ Get the block via which the loop is entered.
+
+        When the block which enters the loop also jumps elsewhere, a new
+        block is placed in between. None is returned when the loop is
+        entered from several blocks.
+        """
+        entries = [b for b in self.header.predecessors if b not in self.blocks]
+        if len(entries) != 1:
+            return None
+        entry = entries[0]
+        if entry.successors == [self.header]:
+            return entry
+
+        preheader = ir.Block("{}_preheader".format(self.header.name))
+        self.header.function.add_block(preheader)
+        preheader.add_instruction(ir.Jump(self.header))
+        entry.change_target(self.header, preheader)
+        self.header.replace_incoming(entry, [preheader])
+        for outer_loop in self.outer_loops:
+            outer_loop.blocks.add(preheader)
+        return preheader
+
+
+def find_loops(function):
+    """ Find the loops in a function, inner loops before outer loops """
+    cfg_info = CfgInfo(function)
+    cfg = cfg_info.cfg
+
+    # The loop body consists of the nodes which reach a back edge without
+    # passing the header. Loops which share a header are merged:
+    loop_nodes = {}
+    for cfg_loop in cfg.calculate_loops():
+        header = cfg_loop.header
+        if header in loop_nodes:
+            continue
+        nodes = loop_nodes[header] = {header}
+        worklist = [
+            n for n in cfg.predecessors(header) if header.dominates(n)
+        ]
+        while worklist:
+            node = worklist.pop()
+            if node not in nodes:
+                nodes.add(node)
+                worklist.extend(cfg.predecessors(node))
+
+    loops = []
+    for header, nodes in loop_nodes.items():
+        blocks = set(cfg_info.get_block(n) for n in nodes)
+        exiting_nodes = [
+            n for n in nodes if any(s not in nodes for s in n.successors)
+        ]
+        exit_dominators = set(
+            cfg_info.get_block(n)
+            for n in nodes
+            if all(n.dominates(e) for e in exiting_nodes)
+        )
+        loops.append(
+            Loop(cfg_info.get_block(header), blocks, exit_dominators)
+        )
+
+    order = function.blocks
+    loops.sort(key=lambda loop: (len(loop.blocks), order.index(loop.header)))
+    for loop in loops:
+        loop.outer_loops = [
+            other
+            for other in loops
+            if other is not loop and loop.header in other.blocks
+        ]
+    return loops
+
+
+def move_instruction(instruction, block):
+    """ Move an instruction to the end of a block, before its terminator """
+    instruction.block.remove_instruction(instruction)
+    instruction.block = block
+    block.instructions.insert(len(block.instructions) - 1, instruction)
@@ -0,0 +1,266 @@
+""" Strength reduction of induction variables.
+
+An address which is computed from a loop counter in each iteration, such
+as:
+
+.. code::
+
+    ptr index = cast i;
+    ptr offset = index * size;
+    ptr address = base + offset;
+
+is replaced by a pointer, which is incremented together with the loop
+counter:
+
+.. code::
+
+    ptr address = phi preheader: start, latch: next;
+    ...
+    ptr next = address + step;
+"""
+
+from .transform import FunctionPass
+from .loops import find_loops
+from .. import ir
+
+
+class StrengthReductionPass(FunctionPass):
+    """ Replace address computations based on a loop counter by pointers
+    which are incremented in each iteration.
+
+    A loop counter is a phi in the loop header, which is incremented by a
+    constant in the only block which jumps back to the header. An address
+    is the sum of a loop invariant base and the counter multiplied by a
+    constant, in pointer arithmetic. A loop invariant value may be added to
+    the counter before it is multiplied.
+    """
+
+    def on_function(self, function):
+        reduced = 0
+        for loop in find_loops(function):
+            reduced += self.reduce_loop(loop)
+
+        if reduced > 0:
+            self.logger.debug(
+                "Reduced %s address computations in %s",
+                reduced,
+                function.name,
+            )
+
+    def reduce_loop(self, loop):
+        """ Replace the addresses computed from counters in the loop """
+        latches = loop.latches
+        if len(latches) != 1:
+            return 0
+        latch = latches[0]
+
+        steps = {}
+        for phi in loop.header.phis:
+            step = self.get_step(phi, latch)
+            if step is not None:
+                steps[phi] = step
+
+        candidates = []
+        for block in loop.header.function:
+            if block not in loop.blocks:
+                continue
+            for instruction in block:
+                candidate = self.match_address(instruction, loop, steps)
+                if candidate is not None:
+                    candidates.append((instruction,) + candidate)
+
+        if not candidates:
+            return 0
+
+        preheader = loop.get_preheader()
+        if preheader is None:
+            return 0
+
+        for address, counter, addend, scale, base in candidates:
+            self.reduce_address(
+                address,
+                counter,
+                addend,
+                scale,
+                base,
+                steps[counter],
+                preheader,
+                latch,
+            )
+        return len(candidates)
+
+    @staticmethod
+    def get_step(phi, latch):
+        """ Get the constant by which the phi is incremented, or None """
+        if not (phi.ty is ir.ptr or phi.ty.is_integer):
+            return None
+        if len(phi.inputs) != 2 or latch not in phi.inputs:
+            return None
+
+        value = phi.get_value(latch)
+        if not isinstance(value, ir.Binop):
+            return None
+
+        if value.operation == "+":
+            if value.a is phi:
+                step = value.b
+            elif value.b is phi:
+                step = value.a
+            else:
+                return None
+        elif value.operation == "-" and value.a is phi:
+            step = value.b
+        else:
+            return None
+
+        if not isinstance(step, ir.Const) or not isinstance(step.value, int):
+            return None
+
+        if value.operation == "-":
+            return -step.value
+        return step.value
+
+    def match_address(self, instruction, loop, steps):
+        """ Match base + counter * scale.
+
+        Returns a tuple with the counter, addend, scale and base, or None.
+        """
+        if not (
+            isinstance(instruction, ir.Binop)
+            and instruction.operation == "+"
+            and instruction.ty is ir.ptr
+        ):
+            return None
+
+        # Only replace addresses which are used in the loop:
+        if not all(use.block in loop.blocks for use in instruction.used_by):
+            return None
+
+        for index, base in (
+            (instruction.a, instruction.b),
+            (instruction.b, instruction.a),
+        ):
+            if loop.defines(base) and not isinstance(base, ir.Const):
+                continue
+
+            # A counter itself is not computed, so there is nothing
+            # to reduce:
+            if index in steps:
+                continue
+
+            scaled = self.match_scaled(index, loop, steps)
+            if scaled is not None:
+                return scaled + (base,)
+        return None
+
+    def match_scaled(self, value, loop, steps):
+        """ Match (counter + addend) * scale, where the addend is optional
+        and loop invariant.
+
+        Returns a tuple with the counter, addend and scale, or None.
+        """
+        if value in steps:
+            counter = value
+            # The counter may not overflow before it is made a pointer:
+            ty = counter.ty
+            if ty is ir.ptr or ty.is_signed or ty.bits >= 64:
+                return counter, None, 1
+        elif isinstance(value, ir.Cast) and value.ty is ir.ptr:
+            return self.match_counter(value.src, loop, steps)
+        elif isinstance(value, ir.Binop) and value.ty is ir.ptr:
+            if value.operation in ("*", "<<") and isinstance(
+                value.b, ir.Const
+            ):
+                factor, operand = value.b.value, value.a
+            elif value.operation == "*" and isinstance(value.a, ir.Const):
+                factor, operand = value.a.value, value.b
+            else:
+                return None
+
+            if not isinstance(factor, int) or factor < 0:
+                return None
+            if value.operation == "<<":
+                factor = 1 << factor
+
+            scaled = self.match_scaled(operand, loop, steps)
+            if scaled is not None:
+                counter, addend, scale = scaled
+                return counter, addend, scale * factor
+        return None
+
+    def match_counter(self, value, loop, steps):
+        """ Match counter + addend, before it is made a pointer """
+        if value in steps:
+            return self.match_scaled(value, loop, steps)
+
+        if isinstance(value, ir.Binop) and value.operation == "+":
+            for counter, addend in ((value.a, value.b), (value.b, value.a)):
+                if counter in steps and (
+                    isinstance(addend, ir.Const) or not loop.defines(addend)
+                ):
+                    scaled = self.match_scaled(counter, loop, steps)
+                    if scaled is not None:
+                        return counter, addend, 1
+        return None
+
+    def reduce_address(
+        self, address, counter, addend, scale, base, step, preheader, latch
+    ):
+        """ Replace the address by a pointer incremented with step """
+        header = counter.block
+
+        def emit(block, instruction):
+            block.insert_instruction(instruction, block.last_instruction)
+            return instruction
+
+        # The start address, computed before the loop:
+        if isinstance(base, ir.Const):
+            base = emit(preheader, ir.Const(base.value, base.name, base.ty))
+        start = counter.get_value(preheader)
+        if isinstance(addend, ir.Const):
+            addend = emit(
+                preheader, ir.Const(addend.value, addend.name, addend.ty)
+            )
+        if addend is not None:
+            start = emit(preheader, ir.add(start, addend, "start", start.ty))
+        if isinstance(start, ir.Const) and isinstance(start.value, int):
+            offset = emit(
+                preheader, ir.Const(start.value * scale, "offset", ir.ptr)
+            )
+        else:
+            if start.ty is not ir.ptr:
+                start = emit(preheader, ir.Cast(start, "start", ir.ptr))
+            stride = emit(preheader, ir.Const(scale, "stride", ir.ptr))
+            offset = emit(preheader, ir.mul(start, stride, "offset", ir.ptr))
+        start = emit(preheader, ir.add(base, offset, "start", ir.ptr))
+
+        pointer = ir.Phi(address.name, ir.ptr)
+        header.insert_instruction(pointer)
+        pointer.set_incoming(preheader, start)
+
+        # The next address, computed at the end of each iteration:
+        increment = emit(latch, ir.Const(abs(step * scale), "step", ir.ptr))
+        operation = "+" if step >= 0 else "-"
+        next_pointer = emit(
+            latch,
+            ir.Binop(pointer, operation, increment, "next_pointer", ir.ptr),
+        )
+        pointer.set_incoming(latch, next_pointer)
+
+        address.replace_by(pointer)
+        self.remove_unused(address)
+
+    @staticmethod
+    def remove_unused(value):
+        """ Remove a replaced computation, and the operands which were
+        only used by it. """
+        worklist = [value]
+        while worklist:
+            value = worklist.pop()
+            if value.is_used or not isinstance(
+                value, (ir.Binop, ir.Cast, ir.Const)
+            ):
+                continue
+            operands = list(value.uses)
+            value.remove_from_block()
+            worklist.extend(operands)
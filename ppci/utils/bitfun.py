@@ -89,6 +89,14 @@ def popcnt(v: int, bits: int) -> int:
     return count
 
 
+def iter_bits(v: int):
+    """ Iterate over the positions of the one bits, starting at bit 0 """
+    while v:
+        low = v & -v
+        yield low.bit_length() - 1
+        v ^= low
+
+
 def value_to_bytes_big_endian(value: int, size: int):
     """ Pack integer value into bytes """
     byte_numbers = reversed(range(size))
@@ -130,6 +138,12 @@ def encode_imm32(v):
     raise ValueError("Invalid value {}".format(v))
 
 
+def decode_imm32(x):
+    """ Expand 4 bits rotation and 8 bits value into a 32 bit value """
+    rotation = (x >> 8) & 0xF
+    return rotate_right(x & 0xFF, rotation * 2)
+
+
 def align(value, m):
     """ Increase value to a multiple of m """
     while (value % m) != 0:
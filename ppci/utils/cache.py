@@ -0,0 +1,149 @@
+""" On-disk, content-addressed cache for compilation results.
+
+Entries are stored as individual files in a cache directory. The name of
+each file is a hash of the key, so that entries can be looked up without
+an index file. This makes it safe to share a cache directory between
+several processes:
+
+- entries are written to a temporary file first, and then atomically
+  renamed into place, so readers never observe half written entries.
+- an entry that disappears (because another process evicted it) is
+  simply treated as a cache miss.
+
+The cache is bounded in size. When the total size exceeds the
+maximum, the least recently used entries are removed. Usage is tracked
+via the modification time of the entry files.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+
+from .. import __version__
+
+
+logger = logging.getLogger("cache")
+
+
+def make_cache_key(*parts):
+    """ Create a hex digest key from the given parts.
+
+    Parts can be bytes or strings. The ppci version is always included,
+    such that upgrading the compiler invalidates old entries.
+    """
+    h = hashlib.sha256()
+    for part in (__version__,) + parts:
+        if isinstance(part, str):
+            part = part.encode("utf8")
+        # Prefix with length to avoid ambiguity between parts:
+        h.update(str(len(part)).encode("ascii"))
+        h.update(b":")
+        h.update(part)
+    return h.hexdigest()
+
+
+class FileCache:
+    """ A size bounded cache of binary blobs stored in a directory.
+
+    Args:
+        directory: the directory to store cache entries in.
+        max_size: the maximum total size in bytes of all entries.
+    """
+
+    suffix = ".ppcicache"
+
+    def __init__(self, directory, max_size=256 * 1024 * 1024):
+        self.directory = os.path.expanduser(directory)
+        self.max_size = max_size
+
+    def __repr__(self):
+        return "FileCache({})".format(self.directory)
+
+    def _filename(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key):
+        """ Retrieve the data stored for the given key, or None """
+        filename = self._filename(key)
+        try:
+            with open(filename, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            logger.debug("Cache miss for %s", key)
+            return
+
+        # Mark as recently used:
+        try:
+            os.utime(filename)
+        except OSError:  # pragma: no cover
+            pass
+
+        logger.debug("Cache hit for %s", key)
+        return data
+
+    def put(self, key, data):
+        """ Store data under the given key """
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_filename = tempfile.mkstemp(
+            dir=self.directory, suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_filename, self._filename(key))
+        except BaseException:
+            try:
+                os.remove(tmp_filename)
+            except OSError:  # pragma: no cover
+                pass
+            raise
+        logger.debug("Stored %s bytes for %s", len(data), key)
+        self.evict()
+
+    def entries(self):
+        """ Get a list of (mtime, size, filename) for all entries """
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return entries
+
+        for name in names:
+            if not name.endswith(self.suffix):
+                continue
+            filename = os.path.join(self.directory, name)
+            try:
+                st = os.stat(filename)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, filename))
+        return entries
+
+    @property
+    def size(self):
+        """ The total size of all entries in the cache """
+        return sum(e[1] for e in self.entries())
+
+    def evict(self):
+        """ Remove least recently used entries until within bounds """
+        entries = self.entries()
+        total_size = sum(e[1] for e in entries)
+        entries.sort()
+        while entries and total_size > self.max_size:
+            _, size, filename = entries.pop(0)
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                # Another process evicted this entry already
+                pass
+            logger.debug("Evicted %s", filename)
+            total_size -= size
+
+    def clear(self):
+        """ Remove all entries from the cache """
+        for _, _, filename in self.entries():
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
@@ -461,6 +461,14 @@ class HtmlReportGenerator(TextWritingReporter):
         """ Dump frame to file for debug purposes """
         with collapseable(self, "Frame"):
             used_regs = list(sorted(frame.used_regs, key=lambda r: r.name))
+            # Liveness is stored as bitsets of registers in the flowgraph:
+            if hasattr(frame, "cfg"):
+                registers = frame.cfg.get_registers
+            else:
+
+                def registers(mask):
+                    return []
+
             self.print('<p><div class="codeblock">')
             self.print(frame)
             self.print("<p>stack size: {}</p>".format(frame.stacksize))
@@ -494,26 +502,26 @@ class HtmlReportGenerator(TextWritingReporter):
 
                 self.print("<td>", end="")
                 if hasattr(ins, "gen"):
-                    self.print(str2(ins.gen), end="")
+                    self.print(str2(registers(ins.gen)), end="")
                 self.print("</td>")
 
                 self.print("<td>", end="")
                 if hasattr(ins, "kill"):
-                    self.print(str2(ins.kill), end="")
+                    self.print(str2(registers(ins.kill)), end="")
                 self.print("</td>")
 
                 self.print("<td>", end="")
                 if hasattr(ins, "live_in"):
-                    self.print(str2(ins.live_in), end="")
+                    self.print(str2(registers(ins.live_in)), end="")
                 self.print("</td>")
 
                 self.print("<td>", end="")
                 if hasattr(ins, "live_out"):
-                    self.print(str2(ins.live_out), end="")
+                    self.print(str2(registers(ins.live_out)), end="")
                 self.print("</td>")
                 for ur in used_regs:
                     self.print("<td>")
-                    for r2 in ins.live_out:
+                    for r2 in registers(getattr(ins, "live_out", 0)):
                         if r2.color == ur.color:
                             self.print(r2.name)
                     self.print("</td>")
@@ -0,0 +1,40 @@
+""" Run jobs in a pool of forked worker processes.
+
+The workers are forked, so they inherit the state of this process, such
+as a compiler with its caches, or objects which cannot be pickled. This
+state is set when the pool is created, and the jobs get it with
+:func:`worker_state`. Only the arguments and results of jobs are
+pickled.
+"""
+
+import contextlib
+import multiprocessing
+
+
+def can_fork():
+    """ Check if worker processes can be forked on this platform """
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+# State inherited by forked workers:
+_worker_state = None
+
+
+@contextlib.contextmanager
+def forked_pool(processes, state):
+    """ Create a pool of forked workers, which inherit the given state """
+    global _worker_state
+    # A job might create a pool itself, so restore the state of the job:
+    previous_state = _worker_state
+    _worker_state = state
+    context = multiprocessing.get_context("fork")
+    try:
+        with context.Pool(processes) as pool:
+            yield pool
+    finally:
+        _worker_state = previous_state
+
+
+def worker_state():
+    """ Get the state of the pool in which this job runs """
+    return _worker_state
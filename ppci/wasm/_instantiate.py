@@ -7,20 +7,25 @@ The wasm runtime contains the following:
 - Implement function like sqrt, floor, bit rotations etc..
 """
 
-import os
 import abc
-import shelve
 import io
+import json
+import marshal
 import struct
+import sys
 import logging
+import warnings
 from types import ModuleType
 
 from ..arch.arch_info import TypeInfo
+from ..utils.cache import FileCache, make_cache_key
 from ..utils.codepage import load_obj, MemoryPage
 from ..utils.reporting import DummyReportGenerator
+from ..binutils.objectfile import ObjectFile
 from ..irutils import verify_module
 from .. import ir
 from . import wasm_to_ir
+from .intrinsics import supports_intrinsics
 from .components import Export, Import
 from .wasm2ppci import create_memories
 from .util import PAGE_SIZE
@@ -33,7 +38,12 @@ logger = logging.getLogger("instantiate")
 
 
 def instantiate(
-    module, imports, target="native", reporter=None, cache_file=None
+    module,
+    imports,
+    target="native",
+    reporter=None,
+    cache_dir=None,
+    cache_file=None,
 ):
     """ Instantiate a wasm module.
 
@@ -44,7 +54,13 @@ def instantiate(
                 Use 'python' to generate python code. This option is slower
                 but more reliable.
         reporter: A reporter which can record detailed compilation information.
-        cache_file: a file to use as cache
+        cache_dir: a directory in which compiled modules are cached. When
+                   the same module is instantiated again, the compilation
+                   step is skipped. This may also be a
+                   :class:`ppci.utils.cache.FileCache` instance.
+        cache_file: deprecated, use cache_dir instead. The cache entries
+                    are stored in a directory named after this file, with
+                    a '.d' suffix.
 
     """
     if reporter is None:
@@ -75,10 +91,24 @@ def instantiate(
 
     imports = flatten_imports(imports)
 
+    if cache_file is not None:
+        warnings.warn(
+            "cache_file is deprecated, use cache_dir instead",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        if cache_dir is None:
+            cache_dir = cache_file + ".d"
+
+    if isinstance(cache_dir, str):
+        cache = FileCache(cache_dir)
+    else:
+        cache = cache_dir
+
     if target == "native":
-        instance = native_instantiate(module, imports, reporter, cache_file)
+        instance = native_instantiate(module, imports, reporter, cache)
     elif target == "python":
-        instance = python_instantiate(module, imports, reporter, cache_file)
+        instance = python_instantiate(module, imports, reporter, cache)
     else:
         raise ValueError("Unknown instantiation target {}".format(target))
 
@@ -88,35 +118,49 @@ def instantiate(
     return instance
 
 
-def native_instantiate(module, imports, reporter, cache_file):
+def native_instantiate(module, imports, reporter, cache):
     """ Load wasm module native """
     from ..api import ir_to_object, get_current_arch
 
     logger.info("Instantiating wasm module as native code")
     arch = get_current_arch()
-    # key = (arch, module)
-    # TODO: think of clever caching trickery:
-    cache_file = None
-    if cache_file and os.path.exists(cache_file):
-        logger.info("Using cached object from %s", cache_file)
-        with shelve.open(cache_file) as s:
-            obj = s["obj"]
-            ppci_module = s["ppci_module"]
+
+    if cache:
+        key = make_cache_key("native", arch.make_id_str(), module.to_bytes())
+        data = cache.get(key)
+    else:
+        data = None
+
+    if data:
+        logger.info("Using cached object from %s", cache)
+        data = json.loads(data.decode("utf8"))
+        obj = ObjectFile.load(io.StringIO(data["object"]))
+        function_names = data["function_names"]
+        global_names = [
+            (ir.type_name_map[ty], name) for ty, name in data["globals"]
+        ]
     else:
-        # TODO: use cache here to short circuit re-compilation
-        # hash(key)
-        # print(hash(key))
-        # hgkfdg
         ppci_module = wasm_to_ir(
-            module, arch.info.get_type_info("ptr"), reporter=reporter
+            module,
+            arch.info.get_type_info("ptr"),
+            reporter=reporter,
+            intrinsics=supports_intrinsics(arch),
         )
         verify_module(ppci_module)
         obj = ir_to_object([ppci_module], arch, debug=True, reporter=reporter)
-        if cache_file:
-            logger.info("Saving object to %s for later use", cache_file)
-            with shelve.open(cache_file) as s:
-                s["obj"] = obj
-                s["ppci_module"] = ppci_module
+        function_names = ppci_module._wasm_function_names
+        global_names = get_global_names(ppci_module)
+        if cache:
+            logger.info("Saving object to %s for later use", cache)
+            f = io.StringIO()
+            obj.save(f)
+            data = {
+                "object": f.getvalue(),
+                "function_names": function_names,
+                "globals": [(ty.name, name) for ty, name in global_names],
+            }
+            cache.put(key, json.dumps(data).encode("utf8"))
+
     instance = NativeModuleInstance(obj, imports)
 
     instance.load_memory(module)
@@ -125,14 +169,12 @@ def native_instantiate(module, imports, reporter, cache_file):
     for definition in module:
         if isinstance(definition, Export):
             if definition.kind == "func":
-                exported_name = ppci_module._wasm_function_names[
-                    definition.ref.index
-                ]
+                exported_name = function_names[definition.ref.index]
                 instance.exports._function_map[definition.name] = getattr(
                     instance._code_module, exported_name
                 )
             elif definition.kind == "global":
-                global_name = ppci_module._wasm_globals[definition.ref.index]
+                global_name = global_names[definition.ref.index]
                 instance.exports._function_map[
                     definition.name
                 ] = NativeWasmGlobal(global_name, instance._code_module)
@@ -147,18 +189,51 @@ def native_instantiate(module, imports, reporter, cache_file):
     return instance
 
 
-def python_instantiate(module, imports, reporter, cache_file):
+def python_instantiate(module, imports, reporter, cache):
     """ Load wasm module as a PythonModuleInstance """
     from ..api import ir_to_python
 
     logger.info("Instantiating wasm module as python")
-    ptr_info = TypeInfo(4, 4)
-    ppci_module = wasm_to_ir(module, ptr_info, reporter=reporter)
-    verify_module(ppci_module)
-    f = io.StringIO()
-    ir_to_python([ppci_module], f, reporter=reporter)
-    pysrc = f.getvalue()
-    pycode = compile(pysrc, "<string>", "exec")
+
+    # Python bytecode is specific to the interpreter version:
+    if cache:
+        key = make_cache_key(
+            "python",
+            sys.implementation.cache_tag or sys.implementation.name,
+            module.to_bytes(),
+        )
+        data = cache.get(key)
+    else:
+        data = None
+
+    if data:
+        logger.info("Using cached python code from %s", cache)
+        pycode, function_names, global_names = marshal.loads(data)
+        global_names = [
+            (ir.type_name_map[ty], name) for ty, name in global_names
+        ]
+    else:
+        ptr_info = TypeInfo(4, 4)
+        # Python code can run all ir-code of the numeric instructions:
+        ppci_module = wasm_to_ir(
+            module, ptr_info, reporter=reporter, intrinsics=True
+        )
+        verify_module(ppci_module)
+        f = io.StringIO()
+        ir_to_python([ppci_module], f, reporter=reporter)
+        pysrc = f.getvalue()
+        pycode = compile(pysrc, "<string>", "exec")
+        function_names = ppci_module._wasm_function_names
+        global_names = get_global_names(ppci_module)
+        if cache:
+            logger.info("Saving python code to %s for later use", cache)
+            data = (
+                pycode,
+                function_names,
+                [(ty.name, name) for ty, name in global_names],
+            )
+            cache.put(key, marshal.dumps(data))
+
     _py_module = ModuleType("gen")
     exec(pycode, _py_module.__dict__)
     instance = PythonModuleInstance(_py_module, imports)
@@ -173,14 +248,12 @@ def python_instantiate(module, imports, reporter, cache_file):
             # TODO: maybe validate imported functions?
         elif isinstance(definition, Export):
             if definition.kind == "func":
-                exported_name = ppci_module._wasm_function_names[
-                    definition.ref.index
-                ]
+                exported_name = function_names[definition.ref.index]
                 instance.exports._function_map[definition.name] = getattr(
                     instance._py_module, exported_name
                 )
             elif definition.kind == "global":
-                global_name = ppci_module._wasm_globals[definition.ref.index]
+                global_name = global_names[definition.ref.index]
                 instance.exports._function_map[
                     definition.name
                 ] = PythonWasmGlobal(global_name, instance)
@@ -195,6 +268,11 @@ def python_instantiate(module, imports, reporter, cache_file):
     return instance
 
 
+def get_global_names(ppci_module):
+    """ Get a list of (type, name) tuples of the wasm globals """
+    return [(ty, var.name) for ty, var in ppci_module._wasm_globals]
+
+
 def flatten_imports(imports):
     """ Go from a two level dict to a single level dict """
     flat_imports = {}
@@ -313,7 +391,7 @@ class PythonWasmGlobal(WasmGlobal):
         self.instance = memory
 
     def _get_ptr(self):
-        addr = getattr(self.instance._py_module, self.name[1].name)
+        addr = getattr(self.instance._py_module, self.name[1])
         return addr
 
     def read(self):
@@ -344,7 +422,7 @@ class NativeWasmGlobal(WasmGlobal):
 
     def _get_ptr(self):
         # print('Getting address of', self.name)
-        vpointer = getattr(self._code_obj, self.name[1].name)
+        vpointer = getattr(self._code_obj, self.name[1])
         return vpointer
 
     def read(self):
@@ -0,0 +1,403 @@
+""" Wasm numeric instructions in ir-code.
+
+Some wasm instructions, such as i32.popcnt and f64.floor, have no ir-code
+equivalent. Instead of calling a runtime function for them, they are
+implemented with other ir-code instructions, which are compiled into
+native code:
+
+- Bit counts and rotations are generated inline, with shifts and masks.
+- A square root is a sqrt unary operation.
+- Instructions which require branches or a memory location are generated
+  once per module as a helper function, which is called.
+
+A cast from float to integer rounds to the nearest integer. The rounding
+instructions are based on this cast, and then correct the result by one.
+
+The generated code uses a sqrt operation, 64 bit integers and casts
+between floats and 64 bit integers. Targets which cannot compile these
+call the runtime functions instead, see :func:`supports_intrinsics`.
+"""
+
+from .. import ir
+from .. import irutils
+from .util import sanitize_name
+
+
+INTRINSIC_OPS = {
+    "i32.clz",
+    "i32.ctz",
+    "i32.popcnt",
+    "i32.rotl",
+    "i32.rotr",
+    "i64.clz",
+    "i64.ctz",
+    "i64.popcnt",
+    "i64.rotl",
+    "i64.rotr",
+    "f32.sqrt",
+    "f32.abs",
+    "f32.copysign",
+    "f32.min",
+    "f32.max",
+    "f32.floor",
+    "f32.ceil",
+    "f32.trunc",
+    "f32.nearest",
+    "f64.sqrt",
+    "f64.abs",
+    "f64.copysign",
+    "f64.min",
+    "f64.max",
+    "f64.floor",
+    "f64.ceil",
+    "f64.trunc",
+    "f64.nearest",
+    "i32.trunc_s/f32",
+    "i32.trunc_u/f32",
+    "i32.trunc_s/f64",
+    "i32.trunc_u/f64",
+    "i64.trunc_s/f32",
+    "i64.trunc_u/f32",
+    "i64.trunc_s/f64",
+    "i64.trunc_u/f64",
+    "f64.promote/f32",
+    "f32.demote/f64",
+    "i32.reinterpret/f32",
+    "i64.reinterpret/f64",
+    "f32.reinterpret/i32",
+    "f64.reinterpret/i64",
+}
+
+type_map = {"i32": ir.i32, "i64": ir.i64, "f32": ir.f32, "f64": ir.f64}
+unsigned_types = {ir.i32: ir.u32, ir.i64: ir.u64}
+bits_types = {ir.f32: ir.u32, ir.f64: ir.u64}
+
+
+def supports_intrinsics(arch):
+    """ Test if the numeric instructions can be compiled into ir-code for
+    the given architecture. """
+    return arch.name == "x86_64" and not arch.has_option("x87")
+
+
+class Intrinsics:
+    """ Generates ir-code for wasm instructions without ir equivalent """
+
+    def __init__(self, module):
+        self.module = module
+        self.helpers = {}
+
+    def generate(self, builder, opcode, args):
+        """ Emit code for a wasm instruction, and return the result """
+        operation = opcode.split(".")[1]
+        if operation in ("rotl", "rotr"):
+            return gen_rotate(builder, operation, *args)
+        elif operation in ("clz", "ctz", "popcnt"):
+            return gen_count(builder, operation, args[0])
+        elif operation == "sqrt":
+            a = args[0]
+            return builder.emit(ir.Unop("sqrt", a, "sqrt", a.ty))
+        elif operation in ("promote/f32", "demote/f64"):
+            ty = type_map[opcode.split(".")[0]]
+            return builder.emit(ir.Cast(args[0], "convert", ty))
+        else:
+            helper = self.get_helper(opcode)
+            return builder.emit(
+                ir.FunctionCall(helper, args, "result", helper.return_ty)
+            )
+
+    def get_helper(self, opcode):
+        """ Get or create the helper function of a wasm instruction """
+        if opcode in self.helpers:
+            return self.helpers[opcode]
+
+        name = "wasm_intrinsic_" + sanitize_name(opcode)
+        result_ty = type_map[opcode.split(".")[0]]
+        function = ir.Function(name, ir.Binding.LOCAL, result_ty)
+        self.module.add_function(function)
+        self.helpers[opcode] = function
+
+        builder = irutils.Builder()
+        builder.set_module(self.module)
+        builder.set_function(function)
+        function.entry = builder.new_block()
+        builder.set_block(function.entry)
+
+        operation = opcode.split(".")[1]
+        if "/" in operation:
+            operation, arg_type = operation.split("/")
+            arg_types = [type_map[arg_type]]
+        elif operation in ("copysign", "min", "max"):
+            arg_types = [result_ty, result_ty]
+        else:
+            arg_types = [result_ty]
+
+        args = []
+        for index, arg_ty in enumerate(arg_types):
+            parameter = ir.Parameter("arg{}".format(index), arg_ty)
+            function.add_parameter(parameter)
+            args.append(parameter)
+
+        if operation == "reinterpret":
+            value = gen_reinterpret(builder, args[0], result_ty)
+        elif operation in ("abs", "copysign"):
+            value = gen_sign(builder, operation, *args)
+        elif operation in ("min", "max"):
+            value = gen_select(builder, operation, *args)
+        elif result_ty is ir.f32:
+            # Round in double precision, which is exact:
+            wide = builder.emit(ir.Cast(args[0], "wide", ir.f64))
+            value = self.call(builder, "f64." + operation, wide)
+            value = builder.emit(ir.Cast(value, "narrow", ir.f32))
+        elif result_ty is ir.f64:
+            value = self.gen_round(builder, operation, args[0])
+        else:
+            value = self.gen_truncate(builder, operation, args[0], result_ty)
+        builder.emit(ir.Return(value))
+        return function
+
+    def call(self, builder, opcode, *args):
+        """ Emit a call to the helper function of a wasm instruction """
+        helper = self.get_helper(opcode)
+        return builder.emit(
+            ir.FunctionCall(helper, list(args), "result", helper.return_ty)
+        )
+
+    def gen_round(self, builder, operation, x):
+        """ Round x to an integral value, in the way given by operation.
+
+        Values from 2**52 are integral already, as are infinities. These
+        and values which are not a number are returned as is.
+        """
+        start_block = builder.block
+        limit = builder.emit(ir.Const(2.0 ** 52, "limit", ir.f64))
+        minus_limit = builder.emit(ir.Const(-(2.0 ** 52), "limit", ir.f64))
+        check_block = builder.new_block()
+        round_block = builder.new_block()
+        final_block = builder.new_block()
+        builder.emit(ir.CJump(limit, ">", x, check_block, final_block))
+        builder.set_block(check_block)
+        builder.emit(ir.CJump(x, ">", minus_limit, round_block, final_block))
+
+        builder.set_block(round_block)
+        value = builder.emit(ir.Cast(x, "rounded", ir.i64))
+        value = builder.emit(ir.Cast(value, "rounded", ir.f64))
+        if operation == "trunc":
+            zero = builder.emit(ir.Const(0.0, "zero", ir.f64))
+            positive_block = builder.new_block()
+            negative_block = builder.new_block()
+            join_block = builder.new_block()
+            builder.emit(
+                ir.CJump(x, ">", zero, positive_block, negative_block)
+            )
+            builder.set_block(positive_block)
+            floor = gen_correct(builder, "floor", value, x)
+            positive_block = builder.block
+            builder.emit(ir.Jump(join_block))
+            builder.set_block(negative_block)
+            ceil = gen_correct(builder, "ceil", value, x)
+            negative_block = builder.block
+            builder.emit(ir.Jump(join_block))
+            builder.set_block(join_block)
+            value = ir.Phi("trunc", ir.f64)
+            value.set_incoming(positive_block, floor)
+            value.set_incoming(negative_block, ceil)
+            builder.emit(value)
+        elif operation in ("floor", "ceil"):
+            value = gen_correct(builder, operation, value, x)
+        else:
+            assert operation == "nearest"
+
+        # Keep the sign of x, for a result of zero:
+        value = self.call(builder, "f64.copysign", value, x)
+        round_block = builder.block
+        builder.emit(ir.Jump(final_block))
+
+        builder.set_block(final_block)
+        phi = ir.Phi("result", ir.f64)
+        phi.set_incoming(start_block, x)
+        phi.set_incoming(check_block, x)
+        phi.set_incoming(round_block, value)
+        builder.emit(phi)
+        return phi
+
+    def gen_truncate(self, builder, operation, x, ty):
+        """ Truncate a float to an integer """
+        if x.ty is ir.f32:
+            x = builder.emit(ir.Cast(x, "wide", ir.f64))
+        x = self.call(builder, "f64.trunc", x)
+        if operation == "trunc_s":
+            return builder.emit(ir.Cast(x, "truncated", ty))
+        elif ty is ir.i32:
+            value = builder.emit(ir.Cast(x, "truncated", ir.i64))
+            return builder.emit(ir.Cast(value, "truncated", ir.i32))
+
+        # Unsigned 64 bits values from 2**63 do not fit a signed cast:
+        limit = builder.emit(ir.Const(2.0 ** 63, "limit", ir.f64))
+        high_block = builder.new_block()
+        low_block = builder.new_block()
+        final_block = builder.new_block()
+        builder.emit(ir.CJump(x, ">=", limit, high_block, low_block))
+
+        builder.set_block(high_block)
+        high = builder.emit(ir.sub(x, limit, "high", ir.f64))
+        high = builder.emit(ir.Cast(high, "truncated", ir.i64))
+        offset = builder.emit(ir.Const(-(2 ** 63), "offset", ir.i64))
+        high = builder.emit(ir.add(high, offset, "high", ir.i64))
+        builder.emit(ir.Jump(final_block))
+
+        builder.set_block(low_block)
+        low = builder.emit(ir.Cast(x, "truncated", ir.i64))
+        builder.emit(ir.Jump(final_block))
+
+        builder.set_block(final_block)
+        phi = ir.Phi("result", ir.i64)
+        phi.set_incoming(high_block, high)
+        phi.set_incoming(low_block, low)
+        builder.emit(phi)
+        return phi
+
+
+def gen_rotate(builder, operation, a, b):
+    """ Rotate the bits of a by b bits """
+    ty = a.ty
+    uty = unsigned_types[ty]
+    a = builder.emit(ir.Cast(a, "value", uty))
+    b = builder.emit(ir.Cast(b, "amount", uty))
+    bits = builder.emit(ir.Const(uty.bits, "bits", uty))
+    mask = builder.emit(ir.Const(uty.bits - 1, "mask", uty))
+    amount = builder.emit(ir.Binop(b, "&", mask, "amount", uty))
+    other = builder.emit(ir.Binop(bits, "-", b, "other", uty))
+    other = builder.emit(ir.Binop(other, "&", mask, "other", uty))
+    if operation == "rotl":
+        left, right = amount, other
+    else:
+        left, right = other, amount
+    left = builder.emit(ir.Binop(a, "<<", left, "left", uty))
+    right = builder.emit(ir.Binop(a, ">>", right, "right", uty))
+    value = builder.emit(ir.Binop(left, "|", right, "rotated", uty))
+    return builder.emit(ir.Cast(value, "rotated", ty))
+
+
+def gen_count(builder, operation, a):
+    """ Count the leading zeros, trailing zeros or one bits of a """
+    ty = a.ty
+    uty = unsigned_types[ty]
+    x = builder.emit(ir.Cast(a, "value", uty))
+    ones = builder.emit(ir.Const(2 ** uty.bits - 1, "ones", uty))
+    if operation == "clz":
+        # Set all bits below the highest one, and count the zeros:
+        shift = 1
+        while shift < uty.bits:
+            amount = builder.emit(ir.Const(shift, "shift", uty))
+            shifted = builder.emit(ir.Binop(x, ">>", amount, "smear", uty))
+            x = builder.emit(ir.Binop(x, "|", shifted, "smear", uty))
+            shift *= 2
+        x = builder.emit(ir.Binop(x, "^", ones, "zeros", uty))
+    elif operation == "ctz":
+        # Only keep the zeros below the lowest one:
+        one = builder.emit(ir.Const(1, "one", uty))
+        below = builder.emit(ir.Binop(x, "-", one, "below", uty))
+        x = builder.emit(ir.Binop(x, "^", ones, "zeros", uty))
+        x = builder.emit(ir.Binop(x, "&", below, "zeros", uty))
+    value = gen_popcnt(builder, x)
+    return builder.emit(ir.Cast(value, "count", ty))
+
+
+def gen_popcnt(builder, x):
+    """ Count the one bits of an unsigned value, per byte in parallel """
+    uty = x.ty
+    byte_ones = sum(1 << i for i in range(0, uty.bits, 8))
+
+    def const(value):
+        return builder.emit(ir.Const(value, "c", uty))
+
+    def binop(a, op, b):
+        return builder.emit(ir.Binop(a, op, b, "popcnt", uty))
+
+    # Count the bits per 2, 4 and 8 bits:
+    pairs = binop(binop(x, ">>", const(1)), "&", const(0x55 * byte_ones))
+    x = binop(x, "-", pairs)
+    mask = const(0x33 * byte_ones)
+    quads = binop(binop(x, ">>", const(2)), "&", mask)
+    x = binop(binop(x, "&", mask), "+", quads)
+    x = binop(x, "+", binop(x, ">>", const(4)))
+    x = binop(x, "&", const(0xF * byte_ones))
+
+    # Add the counts of all bytes into the highest byte:
+    x = binop(x, "*", const(byte_ones))
+    return binop(x, ">>", const(uty.bits - 8))
+
+
+def gen_reinterpret(builder, value, ty):
+    """ Interpret the bits of value as another type, through memory """
+    size = value.ty.size
+    alloc = builder.emit(ir.Alloc("alloc", size, size))
+    address = builder.emit(ir.AddressOf(alloc, "address"))
+    builder.emit(ir.Store(value, address))
+    return builder.emit(ir.Load(address, "reinterpreted", ty))
+
+
+def gen_sign(builder, operation, x, y=None):
+    """ Clear the sign bit of x, and optionally set the sign of y """
+    ty = x.ty
+    uty = bits_types[ty]
+    sign = 1 << (uty.bits - 1)
+    x = gen_reinterpret(builder, x, uty)
+    mask = builder.emit(ir.Const(sign - 1, "mask", uty))
+    value = builder.emit(ir.Binop(x, "&", mask, "magnitude", uty))
+    if operation == "copysign":
+        y = gen_reinterpret(builder, y, uty)
+        mask = builder.emit(ir.Const(sign, "sign", uty))
+        y = builder.emit(ir.Binop(y, "&", mask, "sign", uty))
+        value = builder.emit(ir.Binop(value, "|", y, "copysign", uty))
+    return gen_reinterpret(builder, value, ty)
+
+
+def gen_select(builder, operation, x, y):
+    """ Select the minimum or maximum of x and y.
+
+    Only greater than comparisons are used, which are false when a
+    value is not a number. In that case x is the result.
+    """
+    ty = x.ty
+    y_block = builder.new_block()
+    x_block = builder.new_block()
+    final_block = builder.new_block()
+    if operation == "min":
+        builder.emit(ir.CJump(x, ">", y, y_block, x_block))
+    else:
+        builder.emit(ir.CJump(y, ">", x, y_block, x_block))
+    builder.set_block(y_block)
+    builder.emit(ir.Jump(final_block))
+    builder.set_block(x_block)
+    builder.emit(ir.Jump(final_block))
+    builder.set_block(final_block)
+    phi = ir.Phi(operation, ty)
+    phi.set_incoming(y_block, y)
+    phi.set_incoming(x_block, x)
+    builder.emit(phi)
+    return phi
+
+
+def gen_correct(builder, operation, value, x):
+    """ Correct a value rounded to nearest towards minus or plus infinity """
+    ty = value.ty
+    correct_block = builder.new_block()
+    final_block = builder.new_block()
+    start_block = builder.block
+    one = builder.emit(ir.Const(1.0, "one", ty))
+    if operation == "floor":
+        builder.emit(ir.CJump(value, ">", x, correct_block, final_block))
+        builder.set_block(correct_block)
+        corrected = builder.emit(ir.sub(value, one, "floor", ty))
+    else:
+        builder.emit(ir.CJump(x, ">", value, correct_block, final_block))
+        builder.set_block(correct_block)
+        corrected = builder.emit(ir.add(value, one, "ceil", ty))
+    builder.emit(ir.Jump(final_block))
+    builder.set_block(final_block)
+    phi = ir.Phi(operation, ty)
+    phi.set_incoming(start_block, value)
+    phi.set_incoming(correct_block, corrected)
+    builder.emit(phi)
+    return phi
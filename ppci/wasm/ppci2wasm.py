@@ -18,6 +18,7 @@ from functools import reduce
 import operator
 from .. import ir
 from ..graph import relooper
+from ..irutils import lower_jump_tables
 from . import components
 from ..codegen.irdag import SelectionGraphBuilder, prepare_function_info
 from ..codegen.irdag import FunctionInfo
@@ -246,6 +247,7 @@ class IrToWasmCompiler:
         self.local_vars = []
         self.stack = 0
         self.logger.debug("Generating wasm for %s", ir_function)
+        lower_jump_tables(ir_function, jump_tables=False)
 
         # Generate function code:
         # Create a selection graph, so that we have expression trees
@@ -9,11 +9,12 @@ from ..binutils import debuginfo
 from ..arch.arch_info import TypeInfo
 from . import components
 from .opcodes import STORE_OPS, LOAD_OPS, BINOPS, CMPOPS, STACK_IO
+from .intrinsics import Intrinsics, INTRINSIC_OPS
 from .util import sanitize_name
 
 
 def wasm_to_ir(
-    wasm_module: components.Module, ptr_info, reporter=None
+    wasm_module: components.Module, ptr_info, reporter=None, intrinsics=False
 ) -> ir.Module:
     """ Convert a WASM module into a PPCI native module.
 
@@ -21,11 +22,15 @@ def wasm_to_ir(
         wasm_module (ppci.wasm.Module): The wasm-module to compile
         ptr_info: :class:`ppci.arch.arch_info.TypeInfo` size and
                   alignment information for pointers.
+        intrinsics: generate ir-code for numeric instructions such as
+                    f64.sqrt, instead of calling runtime functions. Only
+                    use this when the target supports it, see
+                    :func:`ppci.wasm.intrinsics.supports_intrinsics`.
 
     Returns:
         An IR-module.
     """
-    compiler = WasmToIrCompiler(ptr_info)
+    compiler = WasmToIrCompiler(ptr_info, intrinsics=intrinsics)
     ppci_module = compiler.generate(wasm_module)
     if reporter:
         reporter.dump_ir(ppci_module)
@@ -70,12 +75,13 @@ class WasmToIrCompiler:
     logger = logging.getLogger("wasm2ir")
     verbose = True
 
-    def __init__(self, ptr_info):
+    def __init__(self, ptr_info, intrinsics=False):
         self.builder = irutils.Builder()
         self.blocknr = 0
         if not isinstance(ptr_info, TypeInfo):
             raise TypeError("Expected ptr_info to be TypeInfo")
         self.ptr_info = ptr_info
+        self.use_intrinsics = intrinsics
 
     def generate(self, wasm_module: components.Module):
         assert isinstance(wasm_module, components.Module)
@@ -83,6 +89,7 @@ class WasmToIrCompiler:
         # Create module:
         self.debug_db = debuginfo.DebugDb()
         self.builder.module = ir.Module("mainmodule", debug_db=self.debug_db)
+        self.intrinsics = Intrinsics(self.builder.module)
 
         # First read all sections:
         # for wasm_function in wasm_module.sections[-1].functiondefs:
@@ -493,6 +500,18 @@ class WasmToIrCompiler:
 
             self.locals.append((ir_typ, addr))
 
+        # Load the memory base address once, when memory cannot move:
+        self.memory_base = None
+        self.pinned_memory_base = (
+            self.memory_base_address is not None
+            and self.uses_memory(wasm_function)
+            and not self.may_move_memory(wasm_function)
+        )
+        if self.pinned_memory_base:
+            self.memory_base = self.emit(
+                ir.Load(self.memory_base_address, "mem0", ir.ptr)
+            )
+
         # Create an implicit top level block:
         if isinstance(ppci_function, ir.Procedure):
             final_phi = None
@@ -702,78 +721,10 @@ class WasmToIrCompiler:
             value = self.emit(ir.Cast(value, "cast", ir_typ))
             self.push_value(value)
 
-        elif inst in {
-            "i32.trunc_s/f32",
-            "i32.trunc_u/f32",
-            "i32.trunc_s/f64",
-            "i32.trunc_u/f64",
-            "i64.trunc_s/f32",
-            "i64.trunc_u/f32",
-            "i64.trunc_s/f64",
-            "i64.trunc_u/f64",
-        }:
-            # TODO: in theory this should be solvable in ir-code.
-            if True:
-                self._runtime_call(inst)
-            else:
-                from_ir_typ = self.get_ir_type(inst.split("/")[1])
-                ir_typ = self.get_ir_type(inst.split(".")[0])
-                value = self.pop_value(ir_typ=from_ir_typ)
-                if "_u" in inst:
-                    # First cast to unsigned value:
-                    mp = {"i32.trunc_u": ir.u32, "i64.trunc_u": ir.u64}
-                    unsigned_ir_typ = mp[inst.split("/")[0]]
-                    value = self.emit(
-                        ir.Cast(value, "unsigned", unsigned_ir_typ)
-                    )
-                value = self.emit(ir.Cast(value, "cast", ir_typ))
-                self.push_value(value)
-
-        elif inst in {"f64.promote/f32", "f32.demote/f64"}:
-            # TODO: in theory this should be solvable in ir-code.
-            if True:
-                self._runtime_call(inst)
-            else:
-                from_ir_typ = self.get_ir_type(inst.split("/")[1])
-                ir_typ = self.get_ir_type(inst.split(".")[0])
-                value = self.pop_value(ir_typ=from_ir_typ)
-                value = self.emit(ir.Cast(value, "cast", ir_typ))
-                self.push_value(value)
+        elif inst in INTRINSIC_OPS and self.use_intrinsics:
+            self.gen_intrinsic(inst)
 
-        elif inst in [
-            "f64.sqrt",
-            "f64.abs",
-            "f64.ceil",
-            "f64.trunc",
-            "f64.nearest",
-            "f64.min",
-            "f64.max",
-            "f64.copysign",
-            "f32.sqrt",
-            "f32.abs",
-            "f32.ceil",
-            "f32.trunc",
-            "f32.nearest",
-            "f32.min",
-            "f32.max",
-            "f32.copysign",
-            "f32.reinterpret/i32",
-            "i64.clz",
-            "i64.ctz",
-            "i64.popcnt",
-            "i64.rotl",
-            "i64.rotr",
-            "f64.reinterpret/i64",
-            "i64.reinterpret/f64",
-            "i32.reinterpret/f32",
-            "i32.clz",
-            "i32.ctz",
-            "i32.popcnt",
-            "i32.rotl",
-            "i32.rotr",
-            "memory.grow",
-            "memory.size",
-        ]:
+        elif inst in INTRINSIC_OPS or inst in ["memory.grow", "memory.size"]:
             self._runtime_call(inst)
 
         elif inst in {"f64.const", "f32.const", "i64.const", "i32.const"}:
@@ -804,21 +755,6 @@ class WasmToIrCompiler:
             value = self.pop_value(ir_typ=ty)
             self.emit(ir.Store(value, addr))
 
-        elif inst in ["f64.floor", "f32.floor"]:
-            self._runtime_call(inst)
-
-            # TODO: this does not work for all cases:
-            # ir_typ = self.get_ir_type(inst)
-            # value = self.pop_value(ir_typ)
-            # value = self.emit(ir.Cast(value, 'cast', ir.u64))
-            # value = self.emit(ir.Cast(value, 'cast', ir_typ))
-            # self.push_value(value)
-            # Someday we may have a Unary op for this,
-            # or a call into a native runtime lib?
-            # value = self.emit(
-            #     ir.Unop('floor', self.pop_value(ir_typ), 'floor', ir_typ))
-            # self.push_value(value)
-
         elif inst in ["f64.neg", "f32.neg"]:
             ir_typ = self.get_ir_type(inst)
             value = self.emit(
@@ -967,10 +903,46 @@ class WasmToIrCompiler:
             base = self.emit(ir.Cast(base, "cast", ir.ptr))
         offset = self.emit(ir.Const(offset, "offset", ir.ptr))
         address = self.emit(ir.add(base, offset, "address", ir.ptr))
-        mem0 = self.emit(ir.Load(self.memory_base_address, "mem0", ir.ptr))
+        mem0 = self.get_memory_base()
         address = self.emit(ir.add(mem0, address, "address", ir.ptr))
         return address
 
+    @staticmethod
+    def uses_memory(wasm_function):
+        """ Determine if a function loads or stores memory """
+        return any(
+            instruction.opcode in LOAD_OPS or instruction.opcode in STORE_OPS
+            for instruction in wasm_function.instructions
+        )
+
+    @staticmethod
+    def may_move_memory(wasm_function):
+        """ Determine if the memory can be moved during a function.
+
+        Growing the memory moves it, and so can every function call.
+        """
+        calls = {"call", "call_indirect", "memory.grow"}
+        return any(
+            instruction.opcode in calls
+            for instruction in wasm_function.instructions
+        )
+
+    def get_memory_base(self):
+        """ Get the memory base address.
+
+        The address is loaded in the entry block when the memory cannot
+        move during the function. Otherwise, it is loaded once per block,
+        and again after each call.
+        """
+        if not self.pinned_memory_base and (
+            self.memory_base is None
+            or self.memory_base.block is not self.builder.block
+        ):
+            self.memory_base = self.emit(
+                ir.Load(self.memory_base_address, "mem0", ir.ptr)
+            )
+        return self.memory_base
+
     @property
     def is_reachable(self):
         """ Determine if the current position is reachable """
@@ -1149,6 +1121,9 @@ class WasmToIrCompiler:
         else:
             self.emit(ir.ProcedureCall(target, args))
 
+        # The called function can grow, and thereby move, the memory:
+        self.memory_base = None
+
     def gen_select(self, instruction):
         """ Generate code for the select wasm instruction """
         # This is roughly equivalent to C-style: a ? b : c
@@ -1235,35 +1210,33 @@ class WasmToIrCompiler:
 
     def gen_br_table(self, instruction):
         """ Generate code for br_table instruction.
-        This is a sort of switch case.
-
-        This is called a jump table. Implement for now by chain of
-        if else.
+        This is a sort of switch case, which is implemented with a jump
+        table.
         """
-
-        # TODO: when ir supports jump table, use it!
         test_value = self.pop_value()
         assert test_value.ty in [ir.i32, ir.i64]
-        ir_typ = test_value.ty
-        option_labels = instruction.args[0]
-        default_label = option_labels.pop(-1)
-        for i, option_label in enumerate(option_labels):
-            # Figure which block we must jump to:
-            depth = option_label
-            target_block = self.do_jump(depth)
-            ja_block = target_block
-            nein_block = self.new_block()
-            c = self.emit(ir.Const(i, "label", ir_typ))
-            self.emit(ir.CJump(test_value, "==", c, ja_block, nein_block))
-            self.builder.set_block(nein_block)
-
-        # Determine default block:
-        depth = default_label
-        target_block = self.do_jump(depth)
-        default_block = target_block
-        self.emit(ir.Jump(default_block))
+        *option_labels, default_label = instruction.args[0]
+        table = [
+            (i, self.do_jump(depth)) for i, depth in enumerate(option_labels)
+        ]
+        default_block = self.do_jump(default_label)
+        if table:
+            self.emit(ir.JumpTable(test_value, table, default_block))
+        else:
+            self.emit(ir.Jump(default_block))
         self.builder.set_block(None)
 
+    def gen_intrinsic(self, inst):
+        """ Generate ir-code for an instruction without ir equivalent """
+        stack_in, _ = STACK_IO[inst]
+        args = [
+            self.pop_value(ir_typ=self.get_ir_type(t))
+            for t in reversed(stack_in)
+        ]
+        args.reverse()
+        value = self.intrinsics.generate(self.builder, inst, args)
+        self.push_value(value)
+
     def _runtime_call(self, inst):
         """ Generate runtime function call.
 
@@ -1306,6 +1279,9 @@ class WasmToIrCompiler:
             )
             self.push_value(value)
 
+        if inst == "memory.grow":
+            self.memory_base = None
+
 
 class BlockLevel:
     def __init__(self, typ, continue_block, inner_block, phi, stack_start):
@@ -1,8 +1,13 @@
 """ Test architecture related classes """
 
 
+import os
+import subprocess
+import sys
 import unittest
+import ppci
 from ppci.arch.stack import Frame, FramePointerLocation
+from ppci.arch.target_list import target_names, get_target_class
 
 
 class FrameTestCase(unittest.TestCase):
@@ -20,5 +25,23 @@ class FrameTestCase(unittest.TestCase):
         self.assertEqual(5, frame.stacksize)
 
 
+class TargetListTestCase(unittest.TestCase):
+    """ Test the list of targets """
+    def test_target_names(self):
+        for name in target_names:
+            self.assertEqual(name, get_target_class(name).name)
+
+    def test_lazy_import(self):
+        """ Check that listing the targets imports no architecture """
+        code = (
+            'import sys; import ppci.arch.target_list; '
+            'print(\'ppci.arch.arm\' in sys.modules)')
+        root = os.path.dirname(os.path.dirname(ppci.__file__))
+        env = dict(os.environ, PYTHONPATH=root)
+        output = subprocess.check_output(
+            [sys.executable, '-W', 'ignore', '-c', code], env=env)
+        self.assertEqual('False', output.decode().strip())
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -90,6 +90,12 @@ class Sse2TestCase(AsmTestCaseBase):
         self.feed('divsd xmm2, [r9]')
         self.check('f20f5ed9 f2410f5e11')
 
+    def test_sqrtsd(self):
+        """ Test square root of scalar float64 """
+        self.feed('sqrtsd xmm3, xmm1')
+        self.feed('sqrtsd xmm2, [r9]')
+        self.check('f20f51d9 f2410f5111')
+
     def test_cvtsd2si(self):
         """ Test convert scalar float64 to integer"""
         self.feed('cvtsd2si rbx, xmm1')
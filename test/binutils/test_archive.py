@@ -17,6 +17,48 @@ class ArchiveFileTestCase(unittest.TestCase):
         lib2 = get_archive(f2)
         self.assertTrue(lib2)
 
+    def test_binary_save_load(self):
+        """ Test the binary archive format """
+        arch = get_arch('msp430')
+        obj1 = ObjectFile(arch)
+        obj1.create_section('foo').add_data(bytes(range(10)))
+        obj1.add_symbol(0, 'syscall', 'global', 2, 'foo')
+        obj2 = ObjectFile(arch)
+        obj2.add_symbol(0, 'putc', 'global', None, None)
+        lib = archive([obj1, obj2])
+        f = io.BytesIO()
+        lib.save(f, fmt='binary')
+        f2 = io.BytesIO(f.getvalue())
+        lib2 = get_archive(f2)
+        self.assertEqual([obj1, obj2], list(lib2))
+        self.assertEqual({'syscall': 0}, lib2.symbol_index)
+
+    def test_symbol_index(self):
+        """ Test that the symbol index is saved, or created on load """
+        arch = get_arch('msp430')
+        obj1 = ObjectFile(arch)
+        obj1.create_section('foo')
+        obj1.add_symbol(0, 'putc', 'global', None, None)
+        obj1.add_symbol(1, 'puts', 'global', 0, 'foo')
+        obj2 = ObjectFile(arch)
+        obj2.create_section('foo')
+        obj2.add_symbol(0, 'putc', 'global', 0, 'foo')
+        obj2.add_symbol(1, 'helper', 'local', 0, 'foo')
+        lib = archive([obj1, obj2])
+        self.assertEqual({'puts': 0, 'putc': 1}, lib.symbol_index)
+        self.assertIs(obj2, lib.find_symbol('putc'))
+        self.assertIsNone(lib.find_symbol('helper'))
+
+        f = io.StringIO()
+        lib.save(f)
+        self.assertIn('"symbols"', f.getvalue())
+        lib2 = get_archive(io.StringIO(f.getvalue()))
+        self.assertEqual({'puts': 0, 'putc': 1}, lib2.symbol_index)
+
+        # Archives without index:
+        lib3 = get_archive(io.StringIO('{"objects": []}'))
+        self.assertEqual({}, lib3.symbol_index)
+
     def test_linking(self):
         """ Test pull in of undefined symbols from libraries. """
         arch = get_arch('msp430')
@@ -40,7 +82,18 @@ class ArchiveFileTestCase(unittest.TestCase):
         obj5.add_symbol(1, 'putc', 'global', None, None)  # undefined
         lib2 = archive([obj4, obj5])
 
-        obj = link([obj1], libraries=[lib1, lib2])
+        obj6 = ObjectFile(arch)
+        obj6.create_section('foo')
+        obj6.add_symbol(0, 'printf', 'global', None, None)  # undefined
+        obj6.add_symbol(1, 'exit', 'global', 0, 'foo')  # defined
+        lib3 = archive([obj6])
+
+        obj = link([obj1], libraries=[lib3, lib1, lib2])
+        for name in ['printf', 'putc', 'syscall']:
+            self.assertTrue(obj.get_symbol(name).defined)
+
+        # Objects which only refer to a symbol must not be linked in:
+        self.assertFalse(obj.has_symbol('exit'))
 
 
 if __name__ == '__main__':
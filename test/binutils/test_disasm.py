@@ -0,0 +1,97 @@
+import unittest
+import io
+
+from ppci.api import asm, cc, get_arch
+from ppci.arch.data_instructions import DByte
+from ppci.arch.target_list import target_names
+from ppci.binutils.disasm import Disassembler
+from ppci.binutils.outstream import FunctionOutputStream
+
+
+def disassemble(arch, data, address=0):
+    """ Disassemble data into a list of instructions """
+    instructions = []
+    disassembler = Disassembler(arch)
+    disassembler.disasm(
+        data, FunctionOutputStream(instructions.append), address=address)
+    return instructions
+
+
+class DisassemblerTestCase(unittest.TestCase):
+    samples = {
+        'avr': ['ldi r16, 5', 'add r16, r17', 'mov r1, r2', 'ret'],
+        'mcs6500': ['lda #5', 'sta 4660', 'nop'],
+        'microblaze': ['add R1, R2, R3', 'addi R4, R5, 100', 'rtsd R15, 8'],
+        'msp430': ['mov.w R4, R5', 'add.w #1, R6'],
+        'riscv': [
+            'add x1, x2, x3', 'sub x4, x5, x6', 'addi x1, x2, 5',
+            'addi x1, x2, -5', 'lw x5, 8(x2)', 'sw x5, -12(x8)'],
+        'xtensa': ['add a1, a2, a3', 'ret'],
+        'x86_64': [
+            'push rbp', 'mov rbp, rsp', 'mov rax, rbx', 'add rax, 1',
+            'mov rcx, [rbp, 8]', 'mov [rbp, -8], r9', 'mov rax, [rsp, 16]',
+            'sub rsp, 200', 'movsd xmm0, xmm1', 'pop rbp', 'ret'],
+        'arm': [
+            'mov R0, 5', 'mov R1, R2', 'add R0, R1, R2', 'sub SP, SP, 12',
+            'str R1, [R11, -4]', 'ldr R0, [R11, #8]', 'cmp R0, R1'],
+    }
+
+    def test_samples(self):
+        """ Test that assembled instructions are decoded again """
+        for arch_name, lines in self.samples.items():
+            with self.subTest(arch=arch_name):
+                arch = get_arch(arch_name)
+                obj = asm(io.StringIO('\n'.join(lines)), arch)
+                data = obj.get_section('code').data
+                instructions = disassemble(arch, data)
+                self.assertEqual(lines, [str(i) for i in instructions])
+
+    def test_addresses(self):
+        """ Test that instructions and bytes get their address """
+        arch = get_arch('xtensa')
+        data = bytes([0x30, 0x12, 0x80, 0xff])
+        instructions = disassemble(arch, data, address=0x100)
+        self.assertEqual('add a1, a2, a3', str(instructions[0]))
+        self.assertIsInstance(instructions[1], DByte)
+        self.assertEqual([0x100, 0x103], [i.address for i in instructions])
+
+    def test_compiled_code(self):
+        """ Test that most of the code of a compiler is decoded """
+        src = io.StringIO("""
+            int total;
+            int sum(int *values, int count) {
+                int result = 0;
+                for (int i = 0; i < count; i++) {
+                    result = result + values[i] * 3 - 1;
+                }
+                total = total + result;
+                return result;
+            }
+            """)
+        for arch_name in ['arm', 'riscv', 'x86_64']:
+            with self.subTest(arch=arch_name):
+                src.seek(0)
+                arch = get_arch(arch_name)
+                data = cc(src, arch).get_section('code').data
+                instructions = disassemble(arch, data)
+                self.assertEqual(
+                    data, b''.join(i.encode() for i in instructions))
+                # Branches to labels are left as bytes, among others:
+                decoded = [
+                    i for i in instructions if not isinstance(i, DByte)]
+                self.assertGreater(
+                    sum(len(i.encode()) for i in decoded), len(data) * 0.6)
+
+    def test_round_trip(self):
+        """ Test that disassembly of arbitrary data encodes to the data """
+        data = bytes((i * 73 + 41) % 256 for i in range(512))
+        for arch_name in target_names:
+            with self.subTest(arch=arch_name):
+                arch = get_arch(arch_name)
+                instructions = disassemble(arch, data)
+                self.assertEqual(
+                    data, b''.join(i.encode() for i in instructions))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,7 +9,8 @@ from ppci.codegen.irdag import SelectionGraphBuilder
 from ppci.codegen.irdag import FunctionInfo, prepare_function_info
 from ppci.arch.example import ExampleArch
 from ppci.binutils.debuginfo import DebugDb
-from ppci.api import get_arch
+from ppci.utils.workers import can_fork
+from ppci.api import get_arch, c_to_ir, ir_to_object
 
 
 def print_module(m):
@@ -189,5 +190,34 @@ class IrDagTestCase(unittest.TestCase):
         # self.assertTrue(sg_value.vreg)
 
 
+@unittest.skipUnless(can_fork(), 'requires forking of processes')
+class ParallelCodegenTestCase(unittest.TestCase):
+    """ Test generating functions in parallel """
+    src = """
+    int g[10];
+    int f(int a, int b) {
+      int i, s = 0;
+      for (i = 0; i < a; i++) { s += g[i] * b; if (s > 100) s -= 3; }
+      return s;
+    }
+    static int length(char *p) { int n = 0; while (*p++) n++; return n; }
+    int main() { return f(length("hello"), 2); }
+    """
+
+    def compile(self, march, jobs):
+        ir_module = c_to_ir(io.StringIO(self.src), march)
+        obj = ir_to_object([ir_module], march, debug=True, jobs=jobs)
+        f = io.StringIO()
+        obj.save(f)
+        return f.getvalue()
+
+    def test_same_as_serial(self):
+        """ Check that the object is identical to a serial compilation """
+        for march in ['arm', 'x86_64', 'riscv', 'msp430']:
+            with self.subTest(march=march):
+                self.assertEqual(
+                    self.compile(march, 1), self.compile(march, 3))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,13 @@
+import io
 import unittest
 from unittest.mock import MagicMock
 from ppci.codegen.registerallocator import GraphColoringRegisterAllocator
-from ppci.api import get_arch
+from ppci.codegen.flowgraph import FlowGraph
+from ppci.codegen.interferencegraph import InterferenceGraph
+from ppci.codegen import CodeGenerator
+from ppci.binutils.outstream import TextOutputStream
+from ppci.utils.reporting import DummyReportGenerator
+from ppci.api import get_arch, c_to_ir
 from ppci.arch.arch import Frame
 from ppci.arch.example import Def, Use, Add, Mov, R0, R1, ExampleRegister
 from ppci.arch.example import R10, R10l, DefHalf, UseHalf
@@ -151,5 +157,92 @@ class GraphColoringRegisterAllocatorTestCase(unittest.TestCase):
         # self.register_allocator.coalesc()
 
 
+SPILL_SRC = """
+int f(int *a, int n) {
+  int s0=a[0],s1=a[1],s2=a[2],s3=a[3],s4=a[4],s5=a[5],s6=a[6],s7=a[7];
+  int s8=a[8],s9=a[9],s10=a[10],s11=a[11],s12=a[12],s13=a[13],s14=a[14];
+  int i;
+  for (i=0;i<n;i++) {
+    switch (a[i]) {
+    case 1: s0 += s1*s2; break;
+    case 2: s3 += s4*s5 + s14; break;
+    case 3: s6 += s7*s8 - s13; break;
+    default: s9 += s10*s11 + s12; break;
+    }
+  }
+  return s0+s1+s2+s3+s4+s5+s6+s7+s8+s9+s10+s11+s12+s13+s14;
+}
+"""
+
+
+class CheckingRegisterAllocator(GraphColoringRegisterAllocator):
+    """ Check incremental updates against a full recalculation """
+    def update_data(self):
+        super().update_data()
+        self.updates += 1
+
+        def liveness(cfg):
+            return [
+                (set(cfg.get_registers(ins.live_in)),
+                 set(cfg.get_registers(ins.live_out)))
+                for ins in self.frame.instructions]
+
+        incremental_liveness = liveness(self.cfg)
+        incremental_ig = InterferenceGraph()
+        incremental_ig.add_table(self.interference)
+
+        cfg = FlowGraph(self.frame.instructions)
+        cfg.calculate_liveness()
+        ig = InterferenceGraph()
+        ig.calculate_interference(cfg)
+        assert incremental_liveness == liveness(cfg)
+
+        def edges(g):
+            return {
+                frozenset((t1, t2))
+                for n in g for (t1,) in [tuple(n.temps)]
+                for m in g.adjecent(n) for (t2,) in [tuple(m.temps)]
+            }
+
+        assert set(ig.temp_map) == set(incremental_ig.temp_map)
+        assert edges(ig) == edges(incremental_ig)
+        for tmp in ig.temp_map:
+            if tmp.is_colored:
+                # Usage of pre-colored registers is appended:
+                assert set(ig.defs(tmp)) == set(incremental_ig.defs(tmp))
+                assert set(ig.uses(tmp)) == set(incremental_ig.uses(tmp))
+            else:
+                assert ig.defs(tmp) == incremental_ig.defs(tmp)
+                assert ig.uses(tmp) == incremental_ig.uses(tmp)
+
+        # Restore liveness of the allocator:
+        self.cfg.update_liveness(0, list(self.cfg))
+
+
+class IncrementalSpillTestCase(unittest.TestCase):
+    """ Check that spilling updates liveness and interference correctly """
+    def check_arch(self, arch_name):
+        arch = get_arch(arch_name)
+        ir_module = c_to_ir(io.StringIO(SPILL_SRC), arch)
+        code_generator = CodeGenerator(arch)
+        register_allocator = CheckingRegisterAllocator(
+            arch, code_generator.instruction_selector)
+        register_allocator.updates = 0
+        code_generator.register_allocator = register_allocator
+        output_stream = TextOutputStream(f=io.StringIO())
+        code_generator.generate(
+            ir_module, output_stream, DummyReportGenerator())
+        self.assertGreater(register_allocator.updates, 0)
+
+    def test_x86_64(self):
+        self.check_arch('x86_64')
+
+    def test_arm(self):
+        self.check_arch('arm')
+
+    def test_msp430(self):
+        self.check_arch('msp430')
+
+
 if __name__ == '__main__':
     unittest.main()
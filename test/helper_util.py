@@ -222,6 +222,15 @@ def run_python(kernel):
     return outs
 
 
+def wasm_targets():
+    """ Get the targets on which wasm modules can be instantiated here """
+    from ppci.api import is_platform_supported
+    if is_platform_supported():
+        return ['python', 'native']
+    else:
+        return ['python']
+
+
 def run_nodejs(js_filename):
     """ Run given file in nodejs and capture output """
     proc = subprocess.Popen(
@@ -1,8 +1,13 @@
 import unittest
 import io
+import os
+import tempfile
 from unittest import mock
 from ppci.common import CompilerError
 from ppci.lang.c import CPreProcessor
+from ppci.lang.c.lexer import lex_text
+from ppci.lang.c.preprocessor import find_include_guard, header_cache
+from ppci.lang.c.preprocessor import include_cache
 from ppci.lang.c import COptions
 from ppci.lang.c import CTokenPrinter
 
@@ -514,5 +519,148 @@ class CPreProcessorTestCase(unittest.TestCase):
         self.preprocess(src, expected)
 
 
+class IncludeTestCase(unittest.TestCase):
+    """ Test the skipping and caching of included files """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.coptions = COptions()
+        self.coptions.add_include_path(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, filename, text):
+        path = os.path.join(self.directory.name, filename)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def preprocess(self, src, preprocessor=None):
+        """ Preprocess src, and return the text of the tokens """
+        if preprocessor is None:
+            preprocessor = CPreProcessor(self.coptions)
+        tokens = preprocessor.process_file(io.StringIO(src), "main.c")
+        return " ".join(
+            t.val for t in tokens if hasattr(t, "typ") and t.val.strip()
+        )
+
+    def count_loads(self, src):
+        """ Preprocess src, and count the headers which are loaded """
+        preprocessor = CPreProcessor(self.coptions)
+        with mock.patch.object(
+            preprocessor, "load_header", wraps=preprocessor.load_header
+        ) as load_header:
+            text = self.preprocess(src, preprocessor)
+        return text, load_header.call_count
+
+    def test_include_guard(self):
+        """ Test that a guarded header is not loaded again """
+        self.write("a.h", "// a\n#ifndef A_H\n#define A_H\nint a;\n#endif\n")
+        text, loads = self.count_loads(
+            '#include "a.h"\n#include <a.h>\n#undef A_H\n#include "a.h"\n'
+        )
+        self.assertEqual("int a ; int a ;", text)
+        self.assertEqual(2, loads)
+
+    def test_pragma_once(self):
+        """ Test that a header with #pragma once is not loaded again """
+        self.write("b.h", "#pragma once\nint b;\n")
+        text, loads = self.count_loads('#include "b.h"\n#include "b.h"\n')
+        self.assertEqual("int b ;", text)
+        self.assertEqual(1, loads)
+
+    def test_partial_guard(self):
+        """ Test that code outside the include guard is included again """
+        self.write("c.h", "#ifndef C_H\n#define C_H\n#endif\nint c;\n")
+        text, loads = self.count_loads('#include "c.h"\n#include "c.h"\n')
+        self.assertEqual("int c ; int c ;", text)
+        self.assertEqual(2, loads)
+
+    def test_find_include_guard(self):
+        """ Test which files are recognized as guarded """
+        cases = [
+            ("#ifndef X\n#define X\n#endif", "X"),
+            ("\n#ifndef X\n#if 1\n#endif\n#endif\n\n", "X"),
+            ("#ifndef X\n#else\n#endif", None),
+            ("#ifndef X Y\n#endif", None),
+            ("#ifdef X\n#endif", None),
+            ("int x;\n#ifndef X\n#endif", None),
+        ]
+        for src, guard in cases:
+            with self.subTest(src=src):
+                tokens = lex_text(src, self.coptions)
+                self.assertEqual(guard, find_include_guard(tokens))
+
+    def test_header_cache(self):
+        """ Test that headers are lexed again only when modified """
+        path = self.write("d.h", "int d;\n")
+        self.assertEqual("int d ;", self.preprocess('#include "d.h"\n'))
+        header = header_cache[(path, False, "c99")]
+        self.assertEqual("int d ;", self.preprocess('#include "d.h"\n'))
+        self.assertIs(header, header_cache[(path, False, "c99")])
+
+        self.write("d.h", "long d;\n")
+        os.utime(path, ns=(0, 0))
+        self.assertEqual("long d ;", self.preprocess('#include "d.h"\n'))
+
+    def test_header_cache_std(self):
+        """ Test that a header lexed for c99 is lexed again for c89 """
+        self.write("f.h", "#ifndef F_H\n#define F_H\n// f\nint f;\n#endif\n")
+        self.assertEqual("int f ;", self.preprocess('#include "f.h"\n'))
+        self.coptions.set("std", "c89")
+        with self.assertRaises(CompilerError):
+            self.preprocess('#include "f.h"\n')
+
+    def test_skipped_line_markers(self):
+        """ Test that skipped headers still give line markers """
+        self.write("g.h", "#ifndef G_H\n#define G_H\nint g;\n#endif\n")
+        self.write("h.h", "#pragma once\nint h;\n")
+        preprocessor = CPreProcessor(self.coptions)
+        src = '#include "g.h"\n#include "h.h"\n#include "g.h"\n'
+        src += '#include "h.h"\n'
+        tokens = preprocessor.process_file(io.StringIO(src), "main.c")
+        f = io.StringIO()
+        CTokenPrinter().dump(tokens, file=f)
+        lines = [line for line in f.getvalue().splitlines() if line]
+        g = os.path.join(self.directory.name, "g.h")
+        h = os.path.join(self.directory.name, "h.h")
+        self.assertEqual(
+            [
+                '# 1 "main.c"',
+                '# 1 "{}"'.format(g),
+                "int g;",
+                '# 2 "main.c" 2',
+                '# 1 "{}"'.format(h),
+                "int h;",
+                '# 3 "main.c" 2',
+                '# 1 "{}"'.format(g),
+                '# 4 "main.c" 2',
+                '# 1 "{}"'.format(h),
+                '# 5 "main.c" 2',
+            ],
+            lines,
+        )
+
+    def test_include_cache(self):
+        """ Test that includes are located again only after modifications """
+        other = os.path.join(self.directory.name, "other")
+        os.mkdir(other)
+        with open(os.path.join(other, "e.h"), "w") as f:
+            f.write("int e2;\n")
+        self.coptions.add_include_path(other)
+        src = "#include <e.h>\n"
+
+        with mock.patch.object(include_cache, "racy_time", 0):
+            self.assertEqual("int e2 ;", self.preprocess(src))
+            with mock.patch("os.listdir") as listdir:
+                self.assertEqual("int e2 ;", self.preprocess(src))
+            self.assertFalse(listdir.called)
+
+            self.write("e.h", "int e1;\n")
+            os.utime(self.directory.name, ns=(0, 0))
+            self.assertEqual("int e1 ;", self.preprocess(src))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -52,6 +52,38 @@ class CLexerTestCase(unittest.TestCase):
         self.assertSequenceEqual(["", " "], [t.space for t in tokens])
         self.assertSequenceEqual([True, False], [t.first for t in tokens])
 
+    def test_continued_line(self):
+        """ Test that tokens continue on the next line after a backslash """
+        src = "in\\\nt a = 1\\\n2;"
+        tokens = self.tokenize(src)
+        self.assertSequenceEqual(
+            ["int", "a", "=", "12", ";"], [t.val for t in tokens])
+        self.assertSequenceEqual([1, 2, 2, 2, 3], [t.loc.row for t in tokens])
+        self.assertSequenceEqual([1, 3, 5, 7, 2], [t.loc.col for t in tokens])
+
+    def test_multiline_tokens(self):
+        """ Test block comments and strings which span lines """
+        src = 'a /* x\n y */ b "c\nd" e'
+        tokens = self.tokenize(src)
+        self.assertSequenceEqual(
+            ["a", "b", '"c\nd"', "e"], [t.val for t in tokens])
+        self.assertSequenceEqual([1, 2, 2, 3], [t.loc.row for t in tokens])
+        self.assertSequenceEqual([1, 7, 9, 4], [t.loc.col for t in tokens])
+
+    def test_unterminated_comment(self):
+        """ Test that an unterminated block comment is an error """
+        with self.assertRaises(CompilerError) as cm:
+            self.tokenize("a /* b\n")
+        self.assertEqual(
+            "Expected a character, but at end of file", cm.exception.msg)
+
+    def test_invalid_escape(self):
+        """ Test that the location of an invalid escape is reported """
+        with self.assertRaises(CompilerError) as cm:
+            self.tokenize('a = "b\\d";')
+        self.assertEqual("Unexpected escape character", cm.exception.msg)
+        self.assertEqual(8, cm.exception.loc.col)
+
     def test_block_comment(self):
         """ Test block comments """
         src = "/* bla bla */"
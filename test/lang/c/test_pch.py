@@ -0,0 +1,104 @@
+import unittest
+import io
+import os
+import tempfile
+from ppci.api import get_arch
+from ppci.common import CompilerError
+from ppci.lang.c import CBuilder, COptions
+from ppci.lang.c.pch import create_pch, save_pch, load_pch
+from ppci.irutils import Verifier, Writer
+
+
+HEADER = """#ifndef LIB_H
+#define LIB_H
+typedef struct point { int x, y; } point_t;
+enum color { RED, GREEN = 5, BLUE };
+static int twice(int x) { return 2 * x; }
+extern int counter;
+#define SQUARE(x) ((x) * (x))
+#endif
+"""
+
+SOURCE = """#include "lib.h"
+int counter;
+int area(point_t *p) { return SQUARE(p->x) + twice(BLUE) + counter; }
+"""
+
+
+class PrecompiledHeaderTestCase(unittest.TestCase):
+    """ Test compilation with precompiled headers """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.header = self.path("lib.h")
+        self.write(self.header, HEADER)
+        self.arch = get_arch("arm")
+        self.coptions = COptions()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, filename):
+        return os.path.join(self.directory.name, filename)
+
+    def write(self, path, text):
+        with open(path, "w") as f:
+            f.write(text)
+
+    def create(self, arch=None):
+        """ Create a precompiled header of the header file """
+        arch = arch or self.arch
+        pch_filename = self.path("lib.pch")
+        with open(self.header, "r") as f:
+            pch = create_pch(f, self.header, arch.info, self.coptions)
+        with open(pch_filename, "wb") as f:
+            save_pch(pch, f)
+        return pch_filename
+
+    def compile(self, source=SOURCE, pch=None):
+        """ Compile a source next to the header into ir text """
+        self.coptions.set("pch", pch)
+        builder = CBuilder(self.arch.info, self.coptions)
+        ir_module = builder.build(io.StringIO(source), self.path("main.c"))
+        Verifier().verify(ir_module)
+        f = io.StringIO()
+        Writer(f).write(ir_module)
+        return f.getvalue()
+
+    def test_same_result(self):
+        """ Test that a precompiled header gives the same ir code """
+        pch_filename = self.create()
+        self.assertEqual(self.compile(), self.compile(pch=pch_filename))
+
+    def test_implicit_include(self):
+        """ Test that the header is available without including it """
+        pch_filename = self.create()
+        source = SOURCE.replace('#include "lib.h"', "")
+        self.assertEqual(self.compile(), self.compile(source, pch_filename))
+
+    def test_outdated(self):
+        """ Test that a modified header is included instead """
+        pch_filename = self.create()
+        self.write(self.header, HEADER.replace("BLUE }", "BLUE, BLACK }"))
+        os.utime(self.header, ns=(0, 0))
+        with self.assertLogs("pch", level="WARNING"):
+            ir_text = self.compile(
+                '#include "lib.h"\nint f() { return BLACK; }', pch_filename
+            )
+        self.assertIn("7", ir_text)
+
+    def test_other_target(self):
+        """ Test that a header of another target is not valid """
+        pch_filename = self.create(get_arch("avr"))
+        pch = load_pch(pch_filename)
+        self.assertFalse(pch.is_valid(self.coptions, self.arch.info))
+        self.assertTrue(pch.is_valid(self.coptions, get_arch("avr").info))
+
+    def test_invalid_file(self):
+        """ Test that a file which is no precompiled header is an error """
+        with self.assertRaises(CompilerError):
+            load_pch(self.header)
+
+
+if __name__ == "__main__":
+    unittest.main()
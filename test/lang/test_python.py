@@ -1,8 +1,9 @@
 import unittest
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 import io
 from ppci import api, irutils
-from ppci.lang.python import load_py, python_to_ir
+from ppci.lang.python import load_py, python_to_ir, ir_to_python
+from ppci.lang.python.ir2py import IrToPythonCompiler
 from ppci.utils.reporting import HtmlReportGenerator
 
 
@@ -93,5 +94,73 @@ class PythonToIrCompilerTestCase(unittest.TestCase):
         python_to_ir(io.StringIO(src3))
 
 
+c_src = """
+int collatz(int n) {
+    int steps = 0;
+    while (n != 1) {
+        if (n % 2 == 0) {
+            n = n / 2;
+        } else {
+            n = 3 * n + 1;
+        }
+        steps++;
+    }
+    return steps;
+}
+
+int find(int n) {
+    int i, j, last = 0;
+    for (i = 0; i < n; i++) {
+        for (j = 0; j < i; j++) {
+            if (i * j == 42) {
+                goto found;
+            }
+            last = j;
+        }
+    }
+    return -last;
+found:
+    return i * 100 + j + last;
+}
+"""
+
+
+class IrToPythonTestCase(unittest.TestCase):
+    """ Check the generation of python code from ir """
+    def compile(self, structured, opt_level):
+        ir_module = api.c_to_ir(io.StringIO(c_src), 'arm')
+        api.optimize(ir_module, level=opt_level)
+        f = io.StringIO()
+        with patch.object(IrToPythonCompiler, 'structured', structured):
+            ir_to_python([ir_module], f)
+        d = {}
+        exec(f.getvalue(), d)
+        return f.getvalue(), d
+
+    def check(self, d):
+        self.assertEqual(0, d['collatz'](1))
+        self.assertEqual(111, d['collatz'](27))
+        self.assertEqual(-3, d['find'](5))
+        self.assertEqual(711, d['find'](10))
+        self.assertEqual(0, len(d['stack']))
+
+    def test_structured(self):
+        for opt_level in [0, 2]:
+            with self.subTest(opt_level=opt_level):
+                source, d = self.compile(True, opt_level)
+                collatz = source[source.index('def collatz'):]
+                collatz = collatz[:collatz.index('func_pointers')]
+                self.assertNotIn('current_block', collatz)
+                self.assertIn('while True:', collatz)
+                self.check(d)
+
+    def test_block_dispatch(self):
+        for opt_level in [0, 2]:
+            with self.subTest(opt_level=opt_level):
+                source, d = self.compile(False, opt_level)
+                self.assertIn('current_block', source)
+                self.check(d)
+
+
 if __name__ == '__main__':
     unittest.main()
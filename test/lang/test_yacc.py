@@ -12,6 +12,7 @@ from ppci.common import CompilerError
 from ppci.lang.common import Token, SourceLocation
 from ppci.lang.tools.lr import LrParserBuilder
 from ppci.lang.tools.earley import EarleyParser
+from ppci.lang.tools.topdown import TopDownParser, UnsupportedGrammar
 from ppci.lang.tools.baselex import EOF
 
 
@@ -404,6 +405,98 @@ class EarleyParserTestCase(unittest.TestCase):
         p.parse(tokens, debug_dump=True)
 
 
+def token_list(lst):
+    """ Create a list of tokens from a list of strings """
+    tokens = gen_tokens(lst)
+    return [tokens.next_token() for _ in lst]
+
+
+class TopDownParserTestCase(unittest.TestCase):
+    def test_expression_grammar(self):
+        """ Test left recursive rules """
+        grammar = Grammar()
+        grammar.add_terminals(['(', ')', '+', '*', 'num'])
+        grammar.add_production(
+            'expression', ['term'], lambda rhs: rhs)
+        grammar.add_production(
+            'expression', ['expression', '+', 'term'],
+            lambda rh1, rh2, rh3: rh1 + rh3)
+        grammar.add_production('term', ['factor'], lambda rhs: rhs)
+        grammar.add_production(
+            'term', ['term', '*', 'factor'], lambda rh1, rh2, rh3: rh1 * rh3)
+        grammar.add_production(
+            'factor', ['(', 'expression', ')'], lambda rh1, rh2, rh3: rh2)
+        grammar.add_production('factor', ['num'], lambda rhs: rhs.val)
+        grammar.start_symbol = 'expression'
+        parser = TopDownParser(grammar)
+        result = parser.parse(token_list(
+            [('num', 7), '*', ('num', 11), '+', ('num', 3)]))
+        self.assertEqual(80, result)
+        result = parser.parse(token_list(
+            [('num', 7), '*', '(', ('num', 11), '+', ('num', 3), ')']))
+        self.assertEqual(98, result)
+
+    def test_ambiguous_grammar(self):
+        """ Test that the rule with the lowest priority is chosen """
+        grammar = Grammar()
+        grammar.add_terminals(['mov', 'num', '+'])
+        grammar.add_production(
+            'expr', ['num', '+', 'num'],
+            lambda rh1, _, rh3: rh1.val + rh3.val,
+            priority=3)
+        grammar.add_production(
+            'expr', ['num', '+', 'num'],
+            lambda rh1, _, rh3: rh1.val + rh3.val + 1,
+            priority=2)
+        grammar.add_production(
+            'expr', ['num', '+', 'num'],
+            lambda rh1, _, rh3: rh1.val + rh3.val + 2,
+            priority=2)
+        grammar.add_production(
+            'ins', ['mov', 'expr'],
+            lambda _, rh2: rh2,
+            priority=2)
+        grammar.start_symbol = 'ins'
+        parser = TopDownParser(grammar)
+        result = parser.parse(
+            token_list(['mov', ('num', 1), '+', ('num', 1)]))
+        self.assertEqual(3, result)
+
+    def test_empty(self):
+        """ Test rules which produce nothing """
+        grammar = Grammar()
+        grammar.add_terminals(['a', 'b'])
+        grammar.add_production('goal', ['opt', 'b'], lambda o, b: o)
+        grammar.add_production('opt', [], lambda: 0)
+        grammar.add_production('opt', ['a'], lambda a: 1)
+        grammar.start_symbol = 'goal'
+        parser = TopDownParser(grammar)
+        self.assertEqual(0, parser.parse(token_list(['b'])))
+        self.assertEqual(1, parser.parse(token_list(['a', 'b'])))
+
+    def test_invalid_parse(self):
+        """ Check that invalid input is reported """
+        grammar = Grammar()
+        grammar.add_terminals(['a', 'b', 'c'])
+        grammar.add_production('goal', ['a', 'c', 'b'])
+        grammar.start_symbol = 'goal'
+        parser = TopDownParser(grammar)
+        with self.assertRaises(CompilerError):
+            parser.parse(token_list(['a', 'c']))
+
+    def test_indirect_left_recursion(self):
+        """ Indirect left recursion is not supported """
+        grammar = Grammar()
+        grammar.add_terminals(['a', 'b'])
+        grammar.add_production('goal', ['other', 'a'])
+        grammar.add_production('goal', ['b'])
+        grammar.add_production('other', ['goal'])
+        grammar.start_symbol = 'goal'
+        parser = TopDownParser(grammar)
+        with self.assertRaises(UnsupportedGrammar):
+            parser.parse(token_list(['b', 'a']))
+
+
 class GrammarParserTestCase(unittest.TestCase):
     def test_load_as_module(self):
         grammar = """